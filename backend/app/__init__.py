@@ -1,48 +1,210 @@
+import logging
+import os
 from flask import Flask, jsonify
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from flask_socketio import SocketIO
 
+try:
+    from dotenv import load_dotenv
+    load_dotenv()  # pick up a local .env (Twilio credentials etc.) if python-dotenv is installed
+except ImportError:
+    pass
+
 jwt = JWTManager()
 socketio = SocketIO(cors_allowed_origins="*", async_mode="eventlet")
+logger = logging.getLogger(__name__)
 
 def create_app():
-    print("[App] Creating Flask app")
     app = Flask(__name__)
 
+    # Logging: global level, per-logger overrides ("app.database=WARNING,..."),
+    # the share of per-message lines kept, and a per-call-site rate limit
+    app.config["LOG_LEVEL"] = os.getenv("EIREM_LOG_LEVEL", "INFO")
+    app.config["LOG_LEVELS"] = os.getenv("EIREM_LOG_LEVELS", "")
+    app.config["LOG_SAMPLE_RATE"] = float(os.getenv("EIREM_LOG_SAMPLE_RATE", "0.01"))
+    app.config["LOG_RATE_LIMIT_BURST"] = 20
+    app.config["LOG_RATE_LIMIT_INTERVAL"] = 10
+    app.config["LOG_QUEUE_SIZE"] = 10000
+    app.config["LOG_MAX_LENGTH"] = 2000
+
+    from app import log
+    log_handler = log.init_app(app)
+
+    # /metrics, plus a watchdog that logs the stack of any greenlet
+    # holding the eventlet hub for longer than the threshold
+    app.config["METRICS_ENABLED"] = os.getenv("EIREM_METRICS", "1") != "0"
+    app.config["METRICS_HUB_LAG_INTERVAL_MS"] = 50
+    app.config["METRICS_HUB_LAG_THRESHOLD_MS"] = 100
+
     # JWT Configurations
     app.config['JWT_SECRET_KEY'] = 'your_jwt_secret_key'
     app.config["JWT_TOKEN_LOCATION"] = ["headers"]
     app.config["JWT_HEADER_NAME"] = "Authorization"
     app.config["JWT_HEADER_TYPE"] = "Bearer"
 
+    # Message persistence: batch window, batch size and backpressure bound
+    app.config["MESSAGE_BATCH_INTERVAL_MS"] = 20
+    app.config["MESSAGE_BATCH_SIZE"] = 200
+    app.config["MESSAGE_QUEUE_SIZE"] = 10000
+    app.config["MESSAGE_QUEUE_TIMEOUT"] = 0.5
+
+    # How long trickled ICE candidates are held to be relayed as one event
+    app.config["ICE_BATCH_WINDOW_MS"] = 20
+
+    # Opt-in binary Socket.IO payloads (clients connect with codec=msgpack):
+    # payloads packing to at least the threshold go out as compressed MessagePack
+    app.config["SOCKETIO_BINARY_CODEC"] = os.getenv("EIREM_SOCKETIO_BINARY", "1") != "0"
+    app.config["SOCKETIO_BINARY_THRESHOLD"] = 1024
+    app.config["SOCKETIO_COMPRESSION_LEVEL"] = 6
+
+    # Message archiving: delivered messages older than ARCHIVE_AFTER_DAYS move
+    # to one SQLite file per month under ARCHIVE_DIR (default: archive/ next to
+    # the database) every ARCHIVE_INTERVAL seconds (0 = only via `flask messages archive`)
+    app.config["ARCHIVE_DIR"] = os.getenv("EIREM_ARCHIVE_DIR")
+    app.config["ARCHIVE_AFTER_DAYS"] = int(os.getenv("EIREM_ARCHIVE_AFTER_DAYS", "90"))
+    app.config["ARCHIVE_INTERVAL"] = int(os.getenv("EIREM_ARCHIVE_INTERVAL", "3600"))
+    app.config["ARCHIVE_BATCH_SIZE"] = 1000
+    app.config["ARCHIVE_BATCH_PAUSE"] = 0.05
+    app.config["ARCHIVE_COMPACT_PAGES"] = 256
+
+    # File attachments: uploaded in ATTACHMENT_CHUNK_SIZE chunks and stored once
+    # per content hash under ATTACHMENT_DIR (default: attachments/ next to the
+    # database). Incomplete uploads are dropped after ATTACHMENT_UPLOAD_TTL
+    # seconds. With ATTACHMENT_ACCEL_REDIRECT (an internal nginx location
+    # aliased to ATTACHMENT_DIR/blobs) downloads are handed to nginx
+    app.config["ATTACHMENT_DIR"] = os.getenv("EIREM_ATTACHMENT_DIR")
+    app.config["ATTACHMENT_CHUNK_SIZE"] = 256 * 1024
+    app.config["ATTACHMENT_MAX_SIZE"] = int(os.getenv("EIREM_ATTACHMENT_MAX_SIZE", str(100 * 1024 * 1024)))
+    app.config["ATTACHMENT_UPLOAD_TTL"] = 86400
+    app.config["ATTACHMENT_ACCEL_REDIRECT"] = os.getenv("EIREM_ATTACHMENT_ACCEL_REDIRECT")
+
+    # Per-user token buckets for Socket.IO events, as {event: (per second, burst)}
+    # overrides of app.chat.ratelimit.DEFAULT_LIMITS, and the most packets a
+    # session may have waiting to be sent before it is dropped
+    app.config["SOCKETIO_RATE_LIMITS_ENABLED"] = os.getenv("EIREM_SOCKETIO_RATE_LIMITS", "1") != "0"
+    app.config["SOCKETIO_RATE_LIMITS"] = {}
+    app.config["SOCKETIO_RATE_LIMIT_SWEEP"] = 60
+    app.config["SOCKETIO_SEND_BUFFER"] = 1000
+
+    # Cross-worker message queue, e.g. sqlite:///eirem-bus.db or redis://localhost:6379/0
+    app.config["SOCKETIO_MESSAGE_QUEUE"] = os.getenv("EIREM_MESSAGE_QUEUE")
+
+    # ETags and cached bodies for the polled GET endpoints. Versions are
+    # per process, so this is off when several workers share a message queue
+    app.config["RESPONSE_CACHE_ENABLED"] = not app.config["SOCKETIO_MESSAGE_QUEUE"]
+    app.config["RESPONSE_CACHE_SIZE"] = 10000
+    app.config["RESPONSE_CACHE_TTL"] = 3600
+    app.config["RESPONSE_CACHE_VERSIONS"] = 100000
+
+    # Password hashing: werkzeug method spec (e.g. "scrypt", "scrypt:65536:8:1",
+    # "pbkdf2:sha256:1000000") and how many hashes may run at once off the hub.
+    # Stored hashes made with other parameters are upgraded on the next login.
+    app.config["PASSWORD_HASH_METHOD"] = os.getenv("EIREM_PASSWORD_HASH", "scrypt")
+    app.config["PASSWORD_HASH_WORKERS"] = int(os.getenv("EIREM_PASSWORD_HASH_WORKERS", "4"))
+
+    # Twilio Video. TWILIO_VIDEO_API_URL can point at a local stand-in
+    app.config["TWILIO_ACCOUNT_SID"] = os.getenv("TWILIO_ACCOUNT_SID")
+    app.config["TWILIO_API_KEY_SID"] = os.getenv("TWILIO_API_KEY_SID")
+    app.config["TWILIO_API_KEY_SECRET"] = os.getenv("TWILIO_API_KEY_SECRET")
+    app.config["TWILIO_VIDEO_API_URL"] = os.getenv("TWILIO_VIDEO_API_URL", "https://video.twilio.com")
+    app.config["TWILIO_ROOM_TYPE"] = "peer-to-peer"
+    app.config["TWILIO_CONNECT_TIMEOUT"] = 3.05
+    app.config["TWILIO_READ_TIMEOUT"] = 10
+    app.config["TWILIO_POOL_SIZE"] = 10
+    app.config["TWILIO_TOKEN_TTL"] = 3600
+    app.config["TWILIO_ROOM_CACHE_TTL"] = 5
+
     # CORS Configuration
     CORS(app, supports_credentials=True, allow_headers=["Content-Type", "Authorization"])
 
+    # Create tables and apply pending migrations
+    from app.database import init_db, register_commands
+    init_db()
+    register_commands(app)
+
     # Initialize JWT
     jwt.init_app(app)
 
     # Optional: Improve error visibility for debugging
     @jwt.unauthorized_loader
     def unauthorized_response(callback):
-        print("[JWT] Missing or invalid token")
+        logger.info("Missing or invalid JWT: %s", callback)
         return jsonify({"msg": "Missing or invalid JWT"}), 401
 
     @jwt.invalid_token_loader
     def invalid_token_callback(err):
-        print("[JWT] Invalid token:", err)
+        logger.info("Invalid JWT: %s", err)
         return jsonify({"msg": "Invalid JWT"}), 422
 
+    from app.auth.passwords import hasher
+    hasher.init_app(app)
+
+    from app.http_cache import response_cache
+    response_cache.init_app(app)
+
     # Register Blueprints
     from app.auth.routes import auth_bp
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
+    from app.chat.routes import chat_bp
+    app.register_blueprint(chat_bp, url_prefix='/api/chat')
+
+    # Init SocketIO; with a message queue several workers share rooms and presence
+    queue_url = app.config["SOCKETIO_MESSAGE_QUEUE"]
+    if queue_url:
+        from app.chat.broker import client_manager_for
+        socketio.init_app(app, client_manager=client_manager_for(queue_url))
+    else:
+        socketio.init_app(app)
 
-    # Init SocketIO
-    socketio.init_app(app)
+    from app.chat.presence import presence
+    presence.init_app(app, socketio)
+
+    from app.chat.codec import codec
+    codec.init_app(app, socketio)
 
     # Register socket handlers
     from app.chat.socket import register_socketio_events
     register_socketio_events(socketio)
 
-    print("[APP] app created, blueprints registered, socket events ready")
+    # Start the batched message writer
+    from app.chat.persistence import message_writer
+    message_writer.init_app(app, socketio)
+
+    from app.chat.archive import message_archive
+    message_archive.init_app(app, socketio)
+
+    from app.chat.attachments import attachment_store
+    attachment_store.init_app(app, socketio)
+
+    from app.video.signaling import candidate_batcher
+    candidate_batcher.init_app(app, socketio)
+
+    from app.video.twilio import video_service
+    video_service.init_app(app)
+
+    from app.database import pool
+    from app.metrics import metrics
+    metrics.init_app(app, socketio)
+    metrics.instrument_socketio(socketio)
+
+    # Outermost, so throttled events cost as little as possible
+    from app.chat.ratelimit import rate_limiter
+    rate_limiter.init_app(app, socketio)
+    rate_limiter.protect(socketio)
+
+    metrics.gauge("eirem_socketio_sessions", "Socket.IO sessions on this worker", presence.session_count)
+    metrics.gauge("eirem_online_users", "Users with a session on this worker", presence.user_count)
+    metrics.gauge("eirem_db_pool_connections", "Pooled SQLite connections by state",
+                  lambda: {("idle",): pool.stats()["idle"], ("in_use",): pool.stats()["in_use"]}, ("state",))
+    metrics.gauge("eirem_message_queue_depth", "Messages waiting for the batch writer", message_writer.qsize)
+    metrics.gauge("eirem_ice_candidates_pending", "ICE candidates waiting to be relayed",
+                  candidate_batcher.pending_count)
+    metrics.gauge("eirem_rate_limit_buckets", "Socket.IO rate limit buckets held in memory",
+                  rate_limiter.bucket_count)
+    metrics.gauge("eirem_log_queue_depth", "Log records waiting to be written", log_handler.qsize)
+    metrics.gauge("eirem_log_records_dropped_total", "Log records dropped on a full queue",
+                  lambda: log_handler.dropped, type="counter")
+
+    logger.info("App created, blueprints registered, socket events ready")
     return app
@@ -0,0 +1,99 @@
+from flask_jwt_extended import get_jwt, get_jwt_identity
+
+from app.database import db_connection
+from app.utils import TTLCache
+
+USER_CACHE_SIZE = 10000
+USER_CACHE_TTL = 300
+
+_users = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)        # id -> profile
+_ids_by_email = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)  # email -> id
+
+# Adjacency cache, id -> frozenset of friend ids. Other workers only see
+# a new friendship once their entry expires, so keep the TTL short.
+FRIENDS_CACHE_TTL = 60
+_friends = TTLCache(maxsize=USER_CACHE_SIZE, ttl=FRIENDS_CACHE_TTL)
+
+
+def get_user(user_id):
+    """Return {id, name, email} for a user, or None if there is no such user."""
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+
+    user = _users.get(user_id)
+    if user is None:
+        with db_connection() as conn:
+            row = conn.execute("SELECT id, name, email FROM users WHERE id = ?", (user_id,)).fetchone()
+        if row is None:
+            return None
+        user = {"id": row["id"], "name": row["name"], "email": row["email"]}
+        _users.set(user_id, user)
+        _ids_by_email.set(user["email"], user_id)
+    return user
+
+
+def get_user_id_by_email(email):
+    user_id = _ids_by_email.get(email)
+    if user_id is None:
+        with db_connection() as conn:
+            row = conn.execute("SELECT id FROM users WHERE email = ?", (email,)).fetchone()
+        if row is None:
+            return None
+        user_id = row["id"]
+        _ids_by_email.set(email, user_id)
+    return user_id
+
+
+def invalidate_user(user_id=None, email=None):
+    """Drop cached entries after a write to the users table."""
+    if user_id is not None:
+        user = _users.pop(int(user_id))
+        if user is not None:
+            _ids_by_email.pop(user["email"])
+    if email is not None:
+        _ids_by_email.pop(email)
+
+
+def get_current_user_id():
+    """
+    Return the id of the user making the request.
+
+    Tokens minted by login() carry it as the `uid` claim; older tokens
+    only carry the email and fall back to a (cached) lookup.
+    """
+    uid = get_jwt().get("uid")
+    if uid is not None:
+        return uid
+    return get_user_id_by_email(get_jwt_identity())
+
+
+def get_friend_ids(user_id):
+    """Return the (cached) set of ids of `user_id`'s friends."""
+    user_id = int(user_id)
+    friend_ids = _friends.get(user_id)
+    if friend_ids is None:
+        with db_connection() as conn:
+            rows = conn.execute("SELECT friend_id FROM friendships WHERE user_id = ?", (user_id,)).fetchall()
+        friend_ids = frozenset(row["friend_id"] for row in rows)
+        _friends.set(user_id, friend_ids)
+    return friend_ids
+
+
+def add_friendship(conn, user_id, friend_id):
+    """Record a friendship in both directions on `conn`'s open transaction."""
+    add_friendships(conn, [(user_id, friend_id)])
+
+
+def add_friendships(conn, pairs):
+    """Record each (user_id, friend_id) friendship in both directions."""
+    conn.executemany(
+        "INSERT OR IGNORE INTO friendships (user_id, friend_id) VALUES (?, ?)",
+        [edge for user_id, friend_id in pairs for edge in ((user_id, friend_id), (friend_id, user_id))]
+    )
+
+
+def invalidate_friends(*user_ids):
+    for user_id in user_ids:
+        _friends.pop(int(user_id))
@@ -0,0 +1,64 @@
+import time
+
+from eventlet import semaphore, tpool
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from app.metrics import metrics
+
+hash_duration = metrics.histogram(
+    "eirem_password_hash_seconds", "Password hashing time on the worker threads", ("operation",))
+
+
+def _method_of(password_hash):
+    """'scrypt:32768:8:1$salt$hash' -> 'scrypt:32768:8:1'"""
+    return password_hash.split("$", 1)[0]
+
+
+class PasswordHasher:
+    """
+    Runs werkzeug's (deliberately slow) password hashing on eventlet's OS
+    thread pool instead of the hub, so a burst of logins doesn't stall
+    every socket on the worker. hashlib releases the GIL while hashing, so
+    the threads hash in parallel too.
+
+    At most `workers` hashes are in flight; further callers wait on a
+    semaphore (which yields to the hub) rather than piling up in tpool.
+    """
+
+    def __init__(self, method="scrypt", workers=4):
+        self.method = method
+        self._canonical_method = None
+        self._slots = semaphore.Semaphore(workers)
+
+    def init_app(self, app):
+        self.method = app.config["PASSWORD_HASH_METHOD"]
+        self._canonical_method = None
+        self._slots = semaphore.Semaphore(app.config["PASSWORD_HASH_WORKERS"])
+
+    @property
+    def canonical_method(self):
+        """The configured method with werkzeug's defaults filled in, e.g. 'scrypt:32768:8:1'."""
+        if self._canonical_method is None:
+            self._canonical_method = _method_of(self.hash(""))
+        return self._canonical_method
+
+    def _run(self, operation, func, *args):
+        with self._slots:
+            started = time.perf_counter()
+            try:
+                return tpool.execute(func, *args)
+            finally:
+                hash_duration.observe(time.perf_counter() - started, (operation,))
+
+    def hash(self, password):
+        return self._run("hash", generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run("verify", check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True if `password_hash` was made with other parameters than the configured ones."""
+        return _method_of(password_hash) != self.canonical_method
+
+
+hasher = PasswordHasher()
@@ -1,11 +1,34 @@
-from flask import Blueprint, request, jsonify
-from werkzeug.security import generate_password_hash, check_password_hash 
+import itertools
+import json
+import logging
+import re
+from contextlib import closing
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
-from app.database import get_db_connection
+from app.auth.passwords import hasher
+from app.chat.archive import message_archive
+from app.database import db_connection
+from app.http_cache import FRIENDS, REQUESTS, USERS, conversation, response_cache
+from app.log import Redacted
+from app.auth.models import (
+    add_friendship, add_friendships, get_current_user_id, get_friend_ids, invalidate_friends, invalidate_user
+)
 from datetime import timedelta
 
 
 auth_bp = Blueprint('auth', __name__,url_prefix='/api/auth') 
+logger = logging.getLogger(__name__)
+
+HISTORY_PAGE_SIZE = 50
+USERS_PAGE_SIZE = 50
+USERS_MAX_PAGE_SIZE = 200
+MAX_SEARCH_TERMS = 8
+HISTORY_MAX_PAGE_SIZE = 200
+NDJSON_PAGE_SIZE = 500  # rows read per connection checkout when streaming
+FRIEND_BATCH_MAX = 1000
+
+def _optional_int(value):
+    return int(value) if value is not None else None
 
 @auth_bp.route('/register', methods=['POST'])
 def register():
@@ -13,34 +36,33 @@ def register():
     Register a new user.
     """
     data = request.json
-    print(f"[Auth] Registering user :{data}")
+    logger.debug("Registering user %s", Redacted(data))
     name = data.get('name')
     email = data.get('email')
     password = data.get('password')
 
     if not name or not email or not password:
         return jsonify({"success": False, "message": "Name, email and password required."}), 400 
-    hashed_password = generate_password_hash(password)
+    hashed_password = hasher.hash(password)
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO users (name, email, password) VALUES (?, ?, ?)",
-            (name, email, hashed_password)
-        )
-        conn.commit()
-        conn.close() 
-
-        print("[Auth] User registered successfully")
+        with db_connection() as conn:
+            conn.execute(
+                "INSERT INTO users (name, email, password) VALUES (?, ?, ?)",
+                (name, email, hashed_password)
+            )
+        invalidate_user(email=email)
+        response_cache.bump(USERS)
+
+        logger.info("User %s registered", email)
         return jsonify({"success": True, "message": "User registered successfully."}), 201 
     except Exception as e:
-        print("[Auth] Error registering user:", e)
+        logger.warning("Error registering user %s: %s", email, e)
         return jsonify({"success": False, "message": "Error registering user."}), 400 
 
 @auth_bp.route('/login', methods=['POST'])
 def login():
     data = request.json
-    print(f"[Auth] Logging in user :{data}")
+    logger.debug("Logging in user %s", Redacted(data))
     email = data.get('email')
     password = data.get('password')
 
@@ -48,19 +70,26 @@ def login():
         return jsonify({"success": False, "message": "Email and password required."}), 400 
 
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM users WHERE email = ?", (email,))
-        user = cursor.fetchone()
-
-        if user and check_password_hash(user['password'], password):
-            # Create token with just email as identity
+        with db_connection() as conn:
+            user = conn.execute("SELECT * FROM users WHERE email = ?", (email,)).fetchone()
+
+        if user and hasher.verify(user['password'], password):
+            if hasher.needs_rehash(user['password']):
+                # Upgrade to the current work factor while we have the plaintext
+                rehashed = hasher.hash(password)
+                with db_connection() as conn:
+                    conn.execute("UPDATE users SET password = ? WHERE id = ?", (rehashed, user["id"]))
+                logger.info("Rehashed password of user %s with %s", user["id"], hasher.method)
+
+            # Email stays the identity; the id rides along so routes
+            # never have to look it up again
             access_token = create_access_token(
                 identity=user["email"],
+                additional_claims={"uid": user["id"]},
                 expires_delta=timedelta(hours=24)
             )
 
-            print("[Auth] User logged in successfully")
+            logger.info("User %s logged in", user["id"])
             return jsonify({
                 "success": True,
                 "token": access_token,
@@ -71,10 +100,10 @@ def login():
                 }
             }), 200 
         else:
-            print("[Auth] Invalid credentials")
+            logger.info("Invalid credentials for %s", email)
             return jsonify({"success": False, "message": "Invalid credentials."}), 401
-    except Exception as e:
-        print("[Auth] Error logging in user:", e)
+    except Exception:
+        logger.exception("Error logging in user")
         return jsonify({"success": False, "message": "Error logging in user."}), 500 
 
 
@@ -85,48 +114,54 @@ def logout():
     """
     Logout the user.
     """
-    print("[Auth] Logging out user")
     user = get_jwt_identity()
-    print(f"[Auth] User {user} logged out")
+    logger.info("User %s logged out", user)
     return jsonify({"success": True, "message": "User logged out successfully."}), 200 
 
 
 @auth_bp.route('/users', methods=['GET'])
 @jwt_required()
+@response_cache.cached(lambda me: [USERS, (FRIENDS, me)])
 def get_all_users():
     """
-    Get all users except the current one, and include friendship status.
+    Page through users other than the current one, with friendship status.
+
+    Query params: `q` (prefix search over name and email words), `limit`
+    (default 50) and `cursor` (the `next_cursor` of the previous page).
     """
-    print("[Auth] Getting all users")
     try:
-        current_email = get_jwt_identity()
-
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        limit = min(int(request.args.get('limit', USERS_PAGE_SIZE)), USERS_MAX_PAGE_SIZE)
+        cursor_id = int(request.args.get('cursor', 0))
+    except ValueError:
+        return jsonify({"success": False, "message": "Invalid limit or cursor"}), 400
+    if limit <= 0:
+        return jsonify({"success": False, "message": "Invalid limit"}), 400
+    match = _prefix_match_query(request.args.get('q', ''))
 
-        cursor.execute("SELECT id FROM users WHERE email = ?", (current_email,))
-        current_user = cursor.fetchone()
-        if not current_user:
+    try:
+        current_user_id = get_current_user_id()
+        if current_user_id is None:
             return jsonify({"success": False, "message": "User not found"}), 404
 
-        current_user_id = current_user["id"]
-
-        cursor.execute('''
-            SELECT u.id
-            FROM friend_requests fr
-            JOIN users u ON 
-                (fr.from_user_id = u.id AND fr.to_user_id = ?)
-                OR (fr.to_user_id = u.id AND fr.from_user_id = ?)
-            WHERE fr.status = 'accepted'
-        ''', (current_user_id, current_user_id))
-        friend_rows = cursor.fetchall()
-        friend_ids = {row['id'] for row in friend_rows}
-
-        # Get all users excluding self
-        cursor.execute("SELECT id, name, email FROM users WHERE id != ?", (current_user_id,))
-        users = cursor.fetchall()
-        conn.close()
-
+        with db_connection() as conn:
+            if match:
+                # The FTS index yields matches in rowid order, so the cursor is a rowid bound
+                users = conn.execute('''
+                    SELECT u.id, u.name, u.email
+                    FROM users_fts
+                    JOIN users u ON u.id = users_fts.rowid
+                    WHERE users_fts MATCH ? AND users_fts.rowid > ? AND u.id != ?
+                    ORDER BY users_fts.rowid
+                    LIMIT ?
+                ''', (match, cursor_id, current_user_id, limit)).fetchall()
+            else:
+                users = conn.execute(
+                    "SELECT id, name, email FROM users WHERE id > ? AND id != ? ORDER BY id LIMIT ?",
+                    (cursor_id, current_user_id, limit)
+                ).fetchall()
+
+        # Only the returned page needs friendship status
+        friend_ids = get_friend_ids(current_user_id)
         user_list = []
         for user in users:
             user_list.append({
@@ -136,13 +171,20 @@ def get_all_users():
                 'isFriend': user['id'] in friend_ids
             })
 
-        return jsonify({'success': True, 'users': user_list})
+        next_cursor = user_list[-1]['id'] if len(user_list) == limit else None
+        return jsonify({'success': True, 'users': user_list, 'next_cursor': next_cursor})
 
-    except Exception as e:
-        print("[Auth] Error getting users:", e)
+    except Exception:
+        logger.exception("Error getting users")
         return jsonify({"success": False, "message": "Error getting users."}), 500
 
 
+def _prefix_match_query(text):
+    """Turn free text into an FTS5 query matching every word as a prefix."""
+    words = re.findall(r'\w+', text.lower())
+    return ' '.join(f'"{word}"*' for word in words[:MAX_SEARCH_TERMS])
+
+
 
 @auth_bp.route('/friend-request', methods=['POST'])
 def send_friend_request():
@@ -152,33 +194,34 @@ def send_friend_request():
 
     if not from_user or not to_user:
         return jsonify({"success": False, "message": "Missing user IDs"}), 400
+    try:
+        from_user, to_user = int(from_user), int(to_user)
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "message": "Invalid user IDs"}), 400
 
     if from_user == to_user:
         return jsonify({"success": False, "message": "Cannot send request to yourself"}), 400
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    # Check if request already exists
-    cursor.execute('''
-        SELECT * FROM friend_requests
-        WHERE from_user_id = ? AND to_user_id = ? AND status = 'pending'
-    ''', (from_user, to_user))
-    existing = cursor.fetchone()
+    with db_connection() as conn:
+        cursor = conn.cursor()
 
-    if existing:
-        conn.close()
-        return jsonify({"success": False, "message": "Friend request already sent"}), 400
+        # Check if request already exists
+        cursor.execute('''
+            SELECT * FROM friend_requests
+            WHERE from_user_id = ? AND to_user_id = ? AND status = 'pending'
+        ''', (from_user, to_user))
+        existing = cursor.fetchone()
 
-    # Insert new request
-    cursor.execute('''
-        INSERT INTO friend_requests (from_user_id, to_user_id)
-        VALUES (?, ?)
-    ''', (from_user, to_user))
+        if existing:
+            return jsonify({"success": False, "message": "Friend request already sent"}), 400
 
-    conn.commit()
-    conn.close()
+        # Insert new request
+        cursor.execute('''
+            INSERT INTO friend_requests (from_user_id, to_user_id)
+            VALUES (?, ?)
+        ''', (from_user, to_user))
 
+    response_cache.bump((REQUESTS, int(to_user)))
     return jsonify({"success": True, "message": "Friend request sent"})
 
 @auth_bp.route('/friend-request/respond', methods=['POST'])
@@ -190,54 +233,211 @@ def respond_to_friend_request():
     if not request_id or action not in ['accept', 'reject']:
         return jsonify({"success": False, "message": "Missing or invalid request data"}), 400
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+
+        cursor.execute("SELECT * FROM friend_requests WHERE id = ? AND status = 'pending'", (request_id,))
+        fr = cursor.fetchone()
 
-    cursor.execute("SELECT * FROM friend_requests WHERE id = ? AND status = 'pending'", (request_id,))
-    fr = cursor.fetchone()
+        if not fr:
+            return jsonify({"success": False, "message": "Friend request not found"}), 404
 
-    if not fr:
-        conn.close()
-        return jsonify({"success": False, "message": "Friend request not found"}), 404
+        if action == 'accept':
+            cursor.execute("UPDATE friend_requests SET status = 'accepted' WHERE id = ?", (request_id,))
+            add_friendship(conn, fr['from_user_id'], fr['to_user_id'])
+            mirrored = _accept_mirrors(conn, fr['to_user_id'], [fr['from_user_id']])
+        elif action == 'reject':
+            cursor.execute("UPDATE friend_requests SET status = 'rejected' WHERE id = ?", (request_id,))
 
     if action == 'accept':
-        cursor.execute("UPDATE friend_requests SET status = 'accepted' WHERE id = ?", (request_id,))
-    elif action == 'reject':
-        cursor.execute("UPDATE friend_requests SET status = 'rejected' WHERE id = ?", (request_id,))
-
-    conn.commit()
-    conn.close()
+        invalidate_friends(fr['from_user_id'], fr['to_user_id'])
+        response_cache.bump((FRIENDS, fr['from_user_id']), (FRIENDS, fr['to_user_id']),
+                            *((REQUESTS, user_id) for user_id in mirrored))
+    response_cache.bump((REQUESTS, fr['to_user_id']))
 
     return jsonify({"success": True, "message": f"Friend request {action}ed successfully"})
 
+def _id_list(data, key):
+    """The list of integer ids under `key`, or None if it isn't one."""
+    ids = data.get(key) if isinstance(data, dict) else None
+    if not isinstance(ids, list) or not 0 < len(ids) <= FRIEND_BATCH_MAX:
+        return None
+    if not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+        return None
+    return ids
+
+def _accept_mirrors(conn, user_id, friend_ids):
+    """
+    Accept the user's own pending requests to `friend_ids`, whose requests
+    to the user were just accepted; returns the ids that had one.
+    """
+    rows = conn.execute('''
+        UPDATE friend_requests SET status = 'accepted'
+        WHERE from_user_id = ? AND status = 'pending' AND to_user_id IN (SELECT value FROM json_each(?))
+        RETURNING to_user_id
+    ''', (user_id, json.dumps(friend_ids))).fetchall()
+    return [row['to_user_id'] for row in rows]
+
+@auth_bp.route('/friend-requests/batch', methods=['POST'])
+@jwt_required()
+def send_friend_requests():
+    """
+    Send friend requests from the logged-in user to every id in
+    `to_user_ids` (up to FRIEND_BATCH_MAX), e.g. for a contact import.
+
+    All targets are checked against existing friendships and pending
+    requests in one query and written in one transaction. A target who
+    already sent the user a pending request is accepted instead. Returns
+    a result per target, in order, with `status` one of `sent`,
+    `accepted`, `already_sent`, `already_friends`, `duplicate`, `self` or
+    `not_found`.
+    """
+    to_user_ids = _id_list(request.get_json(silent=True), 'to_user_ids')
+    if to_user_ids is None:
+        return jsonify({"success": False, "message": f"to_user_ids must be 1-{FRIEND_BATCH_MAX} user ids"}), 400
+
+    current_user_id = get_current_user_id()
+    if current_user_id is None:
+        return jsonify({"success": False, "message": "User not found"}), 404
+
+    with db_connection() as conn:
+        # Hold the write lock from the check to the insert so concurrent
+        # batches can't both send the same request
+        conn.execute("BEGIN IMMEDIATE")
+        # CROSS JOIN keeps json_each as the outer loop: one primary key
+        # lookup per id instead of rescanning the list per row
+        existing = {row['id']: row for row in conn.execute('''
+            SELECT t.value AS id,
+                   EXISTS (SELECT 1 FROM friendships
+                           WHERE user_id = ? AND friend_id = t.value) AS friends,
+                   EXISTS (SELECT 1 FROM friend_requests
+                           WHERE from_user_id = ? AND to_user_id = t.value AND status = 'pending') AS pending,
+                   (SELECT id FROM friend_requests
+                    WHERE from_user_id = t.value AND to_user_id = ? AND status = 'pending') AS incoming
+            FROM json_each(?) t CROSS JOIN users u ON u.id = t.value
+        ''', (current_user_id, current_user_id, current_user_id, json.dumps(to_user_ids)))}
+
+        results, seen, to_send, to_accept = [], set(), [], []
+        for to_user in to_user_ids:
+            row = existing.get(to_user)
+            if to_user in seen:
+                status = 'duplicate'
+            elif to_user == current_user_id:
+                status = 'self'
+            elif row is None:
+                status = 'not_found'
+            elif row['friends']:
+                status = 'already_friends'
+            elif row['pending']:
+                status = 'already_sent'
+            elif row['incoming'] is not None:
+                # They asked first: sending back means accepting
+                status = 'accepted'
+                to_accept.append(row)
+            else:
+                status = 'sent'
+                to_send.append(to_user)
+            seen.add(to_user)
+            results.append({"to_user_id": to_user, "status": status})
+
+        conn.execute('''
+            INSERT INTO friend_requests (from_user_id, to_user_id)
+            SELECT ?, value FROM json_each(?)
+        ''', (current_user_id, json.dumps(to_send)))
+        if to_accept:
+            conn.execute("UPDATE friend_requests SET status = 'accepted' WHERE id IN (SELECT value FROM json_each(?))",
+                         (json.dumps([row['incoming'] for row in to_accept]),))
+            add_friendships(conn, [(row['id'], current_user_id) for row in to_accept])
+
+    response_cache.bump(*((REQUESTS, to_user) for to_user in to_send))
+    if to_accept:
+        invalidate_friends(current_user_id, *(row['id'] for row in to_accept))
+        response_cache.bump((REQUESTS, current_user_id), (FRIENDS, current_user_id),
+                            *((FRIENDS, row['id']) for row in to_accept))
+    return jsonify({"success": True, "sent": len(to_send), "accepted": len(to_accept), "results": results})
+
+@auth_bp.route('/friend-requests/respond/batch', methods=['POST'])
+@jwt_required()
+def respond_to_friend_requests():
+    """
+    Accept or reject (`action`) every request in `request_ids` sent to
+    the logged-in user, in one transaction. Returns a result per id, in
+    order, with `status` one of `accepted`, `rejected`, `already_accepted`,
+    `already_rejected`, `duplicate` or `not_found`.
+    """
+    data = request.get_json(silent=True)
+    request_ids = _id_list(data, 'request_ids')
+    action = data.get('action') if isinstance(data, dict) else None
+    if request_ids is None or action not in ('accept', 'reject'):
+        return jsonify({"success": False, "message": "Missing or invalid request data"}), 400
+
+    current_user_id = get_current_user_id()
+    if current_user_id is None:
+        return jsonify({"success": False, "message": "User not found"}), 404
+
+    new_status = f"{action}ed"
+    with db_connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        found = {row['id']: row for row in conn.execute('''
+            SELECT fr.id, fr.from_user_id, fr.status
+            FROM json_each(?) t CROSS JOIN friend_requests fr ON fr.id = t.value
+            WHERE fr.to_user_id = ?
+        ''', (json.dumps(request_ids), current_user_id))}
+
+        results, seen, updated = [], set(), []
+        for request_id in request_ids:
+            row = found.get(request_id)
+            if request_id in seen:
+                status = 'duplicate'
+            elif row is None:
+                status = 'not_found'
+            elif row['status'] != 'pending':
+                status = f"already_{row['status']}"
+            else:
+                status = new_status
+                updated.append(row)
+            seen.add(request_id)
+            results.append({"request_id": request_id, "status": status})
+
+        conn.execute("UPDATE friend_requests SET status = ? WHERE id IN (SELECT value FROM json_each(?))",
+                     (new_status, json.dumps([row['id'] for row in updated])))
+        mirrored = []
+        if action == 'accept':
+            add_friendships(conn, [(row['from_user_id'], current_user_id) for row in updated])
+            mirrored = _accept_mirrors(conn, current_user_id, [row['from_user_id'] for row in updated])
+
+    if action == 'accept' and updated:
+        invalidate_friends(current_user_id, *(row['from_user_id'] for row in updated))
+        response_cache.bump((FRIENDS, current_user_id), *((FRIENDS, row['from_user_id']) for row in updated),
+                            *((REQUESTS, user_id) for user_id in mirrored))
+    if updated:
+        response_cache.bump((REQUESTS, current_user_id))
+
+    return jsonify({"success": True, new_status: len(updated), "results": results})
+
 @auth_bp.route('/friend-requests/pending', methods=['GET'])
 @jwt_required()
+@response_cache.cached(lambda me: [(REQUESTS, me)])
 def get_pending_friend_requests():
     """
     Get all incoming pending friend requests for the logged-in user.
     """
     try:
-        current_email = get_jwt_identity()
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        # Get current user's ID
-        cursor.execute("SELECT id FROM users WHERE email = ?", (current_email,))
-        current_user = cursor.fetchone()
-        if not current_user:
+        current_user_id = get_current_user_id()
+        if current_user_id is None:
             return jsonify({"success": False, "message": "User not found"}), 404
 
-        current_user_id = current_user["id"]
+        with db_connection() as conn:
+            cursor = conn.cursor()
 
-        # Fetch all friend requests sent TO this user that are pending
-        cursor.execute('''
-            SELECT fr.id as request_id, u.id as from_user_id, u.name, u.email
-            FROM friend_requests fr
-            JOIN users u ON fr.from_user_id = u.id
-            WHERE fr.to_user_id = ? AND fr.status = 'pending'
-        ''', (current_user_id,))
-        requests = cursor.fetchall()
-        conn.close()
+            # Fetch all friend requests sent TO this user that are pending
+            cursor.execute('''
+                SELECT fr.id as request_id, u.id as from_user_id, u.name, u.email
+                FROM friend_requests fr
+                JOIN users u ON fr.from_user_id = u.id
+                WHERE fr.to_user_id = ? AND fr.status = 'pending'
+            ''', (current_user_id,))
+            requests = cursor.fetchall()
 
         results = [
             {"request_id": r["request_id"], "from_user_id": r["from_user_id"], "name": r["name"], "email": r["email"]}
@@ -245,84 +445,126 @@ def get_pending_friend_requests():
         ]
         return jsonify({"success": True, "requests": results}), 200
 
-    except Exception as e:
-        print("[Auth] Error getting pending requests:", e)
+    except Exception:
+        logger.exception("Error getting pending requests")
         return jsonify({"success": False, "message": "Error getting pending requests"}), 500
 
 @auth_bp.route('/friends', methods=['GET'])
 @jwt_required()
+@response_cache.cached(lambda me: [(FRIENDS, me)])
 def get_friends():
     """
     Get a list of friends (accepted requests where current user is either sender or receiver).
     """
     try:
-        current_email = get_jwt_identity()
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        # Get current user ID
-        cursor.execute("SELECT id FROM users WHERE email = ?", (current_email,))
-        current_user = cursor.fetchone()
-        if not current_user:
+        current_user_id = get_current_user_id()
+        if current_user_id is None:
             return jsonify({"success": False, "message": "User not found"}), 404
 
-        current_user_id = current_user["id"]
+        with db_connection() as conn:
+            cursor = conn.cursor()
 
-        cursor.execute('''
-            SELECT u.id, u.name, u.email
-            FROM friend_requests fr
-            JOIN users u ON
-                (fr.from_user_id = u.id AND fr.to_user_id = ?)
-                OR (fr.to_user_id = u.id AND fr.from_user_id = ?)
-            WHERE fr.status = 'accepted'
-        ''', (current_user_id, current_user_id))
+            cursor.execute('''
+                SELECT u.id, u.name, u.email
+                FROM friendships f
+                JOIN users u ON u.id = f.friend_id
+                WHERE f.user_id = ?
+            ''', (current_user_id,))
 
-        friends = cursor.fetchall()
-        conn.close()
+            friends = cursor.fetchall()
 
         friend_list = [{"id": f["id"], "name": f["name"], "email": f["email"]} for f in friends]
         return jsonify({"success": True, "friends": friend_list}), 200
 
-    except Exception as e:
-        print("[Auth] Error fetching friends:", e)
+    except Exception:
+        logger.exception("Error fetching friends")
         return jsonify({"success": False, "message": "Error fetching friends"}), 500
 
 @auth_bp.route('/messages/<user_id>', methods=['GET'])
 @jwt_required()
+@response_cache.cached(lambda me, peer: [conversation(me, peer)])
 def get_chat_history(user_id):
-    """Get chat history between current user and specified user"""
+    """
+    Get a page of chat history between current user and specified user.
+
+    Query params: `limit` (default 50), `before` or `after` (message id
+    cursors). Without a cursor the newest page is returned. Messages come
+    back oldest-first within the page; `next_cursor` continues in the same
+    direction and is null once the history is exhausted. `format=ndjson`
+    streams one message per line, read in keyset pages, followed by a
+    final `{"next_cursor": ...}` line; with no `limit` it streams the
+    whole conversation. Streamed messages come in cursor order instead:
+    newest-first, or oldest-first with `after`.
+    """
+    stream = request.args.get('format') == 'ndjson'
     try:
-        current_email = get_jwt_identity()
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        peer_id = int(user_id)
+        before = _optional_int(request.args.get('before'))
+        after = _optional_int(request.args.get('after'))
+        limit = int(request.args.get('limit', 0 if stream else HISTORY_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"success": False, "message": "Invalid user id or cursor"}), 400
+    if before is not None and after is not None:
+        return jsonify({"success": False, "message": "Use either before or after, not both"}), 400
+    if limit < 0 or (not stream and not limit):
+        return jsonify({"success": False, "message": "Invalid limit"}), 400
+    if not stream:
+        limit = min(limit, HISTORY_MAX_PAGE_SIZE)
 
-        # Get current user's ID
-        cursor.execute("SELECT id FROM users WHERE email = ?", (current_email,))
-        current_user = cursor.fetchone()
-        if not current_user:
+    try:
+        current_user_id = get_current_user_id()
+        if current_user_id is None:
             return jsonify({"success": False, "message": "User not found"}), 404
 
-        current_user_id = current_user["id"]
-
-        # Get messages in both directions
-        cursor.execute('''
-            SELECT * FROM messages 
-            WHERE (from_user_id = ? AND to_user_id = ?)
-            OR (from_user_id = ? AND to_user_id = ?)
-            ORDER BY timestamp ASC
-        ''', (current_user_id, user_id, user_id, current_user_id))
-        
-        messages = cursor.fetchall()
-        conn.close()
-
-        formatted_messages = [{
-            'from': 'me' if str(msg['from_user_id']) == str(current_user_id) else 'them',
-            'text': msg['text'],
-            'timestamp': msg['timestamp']
-        } for msg in messages]
-
-        return jsonify({"success": True, "messages": formatted_messages})
-
-    except Exception as e:
-        print("[Auth] Error fetching messages:", e)
+        # Both directions live under one (low id, high id) conversation key;
+        # older pages read through to the monthly archives
+        conv_lo, conv_hi = sorted((current_user_id, peer_id))
+
+        def history(conn, before, after):
+            return closing(message_archive.iter_history(conn, conv_lo, conv_hi, before=before, after=after))
+
+        def format_message(msg):
+            return {
+                'id': msg['id'],
+                'from': 'me' if str(msg['from_user_id']) == str(current_user_id) else 'them',
+                'text': msg['text'],
+                'timestamp': msg['timestamp'],
+                'attachment_id': msg['attachment_id']
+            }
+
+        if stream:
+            def generate():
+                # A page at a time, so the connection (and its read
+                # snapshot) isn't held for as long as the client reads
+                page_before, page_after, last_id, count = before, after, None, 0
+                while not limit or count < limit:
+                    size = min(NDJSON_PAGE_SIZE, limit - count) if limit else NDJSON_PAGE_SIZE
+                    with db_connection() as conn, history(conn, page_before, page_after) as rows:
+                        page = [format_message(msg) for msg in itertools.islice(rows, size)]
+                    for msg in page:
+                        yield json.dumps(msg) + '\n'
+                    if page:
+                        last_id, count = page[-1]['id'], count + len(page)
+                    if len(page) < size:
+                        break
+                    if after is not None:
+                        page_after = last_id
+                    else:
+                        page_before = last_id
+                next_cursor = last_id if limit and count == limit else None
+                yield json.dumps({"next_cursor": next_cursor}) + '\n'
+
+            return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+        with db_connection() as conn, history(conn, before, after) as rows:
+            messages = [format_message(msg) for msg in itertools.islice(rows, limit)]
+
+        next_cursor = messages[-1]['id'] if len(messages) == limit else None
+        if after is None:
+            messages.reverse()
+
+        return jsonify({"success": True, "messages": messages, "next_cursor": next_cursor})
+
+    except Exception:
+        logger.exception("Error fetching messages")
         return jsonify({"success": False, "message": "Error fetching messages"}), 500
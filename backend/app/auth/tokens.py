@@ -0,0 +1,44 @@
+import hashlib
+import time
+
+from flask_jwt_extended import decode_token
+
+from app.auth.models import get_user_id_by_email
+from app.utils import TTLCache
+
+TOKEN_CACHE_SIZE = 10000
+TOKEN_CACHE_TTL = 900  # upper bound; entries never outlive the token's own exp
+
+# sha256(token) -> (user id, claims). Keyed by digest so the cache holds
+# no bearer tokens and every key is the same small size.
+_verified = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL)
+
+
+def _key(token):
+    return hashlib.sha256(token.encode()).digest()
+
+
+def verify_token(token):
+    """
+    Verify an access token and return (user id, claims).
+
+    A token that was verified before and has not expired is answered from
+    the cache, so a reconnect with the same token costs a hash and a dict
+    lookup instead of a signature check. Raises whatever decode_token
+    raises for a bad or expired token; failures are never cached.
+    """
+    key = _key(token)
+    cached = _verified.get(key)
+    if cached is not None:
+        return cached
+
+    claims = decode_token(token)
+    user_id = claims.get("uid")
+    if user_id is None:
+        user_id = get_user_id_by_email(claims["sub"])
+    result = (user_id, claims)
+
+    ttl = min(TOKEN_CACHE_TTL, claims["exp"] - time.time()) if "exp" in claims else TOKEN_CACHE_TTL
+    if ttl > 0:
+        _verified.set(key, result, ttl=ttl)
+    return result
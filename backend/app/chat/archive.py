@@ -0,0 +1,347 @@
+import fcntl
+import heapq
+import json
+import logging
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import click
+
+from app.database import BUSY_TIMEOUT_MS, DB_NAME, db_connection, get_db_connection
+
+logger = logging.getLogger(__name__)
+
+ARCHIVED_COLUMNS = "id, from_user_id, to_user_id, text, timestamp, attachment_id"
+MAX_OPEN_ARCHIVES = 16  # read-only archive connections kept open per worker
+SQLITE_MAX_ROWID = 2 ** 63 - 1
+
+ARCHIVE_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS messages (
+        id INTEGER PRIMARY KEY,
+        from_user_id INTEGER NOT NULL,
+        to_user_id INTEGER NOT NULL,
+        text TEXT NOT NULL,
+        timestamp INTEGER NOT NULL,
+        attachment_id INTEGER,
+        conv_lo INTEGER GENERATED ALWAYS AS (min(from_user_id, to_user_id)) VIRTUAL,
+        conv_hi INTEGER GENERATED ALWAYS AS (max(from_user_id, to_user_id)) VIRTUAL
+    );
+    CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages (conv_lo, conv_hi, id);
+'''
+
+
+def _upgrade(conn):
+    """Bring a month file written before attachments existed up to ARCHIVE_SCHEMA."""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(messages)")}
+    if "attachment_id" not in columns:
+        try:
+            conn.execute("ALTER TABLE messages ADD COLUMN attachment_id INTEGER")
+        except sqlite3.OperationalError:
+            if "attachment_id" not in {row[1] for row in conn.execute("PRAGMA table_info(messages)")}:
+                raise  # not just another worker getting there first
+
+
+def _month(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m")
+
+
+def _merge(sources, sign):
+    """
+    Merge id-ordered row iterators into one stream ordered by `sign * id`,
+    dropping duplicate ids (left behind if a move was interrupted).
+
+    `sources` are (bound, open) pairs, `bound` being the smallest
+    `sign * id` a source can produce. A source is only opened once the
+    merge gets that far, so pages that stay in recent history never touch
+    the archives.
+    """
+    pending = sorted(sources, key=lambda source: source[0])
+    heap = []
+    cursors = []
+    last_id = None
+    try:
+        while True:
+            while len(cursors) < len(pending) and (not heap or pending[len(cursors)][0] <= heap[0][0]):
+                rows = pending[len(cursors)][1]()
+                cursors.append(rows)
+                row = next(rows, None)
+                if row is not None:
+                    heapq.heappush(heap, (sign * row["id"], len(cursors), row, rows))
+            if not heap:
+                return
+            _, order, row, rows = heapq.heappop(heap)
+            if row["id"] != last_id:
+                last_id = row["id"]
+                yield row
+            row = next(rows, None)
+            if row is not None:
+                heapq.heappush(heap, (sign * row["id"], order, row, rows))
+    finally:
+        # An unfinished statement would pin the connection's read snapshot
+        for rows in cursors:
+            rows.close()
+
+
+class MessageArchive:
+    """
+    Hot/cold storage for chat messages.
+
+    Delivered messages older than `after_days` move out of the main
+    database into one SQLite file per month (by message timestamp) under
+    `directory`. The `message_archives` table in the main database records
+    each month's id range; it is updated in the same transaction that
+    deletes the moved rows, so readers always see a message in exactly
+    one place (or, after an interrupted move, in both, which they dedupe).
+
+    Moves and compaction run in short batches with pauses in between so
+    the message writer is never locked out for long.
+    """
+
+    def __init__(self):
+        self.directory = None
+        self.after_days = 90
+        self.batch_size = 1000
+        self.pause = 0.05
+        self.compact_pages = 256
+        self.socketio = None
+        self._readers = OrderedDict()  # month -> read-only connection
+        self._users = {}  # month -> open cursors on its reader
+
+    def init_app(self, app, socketio):
+        self.directory = app.config["ARCHIVE_DIR"] or os.path.join(
+            os.path.dirname(os.path.abspath(DB_NAME)), "archive")
+        self.after_days = app.config["ARCHIVE_AFTER_DAYS"]
+        self.batch_size = app.config["ARCHIVE_BATCH_SIZE"]
+        self.pause = app.config["ARCHIVE_BATCH_PAUSE"]
+        self.compact_pages = app.config["ARCHIVE_COMPACT_PAGES"]
+        self.socketio = socketio
+        os.makedirs(self.directory, exist_ok=True)
+        self._upgrade_files()
+        self._register_commands(app)
+
+        interval = app.config["ARCHIVE_INTERVAL"]
+        if interval:
+            socketio.start_background_task(self._schedule, interval)
+
+    def _upgrade_files(self):
+        for name in os.listdir(self.directory):
+            if name.startswith("messages-") and name.endswith(".db"):
+                conn = sqlite3.connect(os.path.join(self.directory, name))
+                try:
+                    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+                    _upgrade(conn)
+                finally:
+                    conn.close()
+
+    def path(self, month):
+        return os.path.join(self.directory, f"messages-{month}.db")
+
+    # Reading
+
+    def _acquire(self, month):
+        conn = self._readers.get(month)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path(month)}?mode=ro", uri=True, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+            self._readers[month] = conn
+        self._readers.move_to_end(month)
+        self._users[month] = self._users.get(month, 0) + 1
+        return conn
+
+    def _release(self, month):
+        self._users[month] -= 1
+        if not self._users[month]:
+            del self._users[month]
+        # Only idle readers are closed; one a merge still reads from stays open
+        idle = [m for m in self._readers if m not in self._users]
+        for m in idle[:max(0, len(self._readers) - MAX_OPEN_ARCHIVES)]:
+            self._readers.pop(m).close()
+
+    def iter_history(self, conn, conv_lo, conv_hi, before=None, after=None):
+        """
+        Messages of one conversation across the main database and the
+        archives: newest first below `before` (or from the newest), or
+        oldest first above `after`. Lazy: take what the page needs, then
+        close() it to release the cursors.
+        """
+        if after is not None:
+            sign, cursor = 1, after
+            condition, order = "id > ?", "ASC"
+        else:
+            sign, cursor = -1, before if before is not None else SQLITE_MAX_ROWID
+            condition, order = "id < ?", "DESC"
+        query = (f"SELECT {ARCHIVED_COLUMNS} FROM messages "
+                 f"WHERE conv_lo = ? AND conv_hi = ? AND {condition} ORDER BY id {order}")
+        params = (conv_lo, conv_hi, cursor)
+
+        sources = [(-SQLITE_MAX_ROWID, lambda: conn.execute(query, params))]
+        for month, min_id, max_id in conn.execute("SELECT month, min_id, max_id FROM message_archives"):
+            if after is not None and max_id > after:
+                sources.append((min_id, self._month_rows(month, query, params)))
+            elif after is None and min_id < cursor:
+                sources.append((-max_id, self._month_rows(month, query, params)))
+        return _merge(sources, sign)
+
+    def _month_rows(self, month, query, params):
+        def rows():
+            conn = self._acquire(month)
+            try:
+                cursor = conn.execute(query, params)
+                try:
+                    yield from cursor
+                finally:
+                    cursor.close()
+            finally:
+                self._release(month)
+        return rows
+
+    # Moving
+
+    def _sleep(self):
+        if self.socketio is not None:
+            self.socketio.sleep(self.pause)
+        else:
+            time.sleep(self.pause)
+
+    def _copy(self, month, rows):
+        conn = sqlite3.connect(self.path(month))
+        try:
+            conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+            conn.executescript(ARCHIVE_SCHEMA)
+            _upgrade(conn)
+            with conn:
+                conn.executemany(
+                    f"INSERT OR IGNORE INTO messages ({ARCHIVED_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)", rows)
+        finally:
+            conn.close()
+
+    def _move(self, batch):
+        by_month = {}
+        for row in batch:
+            by_month.setdefault(_month(row["timestamp"]), []).append(
+                (row["id"], row["from_user_id"], row["to_user_id"], row["text"], row["timestamp"],
+                 row["attachment_id"]))
+        for month, rows in by_month.items():
+            self._copy(month, rows)
+
+        # The copies are committed; publish the new ranges and drop the
+        # originals in one transaction
+        with db_connection() as conn:
+            for month, rows in by_month.items():
+                ids = [row[0] for row in rows]
+                conn.execute('''
+                    INSERT INTO message_archives (month, min_id, max_id, rows) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (month) DO UPDATE SET
+                        min_id = min(min_id, excluded.min_id),
+                        max_id = max(max_id, excluded.max_id),
+                        rows = rows + excluded.rows
+                ''', (month, min(ids), max(ids), len(ids)))
+            conn.execute("DELETE FROM messages WHERE id IN (SELECT value FROM json_each(?))",
+                         (json.dumps([row["id"] for row in batch]),))
+
+    def archive_old(self, now=None):
+        """Move delivered messages older than the cutoff; returns how many moved."""
+        cutoff = (now or time.time()) - self.after_days * 86400
+        moved, last_id = 0, 0
+        while True:
+            # Ids follow send time, so the oldest messages are the lowest ids
+            with db_connection() as conn:
+                rows = conn.execute(
+                    f"SELECT {ARCHIVED_COLUMNS}, delivered FROM messages WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, self.batch_size)
+                ).fetchall()
+            batch, reached_cutoff = [], False
+            for row in rows:
+                if row["timestamp"] >= cutoff:
+                    reached_cutoff = True
+                    break
+                last_id = row["id"]
+                if row["delivered"]:  # undelivered messages wait for their recipient
+                    batch.append(row)
+            if batch:
+                self._move(batch)
+                moved += len(batch)
+            if reached_cutoff or len(rows) < self.batch_size:
+                return moved
+            self._sleep()
+
+    def compact(self):
+        """
+        Hand free pages back to the filesystem a few at a time, then
+        checkpoint the WAL without waiting on readers. Returns pages freed.
+        """
+        with db_connection() as conn:
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                logger.info("Incremental vacuum is off; run `flask messages compact --full` once to enable it")
+                return 0
+        freed = 0
+        while True:
+            with db_connection() as conn:
+                free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                if not free:
+                    break
+                # execute() would only step the pragma once, freeing one page
+                conn.executescript(f"PRAGMA incremental_vacuum({self.compact_pages})")
+                freed += free - conn.execute("PRAGMA freelist_count").fetchone()[0]
+            self._sleep()
+        with db_connection() as conn:
+            conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchall()
+        return freed
+
+    def run(self):
+        """Archive and compact, unless another process on this host already is."""
+        with open(os.path.join(self.directory, ".lock"), "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                logger.debug("Archive job already running elsewhere")
+                return None
+            started = time.monotonic()
+            moved = self.archive_old()
+            freed = self.compact()
+            logger.info("Archived %d messages, freed %d pages in %.1fs",
+                        moved, freed, time.monotonic() - started)
+            return moved, freed
+
+    def _schedule(self, interval):
+        while True:
+            self.socketio.sleep(interval)
+            try:
+                self.run()
+            except Exception:
+                logger.exception("Archive job failed")
+
+    def _register_commands(self, app):
+        @app.cli.group("messages")
+        def messages_cli():
+            """Message retention and archiving."""
+
+        @messages_cli.command("archive")
+        def archive_command():
+            """Move old messages to the monthly archives now."""
+            result = self.run()
+            if result is None:
+                click.echo("Archive job is already running")
+            else:
+                click.echo(f"Archived {result[0]} messages, freed {result[1]} pages")
+
+        @messages_cli.command("compact")
+        @click.option("--full", is_flag=True,
+                      help="VACUUM once to switch an existing database to incremental vacuum (blocks writers).")
+        def compact_command(full):
+            """Return free pages from the main database to the filesystem."""
+            if full:
+                conn = get_db_connection()
+                conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                conn.execute("VACUUM")
+                conn.close()
+                click.echo("Vacuumed; incremental vacuum enabled")
+            else:
+                click.echo(f"Freed {self.compact()} pages")
+
+
+message_archive = MessageArchive()
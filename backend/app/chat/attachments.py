@@ -0,0 +1,281 @@
+import hashlib
+import logging
+import os
+import time
+
+from app.database import DB_NAME, db_connection
+from app.metrics import metrics
+from app.utils import TTLCache
+
+logger = logging.getLogger(__name__)
+
+MAX_NAME_LENGTH = 255
+DEFAULT_CONTENT_TYPE = "application/octet-stream"
+STREAM_BLOCK_SIZE = 64 * 1024  # read from the request this much at a time
+REHASH_BLOCK_SIZE = 1024 * 1024
+
+received_bytes = metrics.counter(
+    "eirem_attachment_bytes_total", "Attachment bytes written to disk by transport", ("transport",))
+stored_blobs = metrics.counter(
+    "eirem_attachment_blobs_total", "Completed uploads by whether their content was already stored", ("outcome",))
+
+
+class UploadRejected(ValueError):
+    """A chunk or upload the store won't take; `status` is the HTTP equivalent."""
+
+    def __init__(self, message, status=400, received=None):
+        super().__init__(message)
+        self.status = status
+        self.received = received
+
+
+def describe(row):
+    return {
+        "id": row["id"],
+        "name": row["name"],
+        "content_type": row["content_type"],
+        "size": row["size"],
+        "chunk_size": row["chunk_size"],
+        "received": row["received"],
+        "complete": row["sha256"] is not None
+    }
+
+
+class AttachmentStore:
+    """
+    Disk-backed, content-addressed storage for chat attachments.
+
+    An upload is declared with its name and size, then sent as numbered
+    fixed-size chunks, in order, over HTTP or Socket.IO. Each chunk is
+    streamed to its offset in a partial file and `received` is committed
+    after it, so an interrupted upload resumes from the last acknowledged
+    chunk and a resent chunk is simply acked again.
+
+    The last chunk links the file into blobs/<sha256[:2]>/<sha256>; an
+    upload whose content is already there is dropped instead, so identical
+    files are stored once. The running hash of each upload is kept in
+    memory between chunks; an upload resumed on another worker (or after a
+    restart) rehashes its partial file first.
+    """
+
+    def __init__(self):
+        self.directory = None
+        self.chunk_size = 256 * 1024
+        self.max_size = 100 * 1024 * 1024
+        self.upload_ttl = 86400
+        self.accel_redirect = None
+        self.socketio = None
+        self._hashes = TTLCache(maxsize=1000, ttl=3600)  # upload id -> (received, sha256 state)
+
+    def init_app(self, app, socketio):
+        self.directory = app.config["ATTACHMENT_DIR"] or os.path.join(
+            os.path.dirname(os.path.abspath(DB_NAME)), "attachments")
+        self.chunk_size = app.config["ATTACHMENT_CHUNK_SIZE"]
+        self.max_size = app.config["ATTACHMENT_MAX_SIZE"]
+        self.upload_ttl = app.config["ATTACHMENT_UPLOAD_TTL"]
+        self.accel_redirect = app.config["ATTACHMENT_ACCEL_REDIRECT"]
+        self.socketio = socketio
+        os.makedirs(os.path.join(self.directory, "partial"), exist_ok=True)
+        os.makedirs(os.path.join(self.directory, "blobs"), exist_ok=True)
+        socketio.start_background_task(self._expire_forever)
+
+    def blob_path(self, sha256):
+        return os.path.join(self.directory, "blobs", sha256[:2], sha256)
+
+    def _partial_path(self, attachment_id):
+        return os.path.join(self.directory, "partial", str(attachment_id))
+
+    # Uploading
+
+    def create(self, owner_id, name, size, content_type=None):
+        """Declare an upload; returns its description, with the id to send chunks to."""
+        if not isinstance(name, str) or not name.strip() or len(name) > MAX_NAME_LENGTH:
+            raise UploadRejected("File name required")
+        if not isinstance(size, int) or isinstance(size, bool) or not 0 < size <= self.max_size:
+            raise UploadRejected(f"Size must be 1-{self.max_size} bytes")
+        if content_type is None:
+            content_type = DEFAULT_CONTENT_TYPE
+        if not isinstance(content_type, str) or len(content_type) > MAX_NAME_LENGTH:
+            raise UploadRejected("Invalid content type")
+
+        with db_connection() as conn:
+            row = conn.execute('''
+                INSERT INTO attachments (owner_id, name, content_type, size, chunk_size, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                RETURNING *
+            ''', (owner_id, name.strip(), content_type, size, self.chunk_size, int(time.time()))).fetchone()
+        return describe(row)
+
+    def status(self, owner_id, attachment_id):
+        """Description of one of `owner_id`'s uploads, or None."""
+        with db_connection() as conn:
+            row = conn.execute("SELECT * FROM attachments WHERE id = ? AND owner_id = ?",
+                               (attachment_id, owner_id)).fetchone()
+        return describe(row) if row else None
+
+    def write_chunk(self, owner_id, attachment_id, index, source, length, transport):
+        """
+        Stream chunk `index` (`length` bytes read from file-like `source`)
+        into an upload; returns the upload's description after it.
+        """
+        with db_connection() as conn:
+            row = conn.execute("SELECT * FROM attachments WHERE id = ? AND owner_id = ?",
+                               (attachment_id, owner_id)).fetchone()
+        if row is None:
+            raise UploadRejected("Upload not found", 404)
+        offset = row["received"]
+        expected = offset // row["chunk_size"]
+        if row["sha256"] is not None or index < expected:
+            return describe(row)  # a retry of a chunk that already landed
+        if index > expected:
+            raise UploadRejected(f"Expected chunk {expected}", 409, received=offset)
+        want = min(row["chunk_size"], row["size"] - offset)
+        if length != want:
+            raise UploadRejected(f"Chunk {index} must be {want} bytes", received=offset)
+
+        digest = self._digest_at(attachment_id, offset)
+        fd = os.open(self._partial_path(attachment_id), os.O_WRONLY | os.O_CREAT, 0o600)
+        try:
+            written = 0
+            while written < want:
+                block = source.read(min(STREAM_BLOCK_SIZE, want - written))
+                if not block:
+                    raise UploadRejected(f"Chunk {index} ended after {written} bytes", received=offset)
+                view, position = memoryview(block), offset + written
+                while view:
+                    count = os.pwrite(fd, view, position)
+                    view, position = view[count:], position + count
+                digest.update(block)
+                written += len(block)
+            if offset + want == row["size"]:
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+        received_bytes.inc((transport,), want)
+
+        if offset + want == row["size"]:
+            return self._complete(row, digest.hexdigest())
+        with db_connection() as conn:
+            advanced = conn.execute("UPDATE attachments SET received = ? WHERE id = ? AND received = ?",
+                                    (offset + want, attachment_id, offset)).rowcount
+        if advanced:
+            self._hashes.set(attachment_id, (offset + want, digest))
+        else:
+            self._hashes.pop(attachment_id)  # a concurrent resend won; rehash next time
+        return {**describe(row), "received": offset + want}
+
+    def _digest_at(self, attachment_id, offset):
+        """sha256 state of an upload's first `offset` bytes."""
+        cached = self._hashes.get(attachment_id)
+        if cached is not None and cached[0] == offset:
+            return cached[1].copy()
+        digest = hashlib.sha256()
+        if not offset:
+            return digest
+        try:
+            with open(self._partial_path(attachment_id), "rb") as f:
+                remaining = offset
+                while remaining:
+                    block = f.read(min(REHASH_BLOCK_SIZE, remaining))
+                    if not block:
+                        break
+                    digest.update(block)
+                    remaining -= len(block)
+                    self.socketio.sleep(0)
+        except FileNotFoundError:
+            remaining = offset
+        if remaining:
+            raise UploadRejected("Upload data was lost; start it again", 410)
+        return digest
+
+    def _complete(self, row, sha256):
+        partial, blob = self._partial_path(row["id"]), self.blob_path(sha256)
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        # Link, commit, then unlink: a crash in between leaves a partial
+        # file to resend the last chunk into (or for the sweep), never a
+        # completed attachment without its blob
+        try:
+            os.link(partial, blob)
+            stored_blobs.inc(("new",))
+        except FileExistsError:
+            stored_blobs.inc(("duplicate",))
+        except FileNotFoundError:
+            pass  # a concurrent resend of the last chunk completed it first
+        with db_connection() as conn:
+            conn.execute('''
+                UPDATE attachments SET received = size, sha256 = ?, completed_at = ?
+                WHERE id = ? AND sha256 IS NULL
+            ''', (sha256, int(time.time()), row["id"]))
+            row = conn.execute("SELECT * FROM attachments WHERE id = ?", (row["id"],)).fetchone()
+        self._hashes.pop(row["id"])
+        try:
+            os.unlink(partial)
+        except FileNotFoundError:
+            pass
+        logger.info("Stored attachment %s (%d bytes) as %s", row["id"], row["size"], sha256)
+        return describe(row)
+
+    # Reading
+
+    def readable(self, conn, attachment_id, user_id):
+        """
+        The completed attachment row if `user_id` uploaded it, was sent it
+        or is in a group it was posted to; else None.
+        """
+        return conn.execute('''
+            SELECT * FROM attachments a
+            WHERE a.id = :id AND a.sha256 IS NOT NULL AND (
+                a.owner_id = :user
+                OR EXISTS (SELECT 1 FROM attachment_shares s WHERE s.attachment_id = a.id AND s.user_id = :user)
+                OR EXISTS (
+                    SELECT 1 FROM group_messages g JOIN conversation_members m
+                        ON m.conversation_id = g.conversation_id AND m.user_id = :user
+                    WHERE g.attachment_id = a.id
+                )
+            )
+        ''', {"id": attachment_id, "user": user_id}).fetchone()
+
+    # Expiry
+
+    def expire_uploads(self, now=None):
+        """Drop uploads left incomplete for `upload_ttl` and stray partial files; returns how many."""
+        cutoff = int(now or time.time()) - self.upload_ttl
+        # Listed first: a partial file is only created once its row exists
+        partials = os.listdir(os.path.join(self.directory, "partial"))
+        with db_connection() as conn:
+            expired = [row["id"] for row in conn.execute(
+                "DELETE FROM attachments WHERE sha256 IS NULL AND created_at < ? RETURNING id", (cutoff,))]
+            pending = {row["id"] for row in conn.execute("SELECT id FROM attachments WHERE sha256 IS NULL")}
+        for name in partials:
+            if not name.isdigit() or int(name) not in pending:
+                try:
+                    os.unlink(os.path.join(self.directory, "partial", name))
+                except FileNotFoundError:
+                    pass
+        for attachment_id in expired:
+            self._hashes.pop(attachment_id)
+        if expired:
+            logger.info("Expired %d incomplete uploads", len(expired))
+        return len(expired)
+
+    def _expire_forever(self):
+        while True:
+            self.socketio.sleep(min(self.upload_ttl, 3600))
+            try:
+                self.expire_uploads()
+            except Exception:
+                logger.exception("Expiring uploads failed")
+
+
+def record_shares(conn, batch):
+    """
+    Let recipients of one-to-one messages download their attachments.
+    Runs inside the writer's batch transaction.
+    """
+    shares = {(message["attachment"], int(message["to"]))
+              for message in batch if message.get("attachment") is not None and "conversation" not in message}
+    if shares:
+        conn.executemany("INSERT OR IGNORE INTO attachment_shares (attachment_id, user_id) VALUES (?, ?)", shares)
+
+
+attachment_store = AttachmentStore()
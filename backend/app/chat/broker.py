@@ -0,0 +1,255 @@
+import json
+import os
+import sqlite3
+import time
+import uuid
+
+import socketio
+
+SQLITE_SCHEME = "sqlite:///"
+WORKER_TTL = 30          # seconds without a heartbeat before a worker's sessions are ignored
+BUS_RETENTION = 60       # seconds a published packet stays in the SQLite bus
+BUS_POLL_INTERVAL = 0.01
+
+# Identifies this process in the shared presence tables
+WORKER_ID = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+def _sqlite_path(url):
+    return url[len(SQLITE_SCHEME):]
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")  # ephemeral state, rebuilt on restart
+    conn.execute("PRAGMA busy_timeout = 5000")
+    return conn
+
+
+def move_local_sessions(manager, moves, enter, namespace="/"):
+    """
+    For each (source, target) room pair in `moves`, put every session in
+    `source` on this worker into `target` (or take it out).
+    """
+    for source, target in moves:
+        for sid, eio_sid in list(manager.get_participants(namespace, source)):
+            if enter:
+                manager.basic_enter_room(sid, namespace, target, eio_sid=eio_sid)
+            else:
+                manager.basic_leave_room(sid, namespace, target)
+
+
+class SessionMovesMixin:
+    """
+    Lets a worker move sessions it only knows by a room they are in (say,
+    all of a user's sessions) into or out of another room on every worker,
+    riding on the manager's own enter_room/leave_room messages.
+    """
+
+    def move_sessions(self, moves, enter, namespace="/"):
+        message = {"method": "enter_room" if enter else "leave_room", "moves": [list(m) for m in moves],
+                   "namespace": namespace, "host_id": self.host_id}
+        move_local_sessions(self, moves, enter, namespace)
+        self._publish(message)
+
+    def _handle_enter_room(self, message):
+        if "moves" in message:
+            move_local_sessions(self, message["moves"], True, message["namespace"])
+        else:
+            super()._handle_enter_room(message)
+
+    def _handle_leave_room(self, message):
+        if "moves" in message:
+            move_local_sessions(self, message["moves"], False, message["namespace"])
+        else:
+            super()._handle_leave_room(message)
+
+
+class RedisManager(SessionMovesMixin, socketio.RedisManager):
+    pass
+
+
+class SqlitePubSubManager(SessionMovesMixin, socketio.PubSubManager):
+    """
+    Socket.IO client manager that relays emits between worker processes
+    through a table in a local SQLite file, so several workers on one
+    host can share rooms without running Redis.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, url, channel="flask-socketio", write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.path = _sqlite_path(url)
+        self._conn = _connect(self.path)
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS socketio_bus (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                channel TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created REAL NOT NULL
+            )
+        ''')
+
+    def _publish(self, data):
+        self._conn.execute(
+            "INSERT INTO socketio_bus (channel, payload, created) VALUES (?, ?, ?)",
+            (self.channel, self.json.dumps(data), time.time())
+        )
+
+    def _listen(self):
+        conn = _connect(self.path)
+        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM socketio_bus").fetchone()[0]
+        next_prune = 0
+        while True:
+            rows = conn.execute(
+                "SELECT id, payload FROM socketio_bus WHERE id > ? AND channel = ? ORDER BY id",
+                (last_id, self.channel)
+            ).fetchall()
+            for row_id, payload in rows:
+                last_id = row_id
+                yield self.json.loads(payload)
+
+            now = time.time()
+            if now >= next_prune:
+                conn.execute("DELETE FROM socketio_bus WHERE created < ?", (now - BUS_RETENTION,))
+                next_prune = now + BUS_RETENTION
+            self.server.sleep(BUS_POLL_INTERVAL)
+
+
+class SqlitePresenceStore:
+    """Per-worker session counts and last-seen times in a shared SQLite file."""
+
+    def __init__(self, url):
+        self._conn = _connect(_sqlite_path(url))
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS presence_workers (
+                worker TEXT PRIMARY KEY,
+                heartbeat REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS presence_sessions (
+                user_id TEXT NOT NULL,
+                worker TEXT NOT NULL,
+                sessions INTEGER NOT NULL,
+                PRIMARY KEY (user_id, worker)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS presence_last_seen (
+                user_id TEXT PRIMARY KEY,
+                seen REAL NOT NULL
+            ) WITHOUT ROWID;
+        ''')
+
+    def heartbeat(self):
+        now = time.time()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO presence_workers (worker, heartbeat) VALUES (?, ?)",
+            (WORKER_ID, now)
+        )
+        # Sweep up after workers that died without cleaning up
+        self._conn.execute('''
+            DELETE FROM presence_sessions WHERE worker IN (
+                SELECT worker FROM presence_workers WHERE heartbeat < ?
+            )
+        ''', (now - WORKER_TTL,))
+        self._conn.execute("DELETE FROM presence_workers WHERE heartbeat < ?", (now - WORKER_TTL,))
+
+    def set_sessions(self, user_id, count):
+        if count:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO presence_sessions (user_id, worker, sessions) VALUES (?, ?, ?)",
+                (user_id, WORKER_ID, count)
+            )
+        else:
+            self._conn.execute(
+                "DELETE FROM presence_sessions WHERE user_id = ? AND worker = ?",
+                (user_id, WORKER_ID)
+            )
+
+    def seen(self, user_id, when):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO presence_last_seen (user_id, seen) VALUES (?, ?)",
+            (user_id, when)
+        )
+
+    def online(self, user_ids):
+        rows = self._conn.execute('''
+            SELECT DISTINCT s.user_id FROM presence_sessions s
+            JOIN presence_workers w ON w.worker = s.worker
+            WHERE s.user_id IN (SELECT value FROM json_each(?)) AND w.heartbeat >= ?
+        ''', (json.dumps(user_ids), time.time() - WORKER_TTL)).fetchall()
+        return {row[0] for row in rows}
+
+    def last_seen(self, user_ids):
+        rows = self._conn.execute(
+            "SELECT user_id, seen FROM presence_last_seen WHERE user_id IN (SELECT value FROM json_each(?))",
+            (json.dumps(user_ids),)
+        ).fetchall()
+        return dict(rows)
+
+
+class RedisPresenceStore:
+    """The same bookkeeping in Redis, for workers spread across hosts."""
+
+    def __init__(self, url, prefix="eirem:presence"):
+        import redis  # only needed when a Redis queue is configured
+        self.redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def _user_key(self, user_id):
+        return f"{self.prefix}:user:{user_id}"
+
+    def _worker_key(self, worker):
+        return f"{self.prefix}:worker:{worker}"
+
+    def heartbeat(self):
+        self.redis.set(self._worker_key(WORKER_ID), 1, ex=WORKER_TTL)
+
+    def set_sessions(self, user_id, count):
+        if count:
+            self.redis.hset(self._user_key(user_id), WORKER_ID, count)
+        else:
+            self.redis.hdel(self._user_key(user_id), WORKER_ID)
+
+    def seen(self, user_id, when):
+        self.redis.hset(f"{self.prefix}:last_seen", user_id, when)
+
+    def online(self, user_ids):
+        pipe = self.redis.pipeline()
+        for user_id in user_ids:
+            pipe.hkeys(self._user_key(user_id))
+        workers_by_user = dict(zip(user_ids, pipe.execute()))
+
+        workers = list({w.decode() for ws in workers_by_user.values() for w in ws})
+        if not workers:
+            return set()
+        flags = self.redis.mget([self._worker_key(w) for w in workers])
+        alive = {w for w, flag in zip(workers, flags) if flag}
+        return {
+            user_id for user_id, ws in workers_by_user.items()
+            if any(w.decode() in alive for w in ws)
+        }
+
+    def last_seen(self, user_ids):
+        if not user_ids:
+            return {}  # HMGET needs at least one field
+        values = self.redis.hmget(f"{self.prefix}:last_seen", user_ids)
+        return {user_id: float(v) for user_id, v in zip(user_ids, values) if v is not None}
+
+
+def client_manager_for(url):
+    """Socket.IO client manager for a message queue URL."""
+    if url.startswith(SQLITE_SCHEME):
+        return SqlitePubSubManager(url)
+    if url.startswith(("redis://", "rediss://")):
+        return RedisManager(url, channel="flask-socketio")
+    raise ValueError(f"Unsupported message queue URL: {url}")
+
+
+def presence_store_for(url):
+    """Shared presence store matching a message queue URL."""
+    if url.startswith(SQLITE_SCHEME):
+        return SqlitePresenceStore(url)
+    if url.startswith(("redis://", "rediss://")):
+        return RedisPresenceStore(url)
+    raise ValueError(f"Unsupported message queue URL: {url}")
@@ -0,0 +1,134 @@
+import functools
+import logging
+import zlib
+
+from app.chat.presence import user_room
+
+logger = logging.getLogger(__name__)
+
+CODEC_JSON = "json"
+CODEC_MSGPACK = "msgpack"
+
+# First byte of a binary payload
+RAW = b"\x00"
+DEFLATED = b"\x01"
+
+
+def binary_variant(room):
+    """Counterpart of `room` joined by sessions that negotiated the binary codec."""
+    return f"{room}:msgpack"
+
+
+def binary_room(user_id):
+    """Room the sessions of `user_id` that negotiated the binary codec join."""
+    return binary_variant(user_room(user_id))
+
+
+class PayloadCodec:
+    """
+    Opt-in binary payloads for Socket.IO sessions.
+
+    A client asks for it by connecting with `codec=msgpack`; the server
+    answers with a `codec` event naming what it will use. For those
+    sessions, payloads that pack to at least `threshold` bytes are sent
+    as a single binary argument: one flag byte (RAW or DEFLATED) followed
+    by the MessagePack body, zlib-compressed when that makes it smaller.
+    Smaller payloads stay plain JSON, where the extra binary frame would
+    cost more than it saves. Binary sessions may send binary payloads in
+    the same format.
+
+    Emits to a room are encoded once per format and shared by all of its
+    sessions: JSON ones join the room itself, binary ones its
+    `binary_variant`. A user's sessions are in `user_room`.
+    """
+
+    def __init__(self):
+        self.socketio = None
+        self.enabled = False
+        self.threshold = 1024
+        self.level = 6
+        self._msgpack = None
+        self._binary_sids = set()
+
+    def init_app(self, app, socketio):
+        self.socketio = socketio
+        self.threshold = app.config["SOCKETIO_BINARY_THRESHOLD"]
+        self.level = app.config["SOCKETIO_COMPRESSION_LEVEL"]
+        self.enabled = False
+        if app.config["SOCKETIO_BINARY_CODEC"]:
+            try:
+                import msgpack  # only needed when binary sessions are allowed
+            except ImportError:
+                logger.warning("msgpack is not installed; binary codec disabled")
+            else:
+                self._msgpack = msgpack
+                self.enabled = True
+
+    def negotiate(self, sid, requested):
+        """Pick the codec for a new session; returns its name."""
+        if requested == CODEC_MSGPACK and self.enabled:
+            self._binary_sids.add(sid)
+            return CODEC_MSGPACK
+        return CODEC_JSON
+
+    def forget(self, sid):
+        self._binary_sids.discard(sid)
+
+    def session_room(self, room, sid):
+        """Which variant of `room` session `sid` should join."""
+        return binary_variant(room) if sid in self._binary_sids else room
+
+    def room_for(self, user_id, sid):
+        return self.session_room(user_room(user_id), sid)
+
+    def encode(self, payload):
+        """Binary form of `payload`, or None if it is too small to bother."""
+        packed = self._msgpack.packb(payload, use_bin_type=True)
+        if len(packed) < self.threshold:
+            return None
+        deflated = zlib.compress(packed, self.level)
+        if len(deflated) < len(packed):
+            return DEFLATED + deflated
+        return RAW + packed
+
+    def decode(self, data):
+        body = bytes(data[1:])
+        if data[:1] == DEFLATED:
+            body = zlib.decompress(body)
+        return self._msgpack.unpackb(body, raw=False)
+
+    def incoming(self, data):
+        """Decode a payload a binary session sent as bytes; anything else passes through."""
+        if isinstance(data, (bytes, bytearray)) and self.enabled:
+            return self.decode(data)
+        return data
+
+    def emit_to_user(self, event, payload, user_id):
+        """Emit to every session of `user_id`, in each session's codec."""
+        self.emit_to_room(event, payload, user_room(user_id))
+
+    def emit_to_room(self, event, payload, room, skip_sid=None):
+        """Emit to every session in `room` (or its binary variant), in each session's codec."""
+        encoded = self.encode(payload) if self.enabled else None
+        if encoded is None:
+            # Same JSON for everyone: one emit, one encode
+            rooms = [room, binary_variant(room)] if self.enabled else room
+            self.socketio.emit(event, payload, to=rooms, skip_sid=skip_sid)
+        else:
+            self.socketio.emit(event, payload, to=room, skip_sid=skip_sid)
+            self.socketio.emit(event, encoded, to=binary_variant(room), skip_sid=skip_sid)
+
+    def emit_to_sid(self, event, payload, sid):
+        encoded = self.encode(payload) if sid in self._binary_sids else None
+        self.socketio.emit(event, payload if encoded is None else encoded, to=sid)
+
+
+codec = PayloadCodec()
+
+
+def decoded(handler):
+    """Socket.IO handler decorator: decode a binary payload before the handler sees it."""
+    @functools.wraps(handler)
+    def wrapper(data=None, *args):
+        return handler(codec.incoming(data), *args)
+    return wrapper
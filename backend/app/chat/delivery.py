@@ -0,0 +1,153 @@
+import json
+
+from app.chat.inbox import reset_unread
+from app.database import db_connection
+
+MISSED_BATCH_SIZE = 500
+
+# Delivery bookkeeping for a recipient:
+# - messages.delivered: 0 while a message is waiting for its recipient to
+#   connect (a partial index keeps these cheap to find)
+# - delivery_state: per conversation (user_id, peer_id) delivered/read
+#   watermarks, i.e. the newest message id the user has received/read
+
+
+def _advance_delivered(conn, latest):
+    """`latest` maps (user_id, peer_id) to the newest delivered message id."""
+    conn.executemany('''
+        INSERT INTO delivery_state (user_id, peer_id, delivered_id) VALUES (?, ?, ?)
+        ON CONFLICT (user_id, peer_id) DO UPDATE
+        SET delivered_id = max(delivered_id, excluded.delivered_id)
+    ''', [(user_id, peer_id, message_id) for (user_id, peer_id), message_id in latest.items()])
+
+
+def record_live_deliveries(conn, batch):
+    """
+    Advance delivered watermarks for messages that were emitted to an
+    online recipient. Runs inside the writer's batch transaction.
+    """
+    latest = {}
+    for message in batch:
+        if message.get("delivered"):
+            key = (int(message["to"]), int(message["from"]))
+            latest[key] = max(latest.get(key, 0), message["id"])
+    if latest:
+        _advance_delivered(conn, latest)
+
+
+def claim_undelivered(message_ids):
+    """
+    Mark those of `message_ids` that are still waiting for their recipient
+    delivered, and return them (formatted, plus "to") for the caller to
+    push. A message someone else claimed first is left out.
+    """
+    if not message_ids:
+        return []
+    with db_connection() as conn:
+        rows = conn.execute('''
+            UPDATE messages SET delivered = 1
+            WHERE id IN (SELECT value FROM json_each(?)) AND delivered = 0
+            RETURNING id, from_user_id, to_user_id, text, timestamp, attachment_id
+        ''', (json.dumps(message_ids),)).fetchall()
+        rows.sort(key=lambda row: row["id"])
+        if rows:
+            _advance_delivered(conn, {(row["to_user_id"], row["from_user_id"]): row["id"] for row in rows})
+    return [{**_format(row), "to": str(row["to_user_id"])} for row in rows]
+
+
+def _format(row):
+    message = {
+        "id": row["id"],
+        "from": str(row["from_user_id"]),
+        "text": row["text"],
+        "timestamp": row["timestamp"]
+    }
+    if row["attachment_id"] is not None:
+        message["attachmentId"] = row["attachment_id"]
+    return message
+
+
+def fetch_missed(user_id, since=None, limit=MISSED_BATCH_SIZE):
+    """
+    Collect messages addressed to `user_id` that it has not received and
+    mark them delivered.
+
+    Without `since`, returns messages that were stored while the user was
+    offline. With `since` (the last seq the client saw), returns
+    everything after it, for resuming after a dropped connection.
+
+    Returns (messages, seq, more): `seq` is the id the client can resume
+    from, `more` says another batch is waiting.
+    """
+    user_id = int(user_id)
+    with db_connection() as conn:
+        if since is None:
+            rows = conn.execute('''
+                SELECT id, from_user_id, text, timestamp, attachment_id FROM messages
+                WHERE to_user_id = ? AND delivered = 0
+                ORDER BY id LIMIT ?
+            ''', (user_id, limit)).fetchall()
+        else:
+            rows = conn.execute('''
+                SELECT id, from_user_id, text, timestamp, attachment_id FROM messages
+                WHERE to_user_id = ? AND id > ?
+                ORDER BY id LIMIT ?
+            ''', (user_id, since, limit)).fetchall()
+
+        more = len(rows) == limit
+        if rows:
+            conn.execute('''
+                UPDATE messages SET delivered = 1
+                WHERE to_user_id = ? AND delivered = 0 AND id <= ?
+            ''', (user_id, rows[-1]["id"]))
+            _advance_delivered(conn, {(user_id, row["from_user_id"]): row["id"] for row in rows})
+
+        if more:
+            seq = rows[-1]["id"]
+        else:
+            seq = conn.execute(
+                "SELECT COALESCE(MAX(id), 0) FROM messages WHERE to_user_id = ?", (user_id,)
+            ).fetchone()[0]
+            if since is not None:
+                seq = max(seq, since)
+
+    return [_format(row) for row in rows], seq, more
+
+
+def fetch_group_missed(conversation_id, since, limit=MISSED_BATCH_SIZE):
+    """
+    A group's messages after `since`, for resuming. Returns (messages,
+    seq, more) like `fetch_missed`; group messages carry no delivery state.
+    """
+    with db_connection() as conn:
+        rows = conn.execute('''
+            SELECT id, from_user_id, text, timestamp, attachment_id FROM group_messages
+            WHERE conversation_id = ? AND id > ?
+            ORDER BY id LIMIT ?
+        ''', (conversation_id, since, limit)).fetchall()
+    seq = rows[-1]["id"] if rows else since
+    return [_format(row) for row in rows], seq, len(rows) == limit
+
+
+def mark_read(user_id, peer_id, up_to=None):
+    """
+    Advance the read watermark of one conversation to `up_to` (its newest
+    message if None) and reset its unread count to match.
+    """
+    user_id, peer_id = int(user_id), int(peer_id)
+    with db_connection() as conn:
+        if up_to is None:
+            up_to = conn.execute(
+                "SELECT last_message_id FROM conversation_summary WHERE user_id = ? AND peer_id = ?",
+                (user_id, peer_id)
+            ).fetchone()
+            if up_to is None:
+                return
+            up_to = up_to[0]
+        conn.execute('''
+            INSERT INTO delivery_state (user_id, peer_id, delivered_id, read_id) VALUES (?, ?, ?, ?)
+            ON CONFLICT (user_id, peer_id) DO UPDATE
+            SET read_id = max(read_id, excluded.read_id),
+                delivered_id = max(delivered_id, excluded.read_id)
+        ''', (user_id, peer_id, up_to, up_to))
+        reset_unread(conn, user_id, peer_id, up_to)
@@ -0,0 +1,128 @@
+import json
+import time
+
+from app.chat.broker import SessionMovesMixin, move_local_sessions
+from app.chat.codec import binary_variant, codec
+from app.chat.presence import user_room
+from app.database import db_connection
+from app.utils import TTLCache
+
+MAX_GROUP_MEMBERS = 1000
+GROUP_NAME_MAX_LENGTH = 100
+
+# conversation id -> frozenset of member ids. Other workers only see a
+# membership change once their entry expires, so keep the TTL short.
+MEMBERS_CACHE_SIZE = 10000
+MEMBERS_CACHE_TTL = 60
+_members = TTLCache(maxsize=MEMBERS_CACHE_SIZE, ttl=MEMBERS_CACHE_TTL)
+
+
+def conversation_room(conversation_id):
+    """Room every session of every member of a group conversation joins."""
+    return f"conversation:{conversation_id}"
+
+
+def get_member_ids(conversation_id):
+    """Return the (cached) set of member ids of a conversation; empty if there is none."""
+    conversation_id = int(conversation_id)
+    member_ids = _members.get(conversation_id)
+    if member_ids is None:
+        with db_connection() as conn:
+            rows = conn.execute("SELECT user_id FROM conversation_members WHERE conversation_id = ?",
+                                (conversation_id,)).fetchall()
+        member_ids = frozenset(row["user_id"] for row in rows)
+        _members.set(conversation_id, member_ids)
+    return member_ids
+
+
+def get_role(conn, conversation_id, user_id):
+    row = conn.execute("SELECT role FROM conversation_members WHERE conversation_id = ? AND user_id = ?",
+                       (conversation_id, user_id)).fetchone()
+    return row["role"] if row else None
+
+
+def conversation_ids_of(user_id):
+    with db_connection() as conn:
+        rows = conn.execute("SELECT conversation_id FROM conversation_members WHERE user_id = ?",
+                            (int(user_id),)).fetchall()
+    return [row["conversation_id"] for row in rows]
+
+
+def create_conversation(conn, name, owner_id):
+    """Create a group owned by `owner_id` on `conn`'s open transaction; returns its id."""
+    now = int(time.time())
+    conversation_id = conn.execute(
+        "INSERT INTO conversations (name, created_by, created_at) VALUES (?, ?, ?)",
+        (name, owner_id, now)
+    ).lastrowid
+    conn.execute('''
+        INSERT INTO conversation_members (conversation_id, user_id, role, joined_at)
+        VALUES (?, ?, 'owner', ?)
+    ''', (conversation_id, owner_id, now))
+    return conversation_id
+
+
+def add_members(conn, conversation_id, user_ids):
+    """
+    Add existing users that aren't members yet, in one statement on
+    `conn`'s open transaction; returns the ids actually added.
+    """
+    rows = conn.execute('''
+        INSERT INTO conversation_members (conversation_id, user_id, joined_at)
+        SELECT ?, u.id, ? FROM json_each(?) t CROSS JOIN users u ON u.id = t.value
+        WHERE true
+        ON CONFLICT (conversation_id, user_id) DO NOTHING
+        RETURNING user_id
+    ''', (conversation_id, int(time.time()), json.dumps(sorted(set(user_ids))))).fetchall()
+    return [row["user_id"] for row in rows]
+
+
+def remove_member(conn, conversation_id, user_id):
+    """Returns whether `user_id` was a member."""
+    return conn.execute("DELETE FROM conversation_members WHERE conversation_id = ? AND user_id = ?",
+                        (conversation_id, user_id)).rowcount > 0
+
+
+def promote_successor(conn, conversation_id):
+    """
+    Make the longest-standing member of a group whose owner left its
+    owner; returns their id, or None if nobody is left.
+    """
+    row = conn.execute('''
+        UPDATE conversation_members SET role = 'owner'
+        WHERE conversation_id = :id AND user_id = (
+            SELECT user_id FROM conversation_members WHERE conversation_id = :id
+            ORDER BY joined_at, user_id LIMIT 1
+        )
+        RETURNING user_id
+    ''', {"id": conversation_id}).fetchone()
+    return row["user_id"] if row else None
+
+
+def invalidate_members(conversation_id):
+    _members.pop(int(conversation_id))
+
+
+def _move_sessions(conversation_id, user_ids, enter):
+    # A user's sessions are in their user room or, binary ones, its binary
+    # variant; each goes into the matching variant of the conversation room
+    room = conversation_room(conversation_id)
+    moves = []
+    for user_id in user_ids:
+        moves.append((user_room(user_id), room))
+        moves.append((binary_variant(user_room(user_id)), binary_variant(room)))
+    manager = codec.socketio.server.manager
+    if isinstance(manager, SessionMovesMixin):
+        manager.move_sessions(moves, enter)
+    else:
+        move_local_sessions(manager, moves, enter)
+
+
+def join_sessions(conversation_id, user_ids):
+    """Put the sessions of `user_ids`, on every worker, into the conversation's room."""
+    _move_sessions(conversation_id, user_ids, True)
+
+
+def leave_sessions(conversation_id, user_ids):
+    """Take the sessions of `user_ids`, on every worker, out of the conversation's room."""
+    _move_sessions(conversation_id, user_ids, False)
@@ -0,0 +1,86 @@
+from app.database import db_connection
+
+PREVIEW_LENGTH = 100
+
+# conversation_summary holds one row per participant of each one-to-one
+# conversation, (user_id, peer_id): the newest message, a preview of it and
+# how many messages from the peer the user has not read yet. The writer
+# keeps it current in the same transaction as the messages themselves, so
+# an inbox is one index range scan and never a count over the history.
+
+
+def update_summaries(conn, batch):
+    """
+    Fold a committed batch of one-to-one messages (with ids) into both
+    participants' summaries. Runs inside the writer's batch transaction.
+    """
+    summaries = {}
+    for message in batch:
+        if "conversation" in message:
+            continue
+        sender, recipient = int(message["from"]), int(message["to"])
+        latest = (message["id"], sender, str(message["text"])[:PREVIEW_LENGTH], message["timestamp"])
+        _, unread = summaries.get((sender, recipient), (None, 0))
+        summaries[(sender, recipient)] = (latest, unread)
+        if recipient != sender:
+            _, unread = summaries.get((recipient, sender), (None, 0))
+            summaries[(recipient, sender)] = (latest, unread + 1)
+    if not summaries:
+        return
+    conn.executemany('''
+        INSERT INTO conversation_summary
+            (user_id, peer_id, last_message_id, last_from_user_id, preview, last_timestamp, unread)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (user_id, peer_id) DO UPDATE
+        SET last_message_id = excluded.last_message_id,
+            last_from_user_id = excluded.last_from_user_id,
+            preview = excluded.preview,
+            last_timestamp = excluded.last_timestamp,
+            unread = unread + excluded.unread
+    ''', [(user_id, peer_id, *latest, unread) for (user_id, peer_id), (latest, unread) in summaries.items()])
+
+
+def reset_unread(conn, user_id, peer_id, up_to):
+    """
+    Match a conversation's unread count to it being read up to message
+    `up_to`. Read to the end, that is a plain reset; otherwise only the
+    peer's messages after `up_to` are recounted, off the conversation index.
+    """
+    conn.execute('''
+        UPDATE conversation_summary
+        SET unread = CASE WHEN last_message_id <= :up_to THEN 0 ELSE min(unread, (
+            SELECT count(*) FROM messages
+            WHERE conv_lo = min(:user, :peer) AND conv_hi = max(:user, :peer)
+              AND id > :up_to AND from_user_id = :peer
+        )) END
+        WHERE user_id = :user AND peer_id = :peer AND unread > 0
+    ''', {"user": user_id, "peer": peer_id, "up_to": up_to})
+
+
+def fetch_inbox(user_id, limit, before=None):
+    """
+    A page of `user_id`'s conversations, most recent first, continuing
+    below the `before` message id. Returns (conversations, next_cursor).
+    """
+    with db_connection() as conn:
+        rows = conn.execute('''
+            SELECT s.peer_id, u.name AS peer_name, s.last_message_id, s.last_from_user_id,
+                   s.preview, s.last_timestamp, s.unread
+            FROM conversation_summary s JOIN users u ON u.id = s.peer_id
+            WHERE s.user_id = ? AND s.last_message_id < ?
+            ORDER BY s.last_message_id DESC LIMIT ?
+        ''', (user_id, before if before is not None else 2 ** 63 - 1, limit)).fetchall()
+
+    conversations = [{
+        "peer_id": row["peer_id"],
+        "peer_name": row["peer_name"],
+        "unread": row["unread"],
+        "last_message": {
+            "id": row["last_message_id"],
+            "from": 'me' if row["last_from_user_id"] == user_id else 'them',
+            "text": row["preview"],
+            "timestamp": row["last_timestamp"]
+        }
+    } for row in rows]
+    next_cursor = rows[-1]["last_message_id"] if len(rows) == limit else None
+    return conversations, next_cursor
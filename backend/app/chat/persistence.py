@@ -0,0 +1,202 @@
+import atexit
+import logging
+import time
+
+from eventlet import queue, semaphore
+
+from app.chat.attachments import record_shares
+from app.chat.codec import codec
+from app.chat.delivery import claim_undelivered, record_live_deliveries
+from app.chat.groups import conversation_room
+from app.chat.inbox import update_summaries
+from app.chat.presence import presence, user_room
+from app.database import db_connection
+from app.http_cache import GROUP_MESSAGES, INBOX, conversation, response_cache
+from app.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+commit_duration = metrics.histogram(
+    "eirem_message_batch_commit_seconds", "Time to insert and commit one batch of messages")
+
+
+class MessageWriter:
+    """
+    Write-behind persistence for chat messages.
+
+    Handlers `submit()` a message and deliver it right away under a `key`;
+    a background greenlet drains the queue and commits everything that
+    arrived within one batch window in a single transaction, then acks
+    each sender with the id its message was assigned and tells the
+    recipients which id each key got, so `resume` can pick up from any
+    message a client saw.
+    """
+
+    def __init__(self):
+        self.batch_interval = 0.02
+        self.batch_size = 200
+        self.submit_timeout = 0.5
+        self.socketio = None
+        self._queue = queue.LightQueue(maxsize=10000)
+        self._in_flight = semaphore.Semaphore()
+        self._running = False
+
+    def init_app(self, app, socketio):
+        self.batch_interval = app.config["MESSAGE_BATCH_INTERVAL_MS"] / 1000
+        self.batch_size = app.config["MESSAGE_BATCH_SIZE"]
+        self.submit_timeout = app.config["MESSAGE_QUEUE_TIMEOUT"]
+        self._queue = queue.LightQueue(maxsize=app.config["MESSAGE_QUEUE_SIZE"])
+        self.socketio = socketio
+        if not self._running:
+            self._running = True
+            socketio.start_background_task(self._run)
+            atexit.register(self.stop)
+
+    def submit(self, message):
+        """
+        Queue a message for persistence.
+
+        When the queue is full the caller waits up to `submit_timeout`
+        seconds for room; returns False if there still is none, so the
+        handler can refuse the message instead of buffering without bound.
+        """
+        try:
+            self._queue.put(message, timeout=self.submit_timeout)
+            return True
+        except queue.Full:
+            return False
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def _next_batch(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.batch_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while self._running:
+            first = self._queue.get()
+            # Held until the batch is committed, so flush() can wait for it
+            with self._in_flight:
+                self._commit(self._next_batch(first))
+
+    def _commit(self, batch):
+        started = time.perf_counter()
+        try:
+            with db_connection() as conn:
+                for message in batch:
+                    if "conversation" in message:
+                        # Stored once for the whole group, however many members it has
+                        cursor = conn.execute('''
+                            INSERT INTO group_messages (conversation_id, from_user_id, text, timestamp, attachment_id)
+                            VALUES (?, ?, ?, ?, ?)
+                        ''', (message["conversation"], message["from"], message["text"], message["timestamp"],
+                              message.get("attachment")))
+                    else:
+                        cursor = conn.execute('''
+                            INSERT INTO messages (from_user_id, to_user_id, text, timestamp, delivered, attachment_id)
+                            VALUES (?, ?, ?, ?, ?, ?)
+                        ''', (message["from"], message["to"], message["text"], message["timestamp"],
+                              1 if message.get("delivered") else 0, message.get("attachment")))
+                    message["id"] = cursor.lastrowid
+                record_live_deliveries(conn, batch)
+                update_summaries(conn, batch)
+                record_shares(conn, batch)
+        except Exception:
+            logger.exception("Failed to commit batch of %d messages", len(batch))
+            for message in batch:
+                self._notify(message, "message_error", {
+                    "clientId": message.get("clientId"),
+                    "message": "Message could not be saved"
+                })
+            return
+
+        commit_duration.observe(time.perf_counter() - started)
+        response_cache.bump(*{
+            (GROUP_MESSAGES, message["conversation"]) if "conversation" in message
+            else conversation(message["from"], message["to"])
+            for message in batch
+        }, *{
+            (INBOX, int(user_id))
+            for message in batch if "conversation" not in message
+            for user_id in (message["from"], message["to"])
+        })
+        logger.debug("Committed batch of %d messages", len(batch))
+        self._send_ids(batch)
+        self._deliver_late(batch)
+        for message in batch:
+            if "conversation" in message:
+                recipient = {"conversationId": message["conversation"]}
+            else:
+                recipient = {"to": message["to"]}
+            self._notify(message, "message_ack", {
+                "id": message["id"],
+                "clientId": message.get("clientId"),
+                **recipient,
+                "timestamp": message["timestamp"]
+            })
+
+    def _send_ids(self, batch):
+        """Tell recipients that got a message live the id it was committed as, one event per room."""
+        if self.socketio is None:
+            return
+        ids = {}  # room -> {key: id}
+        for message in batch:
+            if "conversation" in message:
+                room = conversation_room(message["conversation"])
+            elif message.get("delivered"):
+                room = user_room(message["to"])
+            else:
+                continue
+            ids.setdefault(room, {})[message["key"]] = message["id"]
+        for room, keys in ids.items():
+            codec.emit_to_room("message_ids", {"ids": keys}, room)
+
+    def _deliver_late(self, batch):
+        """Push messages stored for an offline recipient who has connected since (on any worker)."""
+        if self.socketio is None:
+            return
+        late = [message["id"] for message in batch
+                if "conversation" not in message and not message.get("delivered") and presence.is_online(message["to"])]
+        for message in claim_undelivered(late):
+            codec.emit_to_user("private_message", message, message.pop("to"))
+
+    def _notify(self, message, event, payload):
+        if self.socketio is not None and message.get("sid"):
+            codec.emit_to_sid(event, payload, message["sid"])
+
+    def flush(self):
+        """
+        Commit everything currently queued on the calling greenlet, after
+        waiting for any batch the writer is in the middle of.
+        """
+        with self._in_flight:
+            batch = []
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+                if len(batch) >= self.batch_size:
+                    self._commit(batch)
+                    batch = []
+            if batch:
+                self._commit(batch)
+
+    def stop(self):
+        """Stop the writer and persist whatever is still queued."""
+        self._running = False
+        self.socketio = None  # the server is going away; skip the acks
+        self.flush()
+
+
+message_writer = MessageWriter()
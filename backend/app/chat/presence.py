@@ -0,0 +1,126 @@
+import logging
+import time
+
+from app.chat.broker import presence_store_for
+
+logger = logging.getLogger(__name__)
+
+
+def user_room(user_id):
+    """Socket.IO room every session of `user_id` joins on connect."""
+    return f"user:{user_id}"
+
+
+class PresenceRegistry:
+    """
+    Tracks which socket sessions belong to which user.
+
+    Both directions are indexed (user -> set of sids, sid -> user) so
+    connects, disconnects and lookups are O(1) regardless of how many
+    users are online, and a user can have several tabs/devices at once.
+
+    With a message queue configured the sessions of this worker are also
+    mirrored into a shared store, so online checks see every worker.
+    """
+
+    HEARTBEAT_INTERVAL = 10
+    TOUCH_INTERVAL = 30  # min seconds between shared last-seen writes per user
+
+    def __init__(self):
+        self._sids_by_user = {}
+        self._user_by_sid = {}
+        self._last_seen = {}
+        self._last_shared_touch = {}
+        self.shared = None
+
+    def init_app(self, app, socketio):
+        url = app.config.get("SOCKETIO_MESSAGE_QUEUE")
+        if url and self.shared is None:
+            self.shared = presence_store_for(url)
+            self.shared.heartbeat()
+            socketio.start_background_task(self._heartbeat, socketio)
+
+    def _heartbeat(self, socketio):
+        while True:
+            socketio.sleep(self.HEARTBEAT_INTERVAL)
+            try:
+                self.shared.heartbeat()
+            except Exception as e:
+                logger.warning("Heartbeat failed: %s", e)
+
+    def _publish(self, user_id, now):
+        if self.shared is not None:
+            self.shared.set_sessions(user_id, len(self._sids_by_user.get(user_id, ())))
+            self.shared.seen(user_id, now)
+            self._last_shared_touch[user_id] = now
+
+    def add(self, user_id, sid):
+        user_id = str(user_id)
+        self._sids_by_user.setdefault(user_id, set()).add(sid)
+        self._user_by_sid[sid] = user_id
+        now = self._last_seen[user_id] = time.time()
+        self._publish(user_id, now)
+
+    def remove(self, sid):
+        """Forget `sid`; returns its user id, or None if it was unknown."""
+        user_id = self._user_by_sid.pop(sid, None)
+        if user_id is None:
+            return None
+        sids = self._sids_by_user.get(user_id)
+        if sids is not None:
+            sids.discard(sid)
+            if not sids:
+                del self._sids_by_user[user_id]
+        now = self._last_seen[user_id] = time.time()
+        self._publish(user_id, now)
+        return user_id
+
+    def touch(self, user_id):
+        """Record activity from an online user."""
+        user_id = str(user_id)
+        now = self._last_seen[user_id] = time.time()
+        if self.shared is not None and now - self._last_shared_touch.get(user_id, 0) > self.TOUCH_INTERVAL:
+            self.shared.seen(user_id, now)
+            self._last_shared_touch[user_id] = now
+
+    def user_for(self, sid):
+        return self._user_by_sid.get(sid)
+
+    def sids(self, user_id):
+        """Sessions of `user_id` connected to this worker."""
+        return set(self._sids_by_user.get(str(user_id), ()))
+
+    def is_online(self, user_id):
+        user_id = str(user_id)
+        if user_id in self._sids_by_user:
+            return True
+        return self.shared is not None and bool(self.shared.online([user_id]))
+
+    def last_seen(self, user_id):
+        return self.status([user_id])[str(user_id)]["lastSeen"]
+
+    def status(self, user_ids):
+        """Bulk online/last-seen lookup for a list of user ids."""
+        user_ids = [str(user_id) for user_id in user_ids]
+        if self.shared is not None:
+            online = self.shared.online(user_ids)
+            last_seen = self.shared.last_seen(user_ids)
+        else:
+            online = self._sids_by_user
+            last_seen = self._last_seen
+        return {
+            user_id: {
+                "online": user_id in online or user_id in self._sids_by_user,
+                "lastSeen": max(last_seen.get(user_id) or 0, self._last_seen.get(user_id) or 0) or None
+            }
+            for user_id in user_ids
+        }
+
+    def session_count(self):
+        return len(self._user_by_sid)
+
+    def user_count(self):
+        return len(self._sids_by_user)
+
+
+presence = PresenceRegistry()
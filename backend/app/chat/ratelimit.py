@@ -0,0 +1,212 @@
+import functools
+import logging
+import time
+
+from app.chat.presence import presence
+from app.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+ALL_EVENTS = "*"
+INBOUND = "!inbound"
+EXEMPT_EVENTS = frozenset({"connect", "disconnect"})
+
+# event -> (tokens per second, burst). ALL_EVENTS is a second bucket per
+# user that every event also draws from; INBOUND paces each session's
+# incoming packets before they are even decoded.
+DEFAULT_LIMITS = {
+    ALL_EVENTS: (100, 200),
+    INBOUND: (200, 400),
+    "private_message": (10, 30),
+    "group_message": (10, 30),
+    "attachment_start": (2, 10),
+    "attachment_chunk": (20, 40),
+    "resume": (1, 5),
+    "read": (20, 50),
+    "screen-sharing-started": (2, 5),
+    "screen-sharing-stopped": (2, 5),
+    "screen-share-offer": (2, 5),
+    "screen-share-answer": (2, 5),
+    "ice-candidate": (50, 100),
+    "ice-candidates": (10, 30),
+}
+DEFAULT_EVENT_LIMIT = (20, 50)
+
+throttled_events = metrics.counter(
+    "eirem_socketio_throttled_total", "Socket.IO events rejected by the rate limiter", ("event",))
+paced_packets = metrics.counter(
+    "eirem_socketio_paced_packets_total", "Incoming packets whose session had to wait for inbound budget")
+send_overflows = metrics.counter(
+    "eirem_socketio_send_overflow_total", "Sessions dropped because their outbound buffer was full")
+
+
+class RateLimiter:
+    """
+    Admission control for Socket.IO events.
+
+    Each user (or session, before it is bound to one) gets a token bucket
+    per event plus one shared by all events. A bucket is a (tokens,
+    updated_at) tuple in a flat dict and is refilled lazily when used;
+    buckets idle long enough to be full again are swept, since a missing
+    bucket means the same thing. Rejected events are acked with
+    `{"error": "throttled", "retryAfter": seconds}`, and the session gets
+    one `throttled` event each time it starts being throttled.
+
+    Rejecting an event still means decoding it, and a session's reader
+    greenlet decodes without yielding for as long as the socket has data,
+    so a flood would still hold the hub. Each session's incoming packets
+    are therefore also paced: past its INBOUND budget the reader sleeps,
+    which stops reading that socket and lets TCP push back on the client.
+
+    Outbound, each session's Engine.IO queue is capped at `send_buffer`
+    packets. A session that falls that far behind is disconnected instead
+    of buffering without bound; its client reconnects and `resume`s from
+    the messages already persisted.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.limits = dict(DEFAULT_LIMITS)
+        self.send_buffer = 1000
+        self.sweep_interval = 60
+        self.socketio = None
+        self._buckets = {}       # (user or sid, event) -> (tokens, updated_at)
+        self._throttled = set()  # bucket keys rejected since their last admit
+        self._closing = set()    # engine.io sids being dropped for overflow
+
+    def init_app(self, app, socketio):
+        self.enabled = app.config["SOCKETIO_RATE_LIMITS_ENABLED"]
+        self.limits = {**DEFAULT_LIMITS, **app.config["SOCKETIO_RATE_LIMITS"]}
+        self.send_buffer = app.config["SOCKETIO_SEND_BUFFER"]
+        self.sweep_interval = app.config["SOCKETIO_RATE_LIMIT_SWEEP"]
+        self.socketio = socketio
+        if self.enabled:
+            socketio.start_background_task(self._sweep_forever)
+
+    def _take(self, key, rate, burst, now):
+        """Take a token from one bucket; returns 0, or seconds until one is available."""
+        tokens, updated = self._buckets.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        if tokens < 1:
+            self._buckets[key] = (tokens, now)
+            return (1 - tokens) / rate
+        self._buckets[key] = (tokens - 1, now)
+        return 0
+
+    def admit(self, sid, event):
+        """Returns 0 if `sid` may handle `event` now, else seconds to wait."""
+        owner = presence.user_for(sid) or sid
+        now = time.monotonic()
+        key = (owner, event)
+        rate, burst = self.limits.get(event, DEFAULT_EVENT_LIMIT)
+        wait = self._take(key, rate, burst, now)
+        if not wait:
+            rate, burst = self.limits[ALL_EVENTS]
+            wait = self._take((owner, ALL_EVENTS), rate, burst, now)
+        if not wait:
+            self._throttled.discard(key)
+            return 0
+
+        throttled_events.inc((event,))
+        if key not in self._throttled:
+            self._throttled.add(key)
+            logger.info("Throttling %s from %s", event, owner)
+            self.socketio.emit("throttled", {"event": event, "retryAfter": round(wait, 3)}, to=sid)
+        return wait
+
+    def pace(self, eio_sid):
+        """Block the calling reader until session `eio_sid` may send another packet."""
+        rate, burst = self.limits[INBOUND]
+        wait = self._take((eio_sid, INBOUND), rate, burst, time.monotonic())
+        if wait:
+            paced_packets.inc()
+        while wait:
+            self.socketio.sleep(wait)
+            wait = self._take((eio_sid, INBOUND), rate, burst, time.monotonic())
+
+    def sweep(self, now=None):
+        """Drop buckets that have refilled; returns how many were dropped."""
+        now = time.monotonic() if now is None else now
+        full = []
+        for key, (tokens, updated) in self._buckets.items():
+            rate, burst = self.limits.get(key[1], DEFAULT_EVENT_LIMIT)
+            if tokens + (now - updated) * rate >= burst:
+                full.append(key)
+        for key in full:
+            del self._buckets[key]
+            self._throttled.discard(key)
+        return len(full)
+
+    def _sweep_forever(self):
+        while True:
+            self.socketio.sleep(self.sweep_interval)
+            self.sweep()
+
+    def bucket_count(self):
+        return len(self._buckets)
+
+    def protect(self, socketio):
+        """
+        Put every registered event handler behind `admit()`, pace incoming
+        packets and cap the outbound buffers; call after registering the
+        handlers.
+        """
+        if not self.enabled:
+            return
+        for handlers in socketio.server.handlers.values():
+            for event, handler in handlers.items():
+                if event not in EXEMPT_EVENTS and not getattr(handler, "_limited", False):
+                    handlers[event] = self._limit_event(event, handler)
+
+        eio = socketio.server.eio
+        receive = eio.handlers["message"]
+
+        @functools.wraps(receive)
+        def paced_receive(eio_sid, data):
+            self.pace(eio_sid)
+            return receive(eio_sid, data)
+
+        eio.handlers["message"] = paced_receive
+
+        send_packet = eio.send_packet
+
+        @functools.wraps(send_packet)
+        def bounded_send_packet(eio_sid, pkt):
+            socket = eio.sockets.get(eio_sid)
+            if socket is not None and socket.queue.qsize() >= self.send_buffer:
+                self._overflow(eio, eio_sid, socket)
+                return
+            send_packet(eio_sid, pkt)
+
+        eio.send_packet = bounded_send_packet
+
+    def _limit_event(self, event, handler):
+        @functools.wraps(handler)
+        def limited(sid, *args, **kwargs):
+            wait = self.admit(sid, event)
+            if wait:
+                return {"error": "throttled", "event": event, "retryAfter": round(wait, 3)}
+            return handler(sid, *args, **kwargs)
+
+        limited._limited = True
+        return limited
+
+    def _overflow(self, eio, eio_sid, socket):
+        if eio_sid in self._closing:
+            return
+        self._closing.add(eio_sid)
+        send_overflows.inc()
+        logger.warning("Dropping session %s: %d packets waiting to be sent", eio_sid, socket.queue.qsize())
+
+        # Not inline: this may be in the middle of another handler's room emit
+        def close():
+            try:
+                socket.close(wait=False, abort=True)
+                eio.sockets.pop(eio_sid, None)
+            finally:
+                self._closing.discard(eio_sid)
+
+        self.socketio.start_background_task(close)
+
+
+rate_limiter = RateLimiter()
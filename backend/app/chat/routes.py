@@ -0,0 +1,433 @@
+import logging
+import re
+from flask import Blueprint, current_app, request, jsonify, send_file
+from flask_jwt_extended import jwt_required
+from app.auth.models import get_current_user_id, get_friend_ids
+from app.chat.attachments import UploadRejected, attachment_store, describe
+from app.chat.groups import (
+    GROUP_NAME_MAX_LENGTH, MAX_GROUP_MEMBERS, add_members, create_conversation, get_member_ids,
+    get_role, invalidate_members, join_sessions, leave_sessions, promote_successor, remove_member
+)
+from app.chat.inbox import fetch_inbox
+from app.chat.presence import presence
+from app.database import db_connection
+from app.http_cache import GROUP_MEMBERS, GROUP_MESSAGES, GROUPS, INBOX, response_cache
+
+
+chat_bp = Blueprint('chat', __name__, url_prefix='/api/chat')
+logger = logging.getLogger(__name__)
+
+MAX_PRESENCE_IDS = 1000
+
+@chat_bp.route('/presence', methods=['GET'])
+@jwt_required()
+def get_presence():
+    """
+    Online status and last-seen time for many users in one call.
+
+    Pass `ids=1,2,3` to pick some friends; without it the caller's whole
+    friend list is returned. Ids of users who aren't friends are left out.
+    """
+    ids = request.args.get('ids')
+    requested = None
+    if ids:
+        requested = [uid.strip() for uid in ids.split(',') if uid.strip()]
+        if len(requested) > MAX_PRESENCE_IDS:
+            return jsonify({"success": False, "message": f"At most {MAX_PRESENCE_IDS} ids per request"}), 400
+
+    current_user_id = get_current_user_id()
+    if current_user_id is None:
+        return jsonify({"success": False, "message": "User not found"}), 404
+    user_ids = get_friend_ids(current_user_id)
+    if requested is not None:
+        friends = {str(friend_id) for friend_id in user_ids}
+        user_ids = [uid for uid in requested if uid in friends]
+
+    return jsonify({"success": True, "presence": presence.status(user_ids)})
+
+
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+MAX_SEARCH_TERMS = 8
+
+@chat_bp.route('/messages/search', methods=['GET'])
+@jwt_required()
+def search_messages():
+    """
+    Full-text search over the caller's own conversations.
+
+    Query params: `q` (words; the last one matches as a prefix once it has
+    two characters), optional `with` (restrict to one conversation),
+    `limit` and `offset`. Results are ranked by relevance and carry a
+    highlighted snippet.
+    """
+    words = re.findall(r'\w+', request.args.get('q', '').lower())[:MAX_SEARCH_TERMS]
+    if not words:
+        return jsonify({"success": False, "message": "Search query required"}), 400
+    try:
+        limit = min(int(request.args.get('limit', SEARCH_PAGE_SIZE)), SEARCH_MAX_PAGE_SIZE)
+        offset = int(request.args.get('offset', 0))
+        peer_id = request.args.get('with')
+        peer_id = int(peer_id) if peer_id is not None else None
+    except ValueError:
+        return jsonify({"success": False, "message": "Invalid limit, offset or user id"}), 400
+    if limit <= 0 or offset < 0:
+        return jsonify({"success": False, "message": "Invalid limit or offset"}), 400
+
+    current_user_id = get_current_user_id()
+    if current_user_id is None:
+        return jsonify({"success": False, "message": "User not found"}), 404
+
+    # Scope by participant inside the FTS query itself, so only the
+    # caller's messages are ever ranked
+    terms = ' '.join(f'"{word}"' for word in words)
+    if len(words[-1]) >= 2:
+        terms += '*'
+    if peer_id is None:
+        scope = f'{{from_user_id to_user_id}} : "{current_user_id}"'
+    else:
+        scope = (f'((from_user_id : "{current_user_id}" AND to_user_id : "{peer_id}") OR '
+                 f'(from_user_id : "{peer_id}" AND to_user_id : "{current_user_id}"))')
+    match = f'text : ({terms}) AND {scope}'
+
+    try:
+        with db_connection() as conn:
+            rows = conn.execute('''
+                SELECT m.id, m.from_user_id, m.to_user_id, m.timestamp,
+                       snippet(messages_fts, 0, '<mark>', '</mark>', '…', 12) AS snippet
+                FROM messages_fts
+                JOIN messages m ON m.id = messages_fts.rowid
+                WHERE messages_fts MATCH ?
+                ORDER BY bm25(messages_fts, 1.0, 0.0, 0.0)
+                LIMIT ? OFFSET ?
+            ''', (match, limit + 1, offset)).fetchall()
+    except Exception:
+        logger.exception("Error searching messages")
+        return jsonify({"success": False, "message": "Error searching messages"}), 500
+
+    results = []
+    for row in rows[:limit]:
+        from_me = str(row["from_user_id"]) == str(current_user_id)
+        results.append({
+            "id": row["id"],
+            "from": "me" if from_me else "them",
+            "peer": int(row["to_user_id"] if from_me else row["from_user_id"]),
+            "snippet": row["snippet"],
+            "timestamp": row["timestamp"]
+        })
+
+    next_offset = offset + limit if len(rows) > limit else None
+    return jsonify({"success": True, "results": results, "next_offset": next_offset})
+
+
+CONVERSATIONS_PAGE_SIZE = 50
+CONVERSATIONS_MAX_PAGE_SIZE = 200
+SQLITE_MAX_ROWID = 2 ** 63 - 1
+
+
+def _page_args():
+    """`limit` (clamped) and the `before`/`after` cursors of a keyset-paged request."""
+    before, after = request.args.get('before'), request.args.get('after')
+    before = int(before) if before is not None else None
+    after = int(after) if after is not None else None
+    limit = int(request.args.get('limit', CONVERSATIONS_PAGE_SIZE))
+    if limit <= 0 or (before is not None and after is not None):
+        raise ValueError("invalid page")
+    return min(limit, CONVERSATIONS_MAX_PAGE_SIZE), before, after
+
+
+def _member_id_list(value):
+    if not isinstance(value, list) or len(value) > MAX_GROUP_MEMBERS:
+        return None
+    if not all(isinstance(i, int) and not isinstance(i, bool) for i in value):
+        return None
+    return value
+
+
+@chat_bp.route('/conversations', methods=['POST'])
+@jwt_required()
+def create_group():
+    """
+    Create a group conversation named `name` with the caller as owner and
+    `member_ids` as members, MAX_GROUP_MEMBERS in all counting the owner.
+    Unknown ids are skipped.
+    """
+    data = request.get_json(silent=True) or {}
+    name = data.get('name')
+    member_ids = _member_id_list(data.get('member_ids', []))
+    if not isinstance(name, str) or not name.strip() or len(name) > GROUP_NAME_MAX_LENGTH:
+        return jsonify({"success": False, "message": "Group name required"}), 400
+    if member_ids is None:
+        return jsonify({"success": False, "message": f"member_ids must be at most {MAX_GROUP_MEMBERS} user ids"}), 400
+
+    current_user_id = get_current_user_id()
+    if current_user_id is None:
+        return jsonify({"success": False, "message": "User not found"}), 404
+    member_ids = set(member_ids) - {current_user_id}
+    if len(member_ids) + 1 > MAX_GROUP_MEMBERS:
+        return jsonify({"success": False, "message": f"Groups are limited to {MAX_GROUP_MEMBERS} members"}), 400
+
+    with db_connection() as conn:
+        conversation_id = create_conversation(conn, name.strip(), current_user_id)
+        added = add_members(conn, conversation_id, member_ids)
+
+    members = [current_user_id, *added]
+    join_sessions(conversation_id, members)
+    response_cache.bump(*((GROUPS, user_id) for user_id in members))
+    return jsonify({"success": True, "conversation": {
+        "id": conversation_id, "name": name.strip(), "member_count": len(members)
+    }}), 201
+
+
+@chat_bp.route('/conversations', methods=['GET'])
+@jwt_required()
+@response_cache.cached(lambda me: [(GROUPS, me)])
+def list_groups():
+    """The caller's group conversations by id, paged with `limit` and `after`."""
+    try:
+        limit, _, after = _page_args()
+    except ValueError:
+        return jsonify({"success": False, "message": "Invalid limit or cursor"}), 400
+
+    current_user_id = get_current_user_id()
+    if current_user_id is None:
+        return jsonify({"success": False, "message": "User not found"}), 404
+
+    with db_connection() as conn:
+        rows = conn.execute('''
+            SELECT c.id, c.name, m.role, c.created_at
+            FROM conversation_members m JOIN conversations c ON c.id = m.conversation_id
+            WHERE m.user_id = ? AND m.conversation_id > ?
+            ORDER BY m.conversation_id LIMIT ?
+        ''', (current_user_id, after or 0, limit)).fetchall()
+
+    conversations = [dict(row) for row in rows]
+    next_cursor = conversations[-1]["id"] if len(conversations) == limit else None
+    return jsonify({"success": True, "conversations": conversations, "next_cursor": next_cursor})
+
+
+@chat_bp.route('/conversations/<int:conversation_id>/members', methods=['GET'])
+@jwt_required()
+@response_cache.cached(lambda me, conversation_id: [(GROUP_MEMBERS, conversation_id)])
+def list_group_members(conversation_id):
+    """Members of a conversation the caller is in, by user id, paged with `limit` and `after`."""
+    try:
+        limit, _, after = _page_args()
+    except ValueError:
+        return jsonify({"success": False, "message": "Invalid limit or cursor"}), 400
+
+    current_user_id = get_current_user_id()
+    if current_user_id not in get_member_ids(conversation_id):
+        return jsonify({"success": False, "message": "Conversation not found"}), 404
+
+    with db_connection() as conn:
+        rows = conn.execute('''
+            SELECT u.id, u.name, m.role
+            FROM conversation_members m JOIN users u ON u.id = m.user_id
+            WHERE m.conversation_id = ? AND m.user_id > ?
+            ORDER BY m.user_id LIMIT ?
+        ''', (conversation_id, after or 0, limit)).fetchall()
+
+    members = [dict(row) for row in rows]
+    next_cursor = members[-1]["id"] if len(members) == limit else None
+    return jsonify({"success": True, "members": members, "next_cursor": next_cursor})
+
+
+@chat_bp.route('/conversations/<int:conversation_id>/members', methods=['POST'])
+@jwt_required()
+def add_group_members(conversation_id):
+    """The owner adds `user_ids` to a conversation; returns the ids that were added."""
+    data = request.get_json(silent=True) or {}
+    user_ids = _member_id_list(data.get('user_ids'))
+    if not user_ids:
+        return jsonify({"success": False, "message": f"user_ids must be 1-{MAX_GROUP_MEMBERS} user ids"}), 400
+
+    current_user_id = get_current_user_id()
+    with db_connection() as conn:
+        role = get_role(conn, conversation_id, current_user_id)
+        if role is None:
+            return jsonify({"success": False, "message": "Conversation not found"}), 404
+        if role != 'owner':
+            return jsonify({"success": False, "message": "Only the owner can add members"}), 403
+        count = conn.execute("SELECT count(*) FROM conversation_members WHERE conversation_id = ?",
+                             (conversation_id,)).fetchone()[0]
+        if count + len(user_ids) > MAX_GROUP_MEMBERS:
+            return jsonify({"success": False, "message": f"Groups are limited to {MAX_GROUP_MEMBERS} members"}), 400
+        added = add_members(conn, conversation_id, user_ids)
+
+    if added:
+        invalidate_members(conversation_id)
+        join_sessions(conversation_id, added)
+        response_cache.bump((GROUP_MEMBERS, conversation_id), *((GROUPS, user_id) for user_id in added))
+    return jsonify({"success": True, "added": added})
+
+
+@chat_bp.route('/conversations/<int:conversation_id>/members/<int:user_id>', methods=['DELETE'])
+@jwt_required()
+def remove_group_member(conversation_id, user_id):
+    """
+    Leave a conversation, or (as its owner) remove someone from it. An
+    owner who leaves hands the group to its longest-standing member.
+    """
+    current_user_id = get_current_user_id()
+    with db_connection() as conn:
+        role = get_role(conn, conversation_id, current_user_id)
+        if role is None:
+            return jsonify({"success": False, "message": "Conversation not found"}), 404
+        if user_id != current_user_id and role != 'owner':
+            return jsonify({"success": False, "message": "Only the owner can remove members"}), 403
+        if not remove_member(conn, conversation_id, user_id):
+            return jsonify({"success": False, "message": "Not a member"}), 404
+        successor = None
+        if user_id == current_user_id and role == 'owner':
+            successor = promote_successor(conn, conversation_id)
+
+    invalidate_members(conversation_id)
+    leave_sessions(conversation_id, [user_id])
+    response_cache.bump((GROUP_MEMBERS, conversation_id), (GROUPS, user_id),
+                        *([(GROUPS, successor)] if successor is not None else []))
+    return jsonify({"success": True})
+
+
+@chat_bp.route('/conversations/<int:conversation_id>/messages', methods=['GET'])
+@jwt_required()
+@response_cache.cached(lambda me, conversation_id: [(GROUP_MESSAGES, conversation_id), (GROUP_MEMBERS, conversation_id)])
+def get_group_history(conversation_id):
+    """
+    A page of a group conversation's messages, with the same `limit`,
+    `before`/`after` and `next_cursor` semantics as a one-to-one history.
+    """
+    try:
+        limit, before, after = _page_args()
+    except ValueError:
+        return jsonify({"success": False, "message": "Invalid limit or cursor"}), 400
+
+    current_user_id = get_current_user_id()
+    if current_user_id not in get_member_ids(conversation_id):
+        return jsonify({"success": False, "message": "Conversation not found"}), 404
+
+    if after is not None:
+        query = ('SELECT * FROM group_messages WHERE conversation_id = ? AND id > ? ORDER BY id ASC LIMIT ?',
+                 (conversation_id, after, limit))
+    else:
+        query = ('SELECT * FROM group_messages WHERE conversation_id = ? AND id < ? ORDER BY id DESC LIMIT ?',
+                 (conversation_id, before if before is not None else SQLITE_MAX_ROWID, limit))
+    with db_connection() as conn:
+        messages = [{
+            "id": row["id"],
+            "from": row["from_user_id"],
+            "text": row["text"],
+            "timestamp": row["timestamp"],
+            "attachment_id": row["attachment_id"]
+        } for row in conn.execute(*query)]
+
+    next_cursor = messages[-1]["id"] if len(messages) == limit else None
+    if after is None:
+        messages.reverse()
+    return jsonify({"success": True, "messages": messages, "next_cursor": next_cursor})
+
+
+@chat_bp.route('/inbox', methods=['GET'])
+@jwt_required()
+@response_cache.cached(lambda me: [(INBOX, me)])
+def get_inbox():
+    """
+    The caller's one-to-one conversations, most recent first: the peer,
+    a preview of the last message and the unread count. Paged with
+    `limit` and `before` (the `next_cursor` of the previous page).
+    """
+    try:
+        limit, before, after = _page_args()
+    except ValueError:
+        return jsonify({"success": False, "message": "Invalid limit or cursor"}), 400
+    if after is not None:
+        return jsonify({"success": False, "message": "The inbox pages with before only"}), 400
+
+    current_user_id = get_current_user_id()
+    if current_user_id is None:
+        return jsonify({"success": False, "message": "User not found"}), 404
+
+    conversations, next_cursor = fetch_inbox(current_user_id, limit, before)
+    return jsonify({"success": True, "conversations": conversations, "next_cursor": next_cursor})
+
+
+ATTACHMENT_CACHE_SECONDS = 365 * 24 * 3600  # blobs are content-addressed, so never change
+
+
+@chat_bp.route('/attachments', methods=['POST'])
+@jwt_required()
+def create_attachment():
+    """
+    Start an upload of `size` bytes named `name`. The response carries its
+    `id` and `chunk_size`; send chunk n as PUT /attachments/<id>/chunks/<n>
+    (or the attachment_chunk socket event), then reference the id as a
+    message's `attachmentId`.
+    """
+    data = request.get_json(silent=True) or {}
+    current_user_id = get_current_user_id()
+    if current_user_id is None:
+        return jsonify({"success": False, "message": "User not found"}), 404
+    try:
+        upload = attachment_store.create(current_user_id, data.get('name'), data.get('size'), data.get('content_type'))
+    except UploadRejected as e:
+        return jsonify({"success": False, "message": str(e)}), e.status
+    return jsonify({"success": True, "attachment": upload}), 201
+
+
+@chat_bp.route('/attachments/<int:attachment_id>', methods=['GET'])
+@jwt_required()
+def get_attachment(attachment_id):
+    """An attachment's metadata; for the uploader, also how far an upload got, to resume from `received`."""
+    current_user_id = get_current_user_id()
+    upload = attachment_store.status(current_user_id, attachment_id)
+    if upload is None:
+        with db_connection() as conn:
+            row = attachment_store.readable(conn, attachment_id, current_user_id)
+        if row is None:
+            return jsonify({"success": False, "message": "Attachment not found"}), 404
+        upload = describe(row)
+    return jsonify({"success": True, "attachment": upload})
+
+
+@chat_bp.route('/attachments/<int:attachment_id>/chunks/<int:index>', methods=['PUT'])
+@jwt_required()
+def put_attachment_chunk(attachment_id, index):
+    """Chunk `index` of an upload as the raw request body, streamed to disk as it arrives."""
+    if request.content_length is None:
+        return jsonify({"success": False, "message": "Content-Length required"}), 411
+    try:
+        upload = attachment_store.write_chunk(get_current_user_id(), attachment_id, index, request.stream,
+                                              request.content_length, "http")
+    except UploadRejected as e:
+        return jsonify({"success": False, "message": str(e), "received": e.received}), e.status
+    return jsonify({"success": True, "attachment": upload})
+
+
+@chat_bp.route('/attachments/<int:attachment_id>/content', methods=['GET'])
+@jwt_required()
+def download_attachment(attachment_id):
+    """
+    The file itself, with Range and If-None-Match support. With
+    ATTACHMENT_ACCEL_REDIRECT set, the front-end server sends it instead.
+    """
+    with db_connection() as conn:
+        row = attachment_store.readable(conn, attachment_id, get_current_user_id())
+    if row is None:
+        return jsonify({"success": False, "message": "Attachment not found"}), 404
+
+    sha256 = row["sha256"]
+    if attachment_store.accel_redirect:
+        response = current_app.response_class(mimetype=row["content_type"])
+        response.headers["X-Accel-Redirect"] = f"{attachment_store.accel_redirect.rstrip('/')}/{sha256[:2]}/{sha256}"
+        response.headers.set("Content-Disposition", "attachment", filename=row["name"])
+    else:
+        # Full responses go out through the server's wsgi.file_wrapper
+        # (sendfile under gunicorn); ranges are read and copied
+        response = send_file(attachment_store.blob_path(sha256), mimetype=row["content_type"],
+                             as_attachment=True, download_name=row["name"], conditional=True,
+                             etag=sha256, max_age=None)
+    response.cache_control.no_cache = None
+    response.cache_control.private = True
+    response.cache_control.max_age = ATTACHMENT_CACHE_SECONDS
+    response.cache_control.immutable = True
+    return response
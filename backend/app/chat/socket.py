@@ -1,147 +1,376 @@
+import logging
 from flask_socketio import emit, join_room, leave_room
-from flask_jwt_extended import decode_token
 from flask import request
+import io
 import time
-from app.database import get_db_connection
+import uuid
+from app.auth.models import get_user
+from app.auth.tokens import verify_token
+from app.chat.attachments import UploadRejected, attachment_store
+from app.chat.codec import binary_room, codec, decoded
+from app.chat.delivery import fetch_group_missed, fetch_missed, mark_read
+from app.chat.groups import conversation_ids_of, conversation_room, get_member_ids
+from app.chat.persistence import message_writer
+from app.chat.presence import presence, user_room
+from app.database import db_connection
+from app.http_cache import INBOX, response_cache
+from app.log import SAMPLED, Redacted
+from app.video.signaling import (
+    MAX_CANDIDATES_PER_EVENT, candidate_batcher, validate_candidate, validate_description
+)
 
-connected_users = {}  # Maps user_id to socket session ID
+logger = logging.getLogger(__name__)
+
+MAX_MESSAGE_LENGTH = 10000
+
+def send_missed_messages(user_id, since=None):
+    """Emit messages the current session missed, in batches; returns the final seq."""
+    total, more = 0, True
+    while more:
+        messages, seq, more = fetch_missed(user_id, since)
+        if messages or since is not None:
+            codec.emit_to_sid("missed_messages", {"messages": messages, "seq": seq, "more": more}, request.sid)
+        total += len(messages)
+        if since is not None:
+            since = seq
+    if total:
+        logger.info("Delivered %d missed messages to user %s", total, user_id)
+    return seq
+
+def send_missed_group_messages(conversation_id, since):
+    """Emit a group's messages after `since` to the current session, in batches; returns the final seq."""
+    more = True
+    while more:
+        messages, since, more = fetch_group_missed(conversation_id, since)
+        codec.emit_to_sid("missed_messages", {
+            "conversationId": conversation_id, "messages": messages, "seq": since, "more": more
+        }, request.sid)
+    return since
+
+def resolve_attachment(user_id, value):
+    """(attachment id, None) for an attachment `user_id` may send, (None, None) for none, else (None, error)."""
+    if value is None:
+        return None, None
+    if not isinstance(value, int) or isinstance(value, bool):
+        return None, "attachmentId must be an upload id"
+    with db_connection() as conn:
+        if attachment_store.readable(conn, value, int(user_id)) is None:
+            return None, "Attachment not found or not uploaded yet"
+    return value, None
 
 def register_socketio_events(socketio):
 
     @socketio.on('connect')
     def handle_connect():
-        print(f"[Socket] New connection from {request.sid}")
+        logger.debug("New connection from %s", request.sid)
         token = request.args.get("token")
-        user_id = request.args.get("userId")
-        
-        if not token or not user_id:
-            print("[Socket] No token or userId provided")
+        claimed_user_id = request.args.get("userId")
+
+        if not token:
+            logger.info("Connection rejected: no token provided")
             return False
 
         try:
-            # Just validate the token, don't use its contents
-            decode_token(token)
-            connected_users[str(user_id)] = request.sid
-            join_room(request.sid)
-            print(f"[Socket] User {user_id} connected with SID {request.sid}")
+            # The session belongs to whoever the token was issued to;
+            # userId is optional and only checked against it
+            user_id, _ = verify_token(token)
+            if user_id is None:
+                logger.info("Connection rejected: token for an unknown user")
+                return False
+            user_id = str(user_id)
+            if claimed_user_id is not None and claimed_user_id != user_id:
+                logger.info("Connection rejected: userId %s does not match token", claimed_user_id)
+                return False
+            if get_user(user_id) is None:
+                logger.info("Connection rejected: unknown user %s", user_id)
+                return False
+            presence.add(user_id, request.sid)
+            requested_codec = request.args.get("codec")
+            if requested_codec:
+                emit("codec", {"codec": codec.negotiate(request.sid, requested_codec)})
+            join_room(codec.room_for(user_id, request.sid))
+            for conversation_id in conversation_ids_of(user_id):
+                join_room(codec.session_room(conversation_room(conversation_id), request.sid))
+            logger.info("User %s connected with SID %s", user_id, request.sid)
+
+            # Commit anything sent while the user was offline, then push it in one go
+            message_writer.flush()
+            send_missed_messages(user_id)
             return True
             
         except Exception as e:
-            print(f"[Socket] Token validation failed: {e}")
+            logger.info("Token validation failed: %s", e)
             return False
 
     @socketio.on('disconnect')
     def handle_disconnect():
-        user_id = None
-        for uid, sid in connected_users.items():
-            if sid == request.sid:
-                user_id = uid
-                break
+        user_id = presence.remove(request.sid)
+        codec.forget(request.sid)
         if user_id:
-            del connected_users[user_id]
-            print(f"[Socket] User {user_id} disconnected")
+            logger.info("User %s disconnected", user_id)
 
     @socketio.on('private_message')
+    @decoded
     def handle_private_message(data):
         """Handle private messages between users"""
-        print(f"[Socket] Received private_message data: {data}")
+        logger.debug("Received private_message %s", Redacted(data), extra=SAMPLED)
 
         try:
-            from_user_id = str(data['from'])
+            # Senders are who their session's token says they are
+            from_user_id = presence.user_for(request.sid)
+            if from_user_id is None:
+                return {"error": "Not connected"}
+            if str(data.get('from', from_user_id)) != from_user_id:
+                return {"error": "Cannot send as another user"}
             to_user_id = str(data['to'])
-            text = data['text']
+            attachment_id, error = resolve_attachment(from_user_id, data.get('attachmentId'))
+            if error:
+                return {"error": error}
+            text = data['text'] if attachment_id is None else data.get('text', '')
+            if not isinstance(text, str) or len(text) > MAX_MESSAGE_LENGTH:
+                return {"error": f"Text must be a string of at most {MAX_MESSAGE_LENGTH} characters; send files as attachments"}
             timestamp = int(time.time())
+            presence.touch(from_user_id)
+            recipient_online = presence.is_online(to_user_id)
+            key = uuid.uuid4().hex
+
+            # Queue for the batched writer; it acks the sender with the id and
+            # tells the recipient which id the message it already has got
+            queued = message_writer.submit({
+                "key": key,
+                "from": from_user_id,
+                "to": to_user_id,
+                "text": text,
+                "timestamp": timestamp,
+                "clientId": data.get('clientId'),
+                "sid": request.sid,
+                "delivered": recipient_online,
+                "attachment": attachment_id
+            })
+            if not queued:
+                logger.warning("Message queue full, rejecting message")
+                return {"error": "Server busy, message not sent"}
 
-            # Store message in database
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO messages (from_user_id, to_user_id, text, timestamp)
-                VALUES (?, ?, ?, ?)
-            ''', (from_user_id, to_user_id, text, timestamp))
-            conn.commit()
-            conn.close()
-
-            if to_user_id in connected_users:
-                emit("private_message", {
-                    "from": from_user_id,
-                    "text": text,
-                    "timestamp": timestamp
-                }, room=connected_users[to_user_id])
-                print(f"[Socket] Sent message to user {to_user_id}")
+            if recipient_online:
+                payload = {"key": key, "from": from_user_id, "text": text, "timestamp": timestamp}
+                if attachment_id is not None:
+                    payload["attachmentId"] = attachment_id
+                codec.emit_to_user("private_message", payload, to_user_id)
+                logger.debug("Sent message to user %s", to_user_id, extra=SAMPLED)
             else:
-                print(f"[Socket] User {to_user_id} is offline, message stored")
+                logger.debug("User %s is offline, message stored", to_user_id, extra=SAMPLED)
+
+            return {"queued": True, "clientId": data.get('clientId')}
 
         except Exception as e:
-            print(f"[Socket] Error handling private_message: {e}")
+            logger.exception("Error handling private_message")
             emit("error", {"message": str(e)})
+            return {"error": str(e)}
+
+    @socketio.on('group_message')
+    @decoded
+    def handle_group_message(data):
+        """Send a message to every member of a group conversation"""
+        from_user_id = presence.user_for(request.sid)
+        if from_user_id is None:
+            return {"error": "Not connected"}
+        try:
+            conversation_id = int(data['conversationId'])
+        except (KeyError, TypeError, ValueError):
+            return {"error": "conversationId and text required"}
+        attachment_id, error = resolve_attachment(from_user_id, data.get('attachmentId'))
+        if error:
+            return {"error": error}
+        text = data.get('text', '')
+        if not isinstance(text, str) or not (text or attachment_id) or len(text) > MAX_MESSAGE_LENGTH:
+            return {"error": f"conversationId and text (at most {MAX_MESSAGE_LENGTH} characters) required"}
+        if int(from_user_id) not in get_member_ids(conversation_id):
+            return {"error": "Not a member of this conversation"}
+
+        timestamp = int(time.time())
+        presence.touch(from_user_id)
+        key = uuid.uuid4().hex
+        queued = message_writer.submit({
+            "key": key,
+            "conversation": conversation_id,
+            "from": from_user_id,
+            "text": text,
+            "timestamp": timestamp,
+            "clientId": data.get('clientId'),
+            "sid": request.sid,
+            "attachment": attachment_id
+        })
+        if not queued:
+            logger.warning("Message queue full, rejecting group message")
+            return {"error": "Server busy, message not sent"}
+
+        # One room emit, encoded once per codec, however many members are online
+        payload = {"key": key, "conversationId": conversation_id, "from": from_user_id, "text": text,
+                   "timestamp": timestamp}
+        if attachment_id is not None:
+            payload["attachmentId"] = attachment_id
+        codec.emit_to_room("group_message", payload, conversation_room(conversation_id), skip_sid=request.sid)
+        return {"queued": True, "clientId": data.get('clientId')}
+
+    @socketio.on('attachment_start')
+    @decoded
+    def handle_attachment_start(data):
+        """Declare an upload ({name, size, contentType}); chunks follow as attachment_chunk"""
+        user_id = presence.user_for(request.sid)
+        if user_id is None:
+            return {"error": "Not connected"}
+        try:
+            return attachment_store.create(int(user_id), data.get('name'), data.get('size'), data.get('contentType'))
+        except UploadRejected as e:
+            return {"error": str(e)}
+
+    @socketio.on('attachment_chunk')
+    @decoded
+    def handle_attachment_chunk(data):
+        """One chunk ({id, index, data} with data as a binary frame); acked with the upload's progress"""
+        user_id = presence.user_for(request.sid)
+        if user_id is None:
+            return {"error": "Not connected"}
+        chunk = data.get('data')
+        try:
+            attachment_id, index = int(data['id']), int(data['index'])
+        except (KeyError, TypeError, ValueError):
+            return {"error": "id and index required"}
+        if not isinstance(chunk, (bytes, bytearray)):
+            return {"error": "data must be binary"}
+        try:
+            return attachment_store.write_chunk(int(user_id), attachment_id, index, io.BytesIO(chunk),
+                                                len(chunk), "socketio")
+        except UploadRejected as e:
+            return {"error": str(e), "received": e.received}
+
+    @socketio.on('resume')
+    @decoded
+    def handle_resume(data):
+        """
+        Re-send everything after the last seq a client saw before it
+        dropped: `seq` for one-to-one messages and, optionally,
+        `conversations` mapping group ids to the last id seen in each
+        """
+        user_id = presence.user_for(request.sid)
+        if user_id is None:
+            return {"error": "Not connected"}
+        try:
+            since = int(data['seq'])
+            groups = {int(cid): int(last) for cid, last in (data.get('conversations') or {}).items()}
+        except (KeyError, TypeError, ValueError, AttributeError):
+            return {"error": "seq required; conversations must map conversation ids to message ids"}
+        message_writer.flush()
+        seqs = {}
+        for conversation_id, last_id in groups.items():
+            if int(user_id) in get_member_ids(conversation_id):
+                seqs[str(conversation_id)] = send_missed_group_messages(conversation_id, last_id)
+        return {"seq": send_missed_messages(user_id, since), "conversations": seqs}
+
+    @socketio.on('read')
+    @decoded
+    def handle_read(data):
+        """Advance the read watermark for one conversation; without upTo, read all of it"""
+        user_id = presence.user_for(request.sid)
+        if user_id is None:
+            return {"error": "Not connected"}
+        try:
+            peer_id = int(data['peer'])
+            up_to = int(data['upTo']) if data.get('upTo') is not None else None
+        except (KeyError, TypeError, ValueError):
+            return {"error": "peer required, upTo must be a message id"}
+        if up_to is None:
+            # Live messages reach the recipient before their ids exist
+            message_writer.flush()
+        mark_read(user_id, peer_id, up_to)
+        response_cache.bump((INBOX, int(user_id)))
+        return {"ok": True}
 
     @socketio.on('screen-sharing-started')
+    @decoded
     def handle_screen_sharing_started(data):
         """Handle screen sharing start event"""
         target_user_id = str(data.get('targetUserId'))
-        from_user_id = str(data.get('fromUserId'))
-        target_sid = connected_users.get(target_user_id)
+        from_user_id = presence.user_for(request.sid) or str(data.get('fromUserId'))
         
-        if target_sid:
-            emit('screen-sharing-started', {
+        if presence.is_online(target_user_id):
+            codec.emit_to_user('screen-sharing-started', {
                 'fromUserId': from_user_id,
                 'hasAudio': data.get('hasAudio', False),
                 'hasVideo': data.get('hasVideo', True)
-            }, room=target_sid)
-            print(f"[WebRTC] Screen sharing started from {from_user_id} to {target_user_id}")
+            }, target_user_id)
+            logger.info("Screen sharing started from %s to %s", from_user_id, target_user_id)
 
     @socketio.on('screen-sharing-stopped')
+    @decoded
     def handle_screen_sharing_stopped(data):
         """Handle screen sharing stop event"""
         if 'targetUserId' in data:
-            target_sid = connected_users.get(str(data['targetUserId']))
-            if target_sid:
-                emit('screen-sharing-stopped', room=target_sid)
+            target_user_id = str(data['targetUserId'])
+            if presence.is_online(target_user_id):
+                emit('screen-sharing-stopped', to=[user_room(target_user_id), binary_room(target_user_id)])
 
     @socketio.on('screen-share-offer')
+    @decoded
     def handle_screen_share_offer(data):
-        print(f"[WebRTC] Received offer data: {data}")
-        from_user_id = data.get('fromUserId')
-        target_user_id = str(data.get('targetUserId'))
-        
-        if not from_user_id or not target_user_id:
-            print("[WebRTC] Missing user IDs")
-            emit('error', {'message': 'Invalid user IDs'}, room=request.sid)
+        target_user_id = data.get('targetUserId')
+        error = validate_description(data.get('offer'), 'offer')
+        if target_user_id is None or error:
+            logger.info("Rejected offer: %s", error or 'missing targetUserId')
+            emit('error', {'message': error or 'Invalid user IDs'}, room=request.sid)
             return
+        from_user_id = presence.user_for(request.sid) or data.get('fromUserId')
+        target_user_id = str(target_user_id)
 
-        target_sid = connected_users.get(target_user_id)
-        if target_sid:
-            print(f"[WebRTC] Forwarding offer from {from_user_id} to {target_user_id}")
-            emit('screen-share-offer', {
+        if presence.is_online(target_user_id):
+            logger.debug("Forwarding offer from %s to %s", from_user_id, target_user_id)
+            codec.emit_to_user('screen-share-offer', {
                 'offer': data['offer'],
                 'fromUserId': from_user_id
-            }, room=target_sid)
+            }, target_user_id)
         else:
-            print(f"[WebRTC] Target user {target_user_id} not found")
+            logger.info("Offer target %s not connected", target_user_id)
             emit('error', {'message': 'Target user not connected'}, room=request.sid)
 
     @socketio.on('screen-share-answer')
+    @decoded
     def handle_screen_share_answer(data):
-        print(f"[WebRTC] Received answer data: {data}")
-        target_sid = connected_users.get(str(data['targetUserId']))
+        target_user_id = data.get('targetUserId')
+        error = validate_description(data.get('answer'), 'answer')
+        if target_user_id is None or error:
+            logger.info("Rejected answer: %s", error or 'missing targetUserId')
+            emit('error', {'message': error or 'Invalid user IDs'}, room=request.sid)
+            return
+        target_user_id = str(target_user_id)
         
-        if target_sid:
-            emit('screen-share-answer', {
+        if presence.is_online(target_user_id):
+            codec.emit_to_user('screen-share-answer', {
                 'answer': data['answer'],
-                'fromUserId': data.get('fromUserId')
-            }, room=target_sid)
+                'fromUserId': presence.user_for(request.sid) or data.get('fromUserId')
+            }, target_user_id)
         else:
             emit('error', {'message': 'Target user not connected'}, room=request.sid)
 
     @socketio.on('ice-candidate')
+    @decoded
     def handle_ice_candidate(data):
-        print(f"[WebRTC] Forwarding ICE candidate from {data.get('fromUserId')}")
-        target_sid = connected_users.get(str(data['targetUserId']))
-        if target_sid:
-            emit('ice-candidate', {
-                'candidate': data['candidate'],
-                'fromUserId': data['fromUserId']
-            }, room=target_sid)
-        else:
-            print(f"[WebRTC] Target user not found for ICE candidate")
+        """Legacy single-candidate event; relayed through the same batcher"""
+        relay_candidates(data, [data.get('candidate')])
+
+    @socketio.on('ice-candidates')
+    @decoded
+    def handle_ice_candidates(data):
+        candidates = data.get('candidates')
+        if not isinstance(candidates, list) or len(candidates) > MAX_CANDIDATES_PER_EVENT:
+            return {"error": "Invalid candidates"}
+        relay_candidates(data, candidates)
+
+    def relay_candidates(data, candidates):
+        target_user_id = data.get('targetUserId')
+        if target_user_id is None:
+            return
+        for candidate in candidates:
+            if validate_candidate(candidate):
+                return
+        from_user_id = presence.user_for(request.sid) or data.get('fromUserId')
+        candidate_batcher.add(str(from_user_id), str(target_user_id), candidates)
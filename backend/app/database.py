@@ -1,31 +1,188 @@
+import logging
 import sqlite3
-import os 
+import os
+import time
+from contextlib import contextmanager
 
+import click
 
-DB_NAME = "eirem.db" 
+from app.metrics import metrics
+from app.migrations import migrate
 
+try:
+    from eventlet import queue as _queue
+    from eventlet.corolocal import get_ident
+except ImportError:  # plain threads, e.g. `python -m app.database`
+    import queue as _queue
+    from threading import get_ident
 
-def get_db_connection():
-    """Get a connection to the SQLite database."""
-    print("[Database] Connecting to database")
-    conn = sqlite3.connect(DB_NAME,check_same_thread=False)
+logger = logging.getLogger(__name__)
+
+DB_NAME = os.getenv("EIREM_DB", "eirem.db")
+
+POOL_SIZE = int(os.getenv("EIREM_DB_POOL_SIZE", "8"))
+POOL_TIMEOUT = 10            # seconds to wait for a free connection
+BUSY_TIMEOUT_MS = 5000       # how long SQLite retries a locked database
+STATEMENT_CACHE_SIZE = 256   # prepared statements kept per connection
+
+pool_wait = metrics.histogram(
+    "eirem_db_pool_wait_seconds", "Time checkouts spent waiting for a connection when the pool was exhausted")
+
+PRAGMAS = (
+    # Must precede journal_mode, which writes the header of a new database;
+    # a no-op on existing ones (see `flask messages compact --full`)
+    "PRAGMA auto_vacuum = INCREMENTAL",
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",
+)
+
+
+def _connect():
+    conn = sqlite3.connect(
+        DB_NAME,
+        check_same_thread=False,
+        cached_statements=STATEMENT_CACHE_SIZE,
+    )
     conn.row_factory = sqlite3.Row
-    return conn 
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+class ConnectionPool:
+    """
+    Bounded pool of long-lived SQLite connections.
+
+    Connections are handed out per greenlet: a nested checkout from the same
+    greenlet gets the connection it already holds instead of a second one,
+    so helpers can open `connection()` freely without deadlocking the pool.
+    """
+
+    def __init__(self, size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.size = size
+        self.timeout = timeout
+        self._idle = _queue.LifoQueue(maxsize=size)
+        self._created = 0
+        self._held = {}  # greenlet/thread ident -> [conn, depth]
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except _queue.Empty:
+            pass
+        if self._created < self.size:
+            self._created += 1
+            try:
+                return _connect()
+            except Exception:
+                self._created -= 1
+                raise
+        started = time.perf_counter()
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except _queue.Empty:
+            raise RuntimeError("Timed out waiting for a database connection")
+        finally:
+            pool_wait.observe(time.perf_counter() - started)
+
+    def _release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put_nowait(conn)
+
+    @contextmanager
+    def connection(self):
+        """
+        Check a connection out of the pool.
+
+        Commits on a clean exit and rolls back if the block raises, the same
+        as using a plain `sqlite3.Connection` as a context manager.
+        """
+        ident = get_ident()
+        held = self._held.get(ident)
+        if held is not None:
+            held[1] += 1
+            try:
+                yield held[0]
+            finally:
+                held[1] -= 1
+            return
+
+        conn = self._acquire()
+        self._held[ident] = [conn, 1]
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            del self._held[ident]
+            self._release(conn)
+
+    def stats(self):
+        """Return a snapshot of pool usage."""
+        idle = self._idle.qsize()
+        return {"size": self.size, "created": self._created, "idle": idle, "in_use": self._created - idle}
+
+    def close(self):
+        """Close every idle connection."""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except _queue.Empty:
+                break
+            conn.close()
+            self._created -= 1
+
+
+pool = ConnectionPool()
+
+
+def db_connection():
+    """Context manager yielding a pooled connection."""
+    return pool.connection()
+
+
+def get_db_connection():
+    """Get a standalone connection to the SQLite database (caller closes it)."""
+    return _connect()
 
 def init_db():
     """Initialize the database and create tables"""
-    db_path = os.path.join(os.path.dirname(__file__), 'eirem.db')
     conn = get_db_connection()
-    
+
     # Read schema file
     with open(os.path.join(os.path.dirname(__file__), 'schema.sql')) as f:
         conn.executescript(f.read())
-    
+
     conn.commit()
+    migrate(conn)
     conn.close()
-    print("[Database] Initialized database and created tables")
+    logger.info("Initialized database and created tables")
+
+SEARCH_INDEXES = ("users_fts", "messages_fts")
+
+
+def register_commands(app):
+    """Add database maintenance commands to the `flask` CLI."""
+
+    @app.cli.command("search-index")
+    @click.argument("action", type=click.Choice(["rebuild", "optimize"]))
+    def search_index(action):
+        """Rebuild or optimize the full-text search indexes."""
+        conn = get_db_connection()
+        for table in SEARCH_INDEXES:
+            conn.execute(f"INSERT INTO {table} ({table}) VALUES (?)", (action,))
+            conn.commit()
+            click.echo(f"[Database] {action} {table} done")
+        conn.close()
 
 # Call this when starting the application
 if __name__ == "__main__":
     init_db()
-
@@ -0,0 +1,126 @@
+import functools
+import itertools
+import os
+from collections import OrderedDict
+
+from flask import current_app, request
+
+from app.auth.models import get_current_user_id
+from app.metrics import metrics
+from app.utils import TTLCache
+
+# Version keys: (FRIENDS, user_id), (REQUESTS, user_id), conversation(a, b), USERS,
+# (GROUPS, user_id), (GROUP_MEMBERS, conversation_id), (GROUP_MESSAGES, conversation_id),
+# (INBOX, user_id)
+FRIENDS = "friends"
+REQUESTS = "requests"
+MESSAGES = "messages"
+USERS = "users"  # the user directory as a whole
+GROUPS = "groups"  # the group conversations a user is in
+GROUP_MEMBERS = "group_members"
+GROUP_MESSAGES = "group_messages"
+INBOX = "inbox"  # a user's conversation summaries
+
+lookups = metrics.counter(
+    "eirem_response_cache_total", "Cached GET endpoint lookups by outcome", ("outcome",))
+
+
+def conversation(user_id, peer_id):
+    """Version key of the messages between two users."""
+    return (MESSAGES, *sorted((int(user_id), int(peer_id))))
+
+
+def _tagged(response, etag):
+    response.set_etag(etag)
+    # Browsers may keep it, but must revalidate on every poll
+    response.cache_control.private = response.cache_control.no_cache = True
+    return response
+
+
+class ResponseCache:
+    """
+    Conditional GETs and cached JSON bodies for polled endpoints.
+
+    Writes `bump()` the version keys they affect; a cached endpoint names
+    the keys its response depends on, and its ETag is the current
+    versions of those keys. A poll whose If-None-Match still matches gets
+    a 304, and one without it gets the body serialized last time, both
+    without running the view.
+
+    Versions live in this process, so with several workers (a message
+    queue configured) writes on one are invisible to the others; the
+    cache is off by default in that setup.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._clock = itertools.count(1)
+        self._versions = OrderedDict()  # key -> clock value of its last bump
+        self._floor = 0                 # highest version ever evicted
+        self._max_versions = 100000
+        self._bodies = TTLCache(maxsize=10000, ttl=3600)  # (user, path) -> (etag, body)
+        # ETags from before a restart must not match the restarted counters
+        self._epoch = os.urandom(4).hex()
+
+    def init_app(self, app):
+        self.enabled = app.config["RESPONSE_CACHE_ENABLED"]
+        self._max_versions = app.config["RESPONSE_CACHE_VERSIONS"]
+        self._bodies = TTLCache(maxsize=app.config["RESPONSE_CACHE_SIZE"], ttl=app.config["RESPONSE_CACHE_TTL"])
+
+    def bump(self, *keys):
+        """Mark everything depending on `keys` as changed."""
+        version = next(self._clock)
+        for key in keys:
+            self._versions[key] = version
+            self._versions.move_to_end(key)
+        while len(self._versions) > self._max_versions:
+            # An evicted key reads as the floor: never older than its last
+            # bump, so a stale ETag can't match it
+            self._floor = max(self._floor, self._versions.popitem(last=False)[1])
+
+    def version(self, key):
+        return self._versions.get(key, self._floor)
+
+    def cached(self, keys):
+        """
+        Decorator for a JSON GET view of the current user. `keys(user_id,
+        *view_args)` returns the version keys the response depends on.
+        """
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return view(*args, **kwargs)
+                user_id = get_current_user_id()
+                if user_id is None:
+                    return view(*args, **kwargs)
+                try:
+                    versions = [self.version(key) for key in keys(user_id, *kwargs.values())]
+                except (TypeError, ValueError):
+                    return view(*args, **kwargs)  # bad arguments; let the view answer
+                etag = f"{self._epoch}-{user_id}-{'.'.join(map(str, versions))}"
+
+                if request.if_none_match.contains(etag):
+                    lookups.inc(("not_modified",))
+                    return _tagged(current_app.response_class(status=304), etag)
+
+                cache_key = (user_id, request.full_path)
+                entry = self._bodies.get(cache_key)
+                if entry is not None and entry[0] == etag:
+                    lookups.inc(("hit",))
+                    response = current_app.response_class(entry[1], mimetype="application/json")
+                else:
+                    lookups.inc(("miss",))
+                    response = current_app.make_response(view(*args, **kwargs))
+                    if (response.status_code != 200 or response.is_streamed
+                            or response.mimetype != "application/json"):
+                        return response
+                    # Tagged with the versions read before the view ran, so
+                    # a write that raced it only costs a miss next time
+                    self._bodies.set(cache_key, (etag, response.get_data()))
+                return _tagged(response, etag)
+            return wrapper
+        return decorator
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,190 @@
+import atexit
+import logging
+import random
+import sys
+import time
+
+try:
+    from eventlet.patcher import original
+    # Real OS thread and queue even when gunicorn has monkey-patched the
+    # stdlib, so writes to stdout never block the eventlet hub
+    _threading = original("threading")
+    _queue = original("queue")
+except ImportError:
+    import threading as _threading
+    import queue as _queue
+
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(name)s] %(message)s"
+
+# Keys whose values never reach the logs; message text and SDP blobs
+# are private or just too big to be useful
+REDACTED_KEYS = frozenset({
+    "password", "token", "access_token", "authorization", "text", "sdp", "candidate"
+})
+MAX_VALUE_LENGTH = 64
+
+# Pass as `extra=` on per-message log lines so only a sample of them is kept
+SAMPLED = {"sampled": True}
+
+
+def _redact(value, max_length):
+    if isinstance(value, dict):
+        return {
+            key: "[redacted]" if str(key).lower() in REDACTED_KEYS else _redact(item, max_length)
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [_redact(item, max_length) for item in value]
+    if isinstance(value, str) and len(value) > max_length:
+        return f"{value[:max_length]}...(+{len(value) - max_length})"
+    return value
+
+
+class Redacted:
+    """
+    Wraps a payload for logging: sensitive keys are masked and long strings
+    cut short, but only if the record is actually emitted.
+    """
+
+    __slots__ = ("value", "max_length")
+
+    def __init__(self, value, max_length=MAX_VALUE_LENGTH):
+        self.value = value
+        self.max_length = max_length
+
+    def __str__(self):
+        return str(_redact(self.value, self.max_length))
+
+
+class SampleFilter(logging.Filter):
+    """Keeps roughly `rate` of the records logged with `extra=SAMPLED`."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if getattr(record, "sampled", False):
+            return self.rate >= 1 or random.random() < self.rate
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets at most `burst` records per call site (logger, level, format
+    string) through every `interval` seconds. The first record after a
+    quiet spell reports how many were dropped.
+    """
+
+    def __init__(self, burst, interval):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self._windows = {}  # key -> [window start, records passed, records dropped]
+
+    def filter(self, record):
+        key = (record.name, record.levelno, record.msg)
+        now = time.monotonic()
+        window = self._windows.get(key)
+        if window is None or now - window[0] >= self.interval:
+            dropped = window[2] if window else 0
+            window = self._windows[key] = [now, 0, 0]
+            if dropped:
+                record.msg = f"{record.msg} ({dropped} similar messages suppressed)"
+        if window[1] >= self.burst:
+            window[2] += 1
+            return False
+        window[1] += 1
+        return True
+
+
+class TruncatingFormatter(logging.Formatter):
+    def __init__(self, fmt, max_length):
+        super().__init__(fmt)
+        self.max_length = max_length
+
+    def formatMessage(self, record):
+        message = super().formatMessage(record)
+        if len(message) > self.max_length:
+            message = f"{message[:self.max_length]}...(+{len(message) - self.max_length})"
+        return message
+
+
+class QueueHandler(logging.Handler):
+    """
+    Hands formatted records to a background OS thread that does the
+    writing. Never blocks the caller: when the queue is full the record
+    is dropped and counted.
+    """
+
+    def __init__(self, target, maxsize):
+        super().__init__()
+        self.target = target
+        self.dropped = 0
+        self._queue = _queue.Queue(maxsize)
+        self._thread = _threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def emit(self, record):
+        try:
+            # Render in the caller so the record holds no live objects
+            record.msg = self.format(record)
+            record.args = None
+            record.exc_info = record.exc_text = None
+            self._queue.put_nowait(record)
+        except _queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+    def _run(self):
+        while True:
+            record = self._queue.get()
+            if record is None:
+                break
+            self.target.handle(record)
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def close(self):
+        """Write out whatever is queued, then stop the writer thread."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+        self.target.close()
+        super().close()
+
+
+def _parse_levels(spec):
+    """'app.database=WARNING,app.chat.socket=DEBUG' -> {logger: level}"""
+    levels = {}
+    for item in (spec or "").split(","):
+        name, _, level = item.strip().partition("=")
+        if name and level:
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def init_app(app):
+    """Route every `app.*` logger through one non-blocking queue handler."""
+    root = logging.getLogger("app")
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(logging.Formatter("%(message)s"))
+    handler = QueueHandler(output, app.config["LOG_QUEUE_SIZE"])
+    handler.setFormatter(TruncatingFormatter(LOG_FORMAT, app.config["LOG_MAX_LENGTH"]))
+    handler.addFilter(SampleFilter(app.config["LOG_SAMPLE_RATE"]))
+    handler.addFilter(RateLimitFilter(app.config["LOG_RATE_LIMIT_BURST"], app.config["LOG_RATE_LIMIT_INTERVAL"]))
+
+    root.addHandler(handler)
+    root.setLevel(app.config["LOG_LEVEL"].upper())
+    root.propagate = False
+    for name, level in _parse_levels(app.config["LOG_LEVELS"]).items():
+        logging.getLogger(name).setLevel(level)
+
+    atexit.register(handler.close)
+    return handler
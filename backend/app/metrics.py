@@ -0,0 +1,255 @@
+import functools
+import logging
+import sys
+import time
+import traceback
+from bisect import bisect_left
+
+from flask import Response, g, request
+
+try:
+    from eventlet.patcher import original
+    # The watchdog must be a real OS thread to notice the hub is stuck
+    _threading = original("threading")
+except ImportError:
+    import threading as _threading
+
+logger = logging.getLogger(__name__)
+
+# Seconds; Prometheus' defaults with finer steps at the low end, where
+# socket handlers and cached routes live
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STACK_DEPTH = 12  # innermost frames logged for a blocked hub
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}  # label values -> count
+
+    def inc(self, labels=(), amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in self._values.items():
+            yield self.name, _format_labels(self.labelnames, labels), value
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # label values -> per-bucket counts (last slot is +Inf), then sum
+        self._values = {}
+
+    def observe(self, value, labels=()):
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = [0] * (len(self.buckets) + 2)
+        entry[bisect_left(self.buckets, value)] += 1
+        entry[-1] += value
+
+    def samples(self):
+        bounds = [str(bound) for bound in self.buckets] + ["+Inf"]
+        for labels, entry in self._values.items():
+            cumulative = 0
+            for bound, count in zip(bounds, entry):
+                cumulative += count
+                yield (f"{self.name}_bucket",
+                       _format_labels(self.labelnames, labels, [("le", bound)]), cumulative)
+            yield f"{self.name}_sum", _format_labels(self.labelnames, labels), entry[-1]
+            yield f"{self.name}_count", _format_labels(self.labelnames, labels), cumulative
+
+
+class Gauge:
+    """
+    Value read at scrape time: `callback` returns a number, or a dict of
+    label values -> number. `type` can be "counter" for running totals
+    that are kept elsewhere.
+    """
+
+    def __init__(self, name, documentation, callback, labelnames=(), type="gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.labelnames = labelnames
+        self.type = type
+
+    def samples(self):
+        value = self.callback()
+        values = value if isinstance(value, dict) else {(): value}
+        for labels, item in values.items():
+            yield self.name, _format_labels(self.labelnames, labels), item
+
+
+class HubMonitor:
+    """
+    Detects greenlets that keep the eventlet hub from switching.
+
+    A greenlet wakes every `interval` seconds and records how late it woke.
+    A real OS thread watches that greenlet's heartbeat; when it goes
+    stale for more than `threshold` seconds, whatever is running on the
+    hub's thread is the culprit, and its stack is logged.
+    """
+
+    def __init__(self, metrics, interval, threshold):
+        self.interval = interval
+        self.threshold = threshold
+        self.lag = metrics.histogram(
+            "eirem_hub_lag_seconds", "How late the hub monitor greenlet woke up")
+        self.blocked = metrics.counter(
+            "eirem_hub_blocked_total", "Times a greenlet blocked the hub past the threshold")
+        self._heartbeat = None
+        self._hub_thread = None
+
+    def start(self, socketio):
+        socketio.start_background_task(self._tick, socketio)
+        _threading.Thread(target=self._watch, name="hub-watchdog", daemon=True).start()
+
+    def _tick(self, socketio):
+        self._hub_thread = _threading.get_ident()
+        while True:
+            started = time.monotonic()
+            self._heartbeat = started
+            socketio.sleep(self.interval)
+            self.lag.observe(max(time.monotonic() - started - self.interval, 0))
+
+    def _watch(self):
+        reported = None
+        while True:
+            time.sleep(self.threshold / 2)
+            heartbeat = self._heartbeat
+            if heartbeat is None or heartbeat == reported:
+                continue
+            stalled = time.monotonic() - heartbeat - self.interval
+            if stalled > self.threshold:
+                reported = heartbeat
+                self.blocked.inc()
+                frame = sys._current_frames().get(self._hub_thread)
+                stack = "".join(traceback.format_stack(frame, STACK_DEPTH)) if frame else "unavailable"
+                logger.warning("Hub blocked for %.0f ms so far, in:\n%s", stalled * 1000, stack)
+
+
+class Metrics:
+    """
+    Registry of request/event timings and gauges, served in the
+    Prometheus text format on /metrics. Each worker process reports its
+    own numbers; scrape every worker.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self.enabled = False
+        self.http_duration = self.histogram(
+            "eirem_http_request_duration_seconds", "HTTP request latency",
+            ("endpoint", "method", "status"))
+        self.event_duration = self.histogram(
+            "eirem_socketio_event_duration_seconds", "Socket.IO handler latency", ("event",))
+        self.event_errors = self.counter(
+            "eirem_socketio_event_errors_total",
+            "Socket.IO handlers that raised or acked with an error", ("event",))
+
+    def _register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, callback, labelnames=(), type="gauge"):
+        return self._register(Gauge(name, documentation, callback, labelnames, type))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                samples = list(metric.samples())
+            except Exception as e:
+                logger.warning("Collecting %s failed: %s", metric.name, e)
+                continue
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(f"{name}{labels} {value}" for name, labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+    def init_app(self, app, socketio):
+        """Time every request and expose /metrics."""
+        self.enabled = app.config["METRICS_ENABLED"]
+        if not self.enabled:
+            return
+
+        @app.before_request
+        def start_timer():
+            g.metrics_started = time.perf_counter()
+
+        @app.after_request
+        def record_request(response):
+            started = g.pop("metrics_started", None)
+            if started is not None and request.endpoint != "metrics":
+                self.http_duration.observe(
+                    time.perf_counter() - started,
+                    (request.endpoint or "unmatched", request.method, str(response.status_code)))
+            return response
+
+        app.add_url_rule("/metrics", "metrics", self._serve)
+
+        threshold = app.config["METRICS_HUB_LAG_THRESHOLD_MS"] / 1000
+        if threshold:
+            HubMonitor(self, app.config["METRICS_HUB_LAG_INTERVAL_MS"] / 1000, threshold).start(socketio)
+
+    def _serve(self):
+        return Response(self.render(), mimetype="text/plain; version=0.0.4")
+
+    def instrument_socketio(self, socketio):
+        """Wrap every registered Socket.IO handler with a timer; call after registering them."""
+        if not self.enabled:
+            return
+        for handlers in socketio.server.handlers.values():
+            for event, handler in handlers.items():
+                if not getattr(handler, "_timed", False):
+                    handlers[event] = self._time_event(event, handler)
+
+    def _time_event(self, event, handler):
+        labels = (event,)
+
+        @functools.wraps(handler)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = handler(*args, **kwargs)
+            except Exception:
+                self.event_errors.inc(labels)
+                raise
+            finally:
+                self.event_duration.observe(time.perf_counter() - started, labels)
+            if isinstance(result, dict) and "error" in result:
+                self.event_errors.inc(labels)
+            return result
+
+        timed._timed = True
+        return timed
+
+
+metrics = Metrics()
@@ -0,0 +1,218 @@
+import logging
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+# Ordered (version, description, script) entries. schema.sql is version 0;
+# each migration runs once and bumps PRAGMA user_version in the same
+# transaction, so a failed migration leaves the database untouched.
+MIGRATIONS = [
+    (1, "conversation key and hot-path indexes", '''
+        ALTER TABLE messages ADD COLUMN conv_lo INTEGER
+            GENERATED ALWAYS AS (min(from_user_id, to_user_id)) VIRTUAL;
+        ALTER TABLE messages ADD COLUMN conv_hi INTEGER
+            GENERATED ALWAYS AS (max(from_user_id, to_user_id)) VIRTUAL;
+        CREATE INDEX IF NOT EXISTS idx_messages_conversation
+            ON messages (conv_lo, conv_hi, timestamp);
+        CREATE INDEX IF NOT EXISTS idx_friend_requests_from
+            ON friend_requests (from_user_id, status, to_user_id);
+        CREATE INDEX IF NOT EXISTS idx_friend_requests_to
+            ON friend_requests (to_user_id, status, from_user_id);
+    '''),
+    (2, "key conversation index by message id for keyset paging", '''
+        DROP INDEX IF EXISTS idx_messages_conversation;
+        CREATE INDEX IF NOT EXISTS idx_messages_conversation
+            ON messages (conv_lo, conv_hi, id);
+    '''),
+    (3, "delivery state for offline delivery", '''
+        ALTER TABLE messages ADD COLUMN delivered INTEGER NOT NULL DEFAULT 1;
+        CREATE INDEX IF NOT EXISTS idx_messages_recipient
+            ON messages (to_user_id, id);
+        CREATE INDEX IF NOT EXISTS idx_messages_undelivered
+            ON messages (to_user_id, id) WHERE delivered = 0;
+        CREATE TABLE IF NOT EXISTS delivery_state (
+            user_id INTEGER NOT NULL,
+            peer_id INTEGER NOT NULL,
+            delivered_id INTEGER NOT NULL DEFAULT 0,
+            read_id INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, peer_id)
+        ) WITHOUT ROWID;
+        INSERT OR IGNORE INTO delivery_state (user_id, peer_id, delivered_id, read_id)
+            SELECT to_user_id, from_user_id, MAX(id), MAX(id) FROM messages
+            GROUP BY to_user_id, from_user_id;
+    '''),
+    (4, "symmetric friendships adjacency table", '''
+        CREATE TABLE IF NOT EXISTS friendships (
+            user_id INTEGER NOT NULL,
+            friend_id INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, friend_id)
+        ) WITHOUT ROWID;
+        INSERT OR IGNORE INTO friendships (user_id, friend_id)
+            SELECT from_user_id, to_user_id FROM friend_requests WHERE status = 'accepted';
+        INSERT OR IGNORE INTO friendships (user_id, friend_id)
+            SELECT to_user_id, from_user_id FROM friend_requests WHERE status = 'accepted';
+    '''),
+    (5, "prefix-searchable user directory", '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+            name, email,
+            content='users', content_rowid='id',
+            prefix='2 3 4'
+        );
+        CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users BEGIN
+            INSERT INTO users_fts (rowid, name, email) VALUES (new.id, new.name, new.email);
+        END;
+        CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users BEGIN
+            INSERT INTO users_fts (users_fts, rowid, name, email) VALUES ('delete', old.id, old.name, old.email);
+        END;
+        CREATE TRIGGER IF NOT EXISTS users_fts_update AFTER UPDATE OF name, email ON users BEGIN
+            INSERT INTO users_fts (users_fts, rowid, name, email) VALUES ('delete', old.id, old.name, old.email);
+            INSERT INTO users_fts (rowid, name, email) VALUES (new.id, new.name, new.email);
+        END;
+        INSERT INTO users_fts (users_fts) VALUES ('rebuild');
+    '''),
+    (6, "full-text message search", '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+            text, from_user_id, to_user_id,
+            content='messages', content_rowid='id',
+            prefix='2 3'
+        );
+        CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts (rowid, text, from_user_id, to_user_id)
+            VALUES (new.id, new.text, new.from_user_id, new.to_user_id);
+        END;
+        CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, text, from_user_id, to_user_id)
+            VALUES ('delete', old.id, old.text, old.from_user_id, old.to_user_id);
+        END;
+        CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF text ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, text, from_user_id, to_user_id)
+            VALUES ('delete', old.id, old.text, old.from_user_id, old.to_user_id);
+            INSERT INTO messages_fts (rowid, text, from_user_id, to_user_id)
+            VALUES (new.id, new.text, new.from_user_id, new.to_user_id);
+        END;
+        INSERT INTO messages_fts (messages_fts) VALUES ('rebuild');
+    '''),
+    (7, "catalog of monthly message archives", '''
+        CREATE TABLE IF NOT EXISTS message_archives (
+            month TEXT PRIMARY KEY,
+            min_id INTEGER NOT NULL,
+            max_id INTEGER NOT NULL,
+            rows INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID;
+    '''),
+    (8, "group conversations", '''
+        CREATE TABLE IF NOT EXISTS conversations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            created_by INTEGER NOT NULL,
+            created_at INTEGER NOT NULL,
+            FOREIGN KEY (created_by) REFERENCES users (id)
+        );
+        CREATE TABLE IF NOT EXISTS conversation_members (
+            conversation_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            role TEXT NOT NULL DEFAULT 'member' CHECK (role IN ('owner', 'member')),
+            joined_at INTEGER NOT NULL,
+            PRIMARY KEY (conversation_id, user_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_conversation_members_user
+            ON conversation_members (user_id, conversation_id);
+        CREATE TABLE IF NOT EXISTS group_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            conversation_id INTEGER NOT NULL,
+            from_user_id INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            timestamp INTEGER NOT NULL,
+            FOREIGN KEY (conversation_id) REFERENCES conversations (id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_group_messages_conversation
+            ON group_messages (conversation_id, id);
+    '''),
+    (9, "per-participant conversation summaries", '''
+        CREATE TABLE IF NOT EXISTS conversation_summary (
+            user_id INTEGER NOT NULL,
+            peer_id INTEGER NOT NULL,
+            last_message_id INTEGER NOT NULL,
+            last_from_user_id INTEGER NOT NULL,
+            preview TEXT NOT NULL,
+            last_timestamp INTEGER NOT NULL,
+            unread INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, peer_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_conversation_summary_recent
+            ON conversation_summary (user_id, last_message_id);
+        INSERT OR IGNORE INTO conversation_summary
+            (user_id, peer_id, last_message_id, last_from_user_id, preview, last_timestamp, unread)
+        WITH latest AS (
+            SELECT conv_lo, conv_hi, MAX(id) AS id FROM messages GROUP BY conv_lo, conv_hi
+        ), sides AS (
+            SELECT conv_lo AS user_id, conv_hi AS peer_id, id FROM latest
+            UNION ALL
+            SELECT conv_hi, conv_lo, id FROM latest WHERE conv_lo != conv_hi
+        )
+        SELECT s.user_id, s.peer_id, m.id, m.from_user_id, substr(m.text, 1, 100), m.timestamp, (
+            SELECT count(*) FROM messages u
+            WHERE u.to_user_id = s.user_id AND u.from_user_id = s.peer_id AND u.id > COALESCE((
+                SELECT read_id FROM delivery_state d WHERE d.user_id = s.user_id AND d.peer_id = s.peer_id
+            ), 0)
+        )
+        FROM sides s JOIN messages m ON m.id = s.id;
+    '''),
+    (10, "file attachments", '''
+        CREATE TABLE IF NOT EXISTS attachments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            owner_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            content_type TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            chunk_size INTEGER NOT NULL,
+            received INTEGER NOT NULL DEFAULT 0,
+            sha256 TEXT,
+            created_at INTEGER NOT NULL,
+            completed_at INTEGER,
+            FOREIGN KEY (owner_id) REFERENCES users (id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_attachments_pending
+            ON attachments (created_at) WHERE sha256 IS NULL;
+        CREATE TABLE IF NOT EXISTS attachment_shares (
+            attachment_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            PRIMARY KEY (attachment_id, user_id)
+        ) WITHOUT ROWID;
+        ALTER TABLE messages ADD COLUMN attachment_id INTEGER REFERENCES attachments (id);
+        ALTER TABLE group_messages ADD COLUMN attachment_id INTEGER REFERENCES attachments (id);
+        CREATE INDEX IF NOT EXISTS idx_group_messages_attachment
+            ON group_messages (attachment_id) WHERE attachment_id IS NOT NULL;
+    '''),
+]
+
+
+def _statements(script):
+    """Split a script into complete statements (trigger bodies stay whole)."""
+    buffer = ""
+    for line in script.splitlines(keepends=True):
+        buffer += line
+        if sqlite3.complete_statement(buffer):
+            yield buffer.strip()
+            buffer = ""
+    if buffer.strip():
+        raise ValueError(f"Incomplete SQL statement in migration: {buffer.strip()}")
+
+
+def migrate(conn):
+    """Apply every pending migration to `conn`."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        current = conn.execute("PRAGMA user_version").fetchone()[0]
+        for version, description, script in MIGRATIONS:
+            if version <= current:
+                continue
+            for statement in _statements(script):
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {version}")
+            logger.info("Applied %s: %s", version, description)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
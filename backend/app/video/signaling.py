@@ -0,0 +1,85 @@
+from app.chat.codec import codec
+
+MAX_SDP_BYTES = 64 * 1024
+MAX_CANDIDATE_BYTES = 1024
+MAX_CANDIDATES_PER_EVENT = 100
+SESSION_DESCRIPTION_TYPES = ('offer', 'answer', 'pranswer', 'rollback')
+
+
+def validate_description(description, expected_type):
+    """
+    Check an SDP offer/answer before any forwarding work is done.
+
+    Returns an error message, or None if the description is acceptable.
+    """
+    if not isinstance(description, dict):
+        return f"{expected_type} must be an object"
+    if description.get('type') not in SESSION_DESCRIPTION_TYPES:
+        return f"Invalid {expected_type} type"
+    sdp = description.get('sdp')
+    if not isinstance(sdp, str):
+        return f"{expected_type} sdp must be a string"
+    if len(sdp) > MAX_SDP_BYTES:
+        return f"{expected_type} sdp exceeds {MAX_SDP_BYTES} bytes"
+    return None
+
+
+def validate_candidate(candidate):
+    """Same for a trickled ICE candidate (an RTCIceCandidateInit)."""
+    if not isinstance(candidate, dict):
+        return "candidate must be an object"
+    value = candidate.get('candidate')
+    if not isinstance(value, str) or len(value) > MAX_CANDIDATE_BYTES:
+        return "Invalid candidate"
+    return None
+
+
+class CandidateBatcher:
+    """
+    Coalesces trickled ICE candidates per (from, to) pair.
+
+    The first candidate for a pair opens a window of `window` seconds;
+    everything that arrives for the pair before it closes goes out as one
+    `ice-candidates` event instead of one emit per candidate.
+    """
+
+    def __init__(self, window=0.02, max_batch=MAX_CANDIDATES_PER_EVENT):
+        self.socketio = None
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = {}  # (from_user_id, to_user_id) -> list of candidates
+
+    def init_app(self, app, socketio):
+        self.window = app.config["ICE_BATCH_WINDOW_MS"] / 1000
+        self.socketio = socketio
+
+    def add(self, from_user_id, to_user_id, candidates):
+        key = (from_user_id, to_user_id)
+        batch = self._pending.get(key)
+        if batch is None:
+            batch = self._pending[key] = []
+            self.socketio.start_background_task(self._flush_later, key, batch)
+        batch.extend(candidates)
+        if len(batch) >= self.max_batch:
+            self._flush(key, batch)
+
+    def _flush_later(self, key, batch):
+        self.socketio.sleep(self.window)
+        self._flush(key, batch)
+
+    def _flush(self, key, batch):
+        # A full batch may already have gone out; only send the one we own
+        if self._pending.get(key) is not batch:
+            return
+        del self._pending[key]
+        from_user_id, to_user_id = key
+        codec.emit_to_user('ice-candidates', {
+            'candidates': batch,
+            'fromUserId': from_user_id
+        }, to_user_id)
+
+    def pending_count(self):
+        return sum(len(batch) for batch in self._pending.values())
+
+
+candidate_batcher = CandidateBatcher()
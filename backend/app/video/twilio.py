@@ -0,0 +1,177 @@
+import logging
+import time
+
+import jwt
+import requests
+from eventlet import event, patcher, tpool
+from requests.adapters import HTTPAdapter
+
+from app.metrics import metrics
+from app.utils import TTLCache
+
+logger = logging.getLogger(__name__)
+
+ROOM_EXISTS = 53113  # Twilio error code for a duplicate UniqueName
+TOKEN_CACHE_SIZE = 10000
+ROOM_CACHE_SIZE = 10000
+
+request_duration = metrics.histogram(
+    "eirem_twilio_request_seconds", "Twilio REST API call latency", ("operation", "outcome"))
+
+
+class VideoService:
+    """
+    Twilio Video over a pooled `requests.Session`.
+
+    Calls are bounded by (connect, read) timeouts and run off the hub: on
+    a monkey-patched worker the session's sockets are already green, and
+    otherwise the call is handed to eventlet's thread pool.
+
+    Access tokens are minted locally with PyJWT and reused per (identity,
+    room) while they have plenty of life left; room lookups are cached
+    briefly; concurrent creations of the same room share one request.
+    """
+
+    def __init__(self):
+        self.account_sid = None
+        self.api_key_sid = None
+        self.api_key_secret = None
+        self.api_url = "https://video.twilio.com"
+        self.timeout = (3.05, 10)
+        self.token_ttl = 3600
+        self.room_type = "peer-to-peer"
+        self.session = None
+        self._tokens = TTLCache(maxsize=TOKEN_CACHE_SIZE)  # (identity, room) -> token
+        self._rooms = TTLCache(maxsize=ROOM_CACHE_SIZE)    # sid or unique name -> status
+        self._creating = {}  # unique name -> Event resolved with the room
+        self._green = False
+
+    def init_app(self, app):
+        self.account_sid = app.config["TWILIO_ACCOUNT_SID"]
+        self.api_key_sid = app.config["TWILIO_API_KEY_SID"]
+        self.api_key_secret = app.config["TWILIO_API_KEY_SECRET"]
+        self.api_url = app.config["TWILIO_VIDEO_API_URL"].rstrip("/")
+        self.timeout = (app.config["TWILIO_CONNECT_TIMEOUT"], app.config["TWILIO_READ_TIMEOUT"])
+        self.token_ttl = app.config["TWILIO_TOKEN_TTL"]
+        self.room_type = app.config["TWILIO_ROOM_TYPE"]
+        # Hand out a cached token only while it has at least half its life left
+        self._tokens = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=self.token_ttl / 2)
+        self._rooms = TTLCache(maxsize=ROOM_CACHE_SIZE, ttl=app.config["TWILIO_ROOM_CACHE_TTL"])
+        self._green = patcher.is_monkey_patched("socket")
+
+        self.session = requests.Session()
+        self.session.auth = (self.api_key_sid or "", self.api_key_secret or "")
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=app.config["TWILIO_POOL_SIZE"])
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def create_token(self, identity, room_name):
+        """Return a Video access token letting `identity` join `room_name`."""
+        key = (identity, room_name)
+        token = self._tokens.get(key)
+        if token is None:
+            now = int(time.time())
+            token = jwt.encode({
+                "jti": f"{self.api_key_sid}-{now}",
+                "iss": self.api_key_sid,
+                "sub": self.account_sid,
+                "nbf": now,
+                "exp": now + self.token_ttl,
+                "grants": {"identity": identity, "video": {"room": room_name}},
+            }, self.api_key_secret, algorithm="HS256", headers={"cty": "twilio-fpa;v=1"})
+            self._tokens.set(key, token)
+        return token
+
+    def _request(self, operation, method, path, **kwargs):
+        """Make one API call; returns the decoded JSON body, raises on errors."""
+        url = f"{self.api_url}{path}"
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            if self._green:
+                response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            else:
+                response = tpool.execute(self.session.request, method, url, timeout=self.timeout, **kwargs)
+            outcome = str(response.status_code)
+            response.raise_for_status()
+            return response.json()
+        finally:
+            request_duration.observe(time.perf_counter() - started, (operation, outcome))
+
+    def _remember(self, room):
+        status = {
+            "sid": room["sid"],
+            "name": room.get("unique_name"),
+            "status": room["status"],
+            "type": room.get("type"),
+        }
+        self._rooms.set(status["sid"], status)
+        if status["name"]:
+            self._rooms.set(status["name"], status)
+        return status
+
+    def create_room(self, room_name):
+        """
+        Create a room named `room_name`, or return it if it already
+        exists. Returns its status dict, or None if Twilio can't be reached.
+        """
+        cached = self._rooms.get(room_name)
+        if cached is not None and cached["status"] == "in-progress":
+            return cached
+
+        pending = self._creating.get(room_name)
+        if pending is not None:
+            return pending.wait()
+
+        pending = self._creating[room_name] = event.Event()
+        room = None
+        try:
+            room = self._create_room(room_name)
+        finally:
+            del self._creating[room_name]
+            pending.send(room)
+        return room
+
+    def _create_room(self, room_name):
+        try:
+            return self._remember(self._request(
+                "create_room", "POST", "/v1/Rooms",
+                data={"UniqueName": room_name, "Type": self.room_type}
+            ))
+        except requests.HTTPError as e:
+            if _error_code(e.response) == ROOM_EXISTS:
+                return self.get_room_status(room_name)
+            logger.error("Error creating video room %s: %s", room_name, e)
+        except requests.RequestException as e:
+            logger.error("Error creating video room %s: %s", room_name, e)
+        return None
+
+    def get_room_status(self, room):
+        """
+        Status of a room by SID or unique name, plus the identities of
+        its connected participants; None if it can't be fetched.
+        """
+        cached = self._rooms.get(room)
+        if cached is not None and "participants" in cached:
+            return cached
+        try:
+            status = self._remember(self._request("fetch_room", "GET", f"/v1/Rooms/{room}"))
+            participants = self._request(
+                "list_participants", "GET", f"/v1/Rooms/{status['sid']}/Participants",
+                params={"Status": "connected"}
+            )
+        except requests.RequestException as e:
+            logger.error("Error fetching room status for %s: %s", room, e)
+            return None
+        status["participants"] = [p["identity"] for p in participants.get("participants", [])]
+        return status
+
+
+def _error_code(response):
+    try:
+        return response.json().get("code")
+    except ValueError:
+        return None
+
+
+video_service = VideoService()
@@ -0,0 +1,37 @@
+"""
+Shared setup for the in-process benchmark scripts in this directory.
+
+Import it before anything from `app`: it points EIREM_DB at a fresh
+temporary database, uses a cheap password hash, quiets logging, turns
+off metrics (the hub lag monitor would flag the seeding loops) and socket
+rate limits, then puts backend/ on sys.path.
+"""
+import os
+import sys
+import tempfile
+import time
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+os.environ["EIREM_DB"] = os.path.join(tempfile.mkdtemp(prefix="eirem-bench-"), "bench.db")
+os.environ.setdefault("EIREM_PASSWORD_HASH", "pbkdf2:sha256:1000")
+os.environ.setdefault("EIREM_LOG_LEVEL", "WARNING")
+os.environ.setdefault("EIREM_METRICS", "0")
+os.environ.setdefault("EIREM_SOCKETIO_RATE_LIMITS", "0")
+sys.path.insert(0, BACKEND)
+
+
+def register(client, n):
+    """Register user number `n` through the API; returns (id, auth headers, token)."""
+    user = {"name": f"bench{n}", "email": f"bench{n}@example.com", "password": "bench-test"}
+    client.post("/api/auth/register", json=user)
+    login = client.post("/api/auth/login", json=user).json
+    return login["user"]["id"], {"Authorization": f"Bearer {login['token']}"}, login["token"]
+
+
+def per_call(fn, repeat):
+    """Seconds per call of `fn`, averaged over `repeat` calls."""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat
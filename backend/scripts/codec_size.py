@@ -0,0 +1,71 @@
+"""
+Compare Socket.IO packet size and encode time for JSON sessions and
+binary (MessagePack) sessions on typical payloads.
+
+Encodes each payload as python-socketio would for an EVENT packet, once
+as plain JSON and once after the payload codec, with the thresholds from
+create_app's defaults.
+
+    python scripts/codec_size.py --repeat 2000
+
+Run from backend/. Needs msgpack installed.
+"""
+import argparse
+import timeit
+
+from flask import Flask
+from socketio import packet
+
+import bench  # noqa: F401 -- puts app on sys.path
+from app.chat.codec import PayloadCodec
+
+MESSAGE = {"from": "12", "text": "hey, are we still on for tonight?", "timestamp": 1792309975}
+SDP = "\r\n".join(
+    ["v=0", "o=- 4611731400430051336 2 IN IP4 127.0.0.1", "s=-", "t=0 0", "a=group:BUNDLE 0 1"]
+    + [f"a=candidate:{i} 1 udp 2122260223 192.168.1.{i} 5{i:04d} typ host generation 0 network-id 1"
+       for i in range(10)]
+    + [f"a=rtpmap:{96 + i} VP8/90000\r\na=rtcp-fb:{96 + i} goog-remb\r\na=rtcp-fb:{96 + i} transport-cc\r\n"
+       f"a=rtcp-fb:{96 + i} nack pli" for i in range(30)])
+PAYLOADS = [
+    ("private_message", MESSAGE),
+    ("ice-candidates x20", {"candidates": [{"candidate": f"candidate:{i} 1 udp 2122260223 10.0.0.{i} 5{i:04d} typ host",
+                                            "sdpMid": "0", "sdpMLineIndex": 0} for i in range(20)],
+                            "fromUserId": "12"}),
+    ("screen-share-offer", {"offer": {"type": "offer", "sdp": SDP}, "fromUserId": "12"}),
+    ("missed_messages x200", {"messages": [dict(MESSAGE, id=i, text=f"message {i} {MESSAGE['text']}")
+                                           for i in range(200)], "seq": 200, "more": False}),
+]
+
+
+def frames(payload):
+    encoded = packet.Packet(packet.EVENT, data=["event", payload]).encode()
+    return encoded if isinstance(encoded, list) else [encoded]
+
+
+def size(encoded):
+    return sum(len(frame) if isinstance(frame, bytes) else len(frame.encode()) for frame in encoded)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=2000, help="encodes per payload and codec")
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config.update(SOCKETIO_BINARY_CODEC=True, SOCKETIO_BINARY_THRESHOLD=1024, SOCKETIO_COMPRESSION_LEVEL=6)
+    codec = PayloadCodec()
+    codec.init_app(app, None)
+
+    def binary(payload):
+        encoded = codec.encode(payload)
+        return frames(payload if encoded is None else encoded)
+
+    print(f"{'payload':<22} {'json B':>7} {'json us':>8} {'binary B':>9} {'binary us':>10}")
+    for name, payload in PAYLOADS:
+        json_us = timeit.timeit(lambda: frames(payload), number=args.repeat) / args.repeat * 1e6
+        binary_us = timeit.timeit(lambda: binary(payload), number=args.repeat) / args.repeat * 1e6
+        print(f"{name:<22} {size(frames(payload)):>7} {json_us:>8.1f} {size(binary(payload)):>9} {binary_us:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
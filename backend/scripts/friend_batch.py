@@ -0,0 +1,79 @@
+"""
+Compare sending and accepting friend requests one request per call with
+the batch endpoints.
+
+Fills a fresh database with synthetic users, then through the Flask test
+client:
+  send    one user sends --items requests with POST /friend-request per
+          item, and another --items with one POST /friend-requests/batch
+  accept  --items pending requests to one user are accepted with POST
+          /friend-request/respond per item; --items to another user with
+          one POST /friend-requests/respond/batch
+
+    python scripts/friend_batch.py --items 1000 --users 4000
+
+Run from backend/.
+"""
+import argparse
+import time
+
+import bench
+from app import create_app
+from app.database import db_connection
+
+
+def timed(fn):
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--items", type=int, default=1000, help="requests per run, at most 1000")
+    parser.add_argument("--users", type=int, default=4000, help="synthetic users, at least 3 * items")
+    args = parser.parse_args()
+
+    client = create_app().test_client()
+    loop_user, batch_user = bench.register(client, 0), bench.register(client, 1)
+    with db_connection() as conn:
+        conn.executemany("INSERT INTO users (name, email, password) VALUES (?, ?, 'x')",
+                         [(f"synthetic{i}", f"synthetic{i}@example.com") for i in range(args.users)])
+        synthetic = [row[0] for row in conn.execute("SELECT id FROM users WHERE email LIKE 'synthetic%' ORDER BY id")]
+    first, second = synthetic[:args.items], synthetic[args.items:2 * args.items]
+
+    def send_loop():
+        for to_user_id in first:
+            client.post("/api/auth/friend-request", json={"from_user_id": loop_user[0], "to_user_id": to_user_id})
+
+    def send_batch():
+        assert client.post("/api/auth/friend-requests/batch", json={"to_user_ids": second},
+                           headers=batch_user[1]).json["sent"] == args.items
+
+    # Requests *to* the two users, from the same synthetic senders
+    with db_connection() as conn:
+        conn.executemany("INSERT INTO friend_requests (from_user_id, to_user_id, status) VALUES (?, ?, 'pending')",
+                         [(sender, recipient) for recipient in (loop_user[0], batch_user[0])
+                          for sender in synthetic[2 * args.items:3 * args.items]])
+        incoming = {recipient: [row[0] for row in conn.execute(
+            "SELECT id FROM friend_requests WHERE to_user_id = ? AND status = 'pending' ORDER BY id", (recipient,))]
+            for recipient in (loop_user[0], batch_user[0])}
+
+    def accept_loop():
+        for request_id in incoming[loop_user[0]]:
+            client.post("/api/auth/friend-request/respond", json={"request_id": request_id, "action": "accept"})
+
+    def accept_batch():
+        assert client.post("/api/auth/friend-requests/respond/batch",
+                           json={"request_ids": incoming[batch_user[0]], "action": "accept"},
+                           headers=batch_user[1]).json["accepted"] == args.items
+
+    print(f"{'':<7} {'per item ms':>11} {'items/s':>8} {'batch ms':>9} {'items/s':>8}")
+    for name, loop, batch in [("send", send_loop, send_batch), ("accept", accept_loop, accept_batch)]:
+        loop_seconds, batch_seconds = timed(loop), timed(batch)
+        print(f"{name:<7} {loop_seconds * 1000:>11.0f} {args.items / loop_seconds:>8.0f} "
+              f"{batch_seconds * 1000:>9.1f} {args.items / batch_seconds:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Measure the server cost of delivering one message to every member of a
+large group.
+
+Creates a group of --members users, each with one session backed by a
+stand-in socket that only counts packets, and a real test-client session
+for the sender. Then sends --messages messages three ways and reports
+server CPU time per message (time.process_time), writer commits included:
+  group room emit    group_message, stored once, one emit to the room
+  per-member loop    a handler storing a row and emitting once per member
+  private_message    the sender calls private_message once per member
+Packets include the message_ids events sent after each commit.
+
+    python scripts/group_fanout.py --members 500 --messages 50
+
+Run from backend/.
+"""
+import argparse
+import time
+import uuid
+
+import eventlet.queue
+
+import bench
+from app import create_app, socketio
+from app.chat.codec import codec
+from app.chat.groups import join_sessions
+from app.chat.persistence import message_writer
+from app.chat.presence import presence
+from app.database import db_connection
+
+
+class CountingSocket:
+    """Engine.IO socket stand-in that counts the packets sent to it."""
+
+    def __init__(self):
+        self.queue = eventlet.queue.Queue()
+        self.closed = False
+        self.sent = 0
+
+    def send(self, pkt):
+        self.sent += 1
+
+
+def connect_members(member_ids):
+    """Give every member one session on a counting socket; returns the sockets."""
+    server = socketio.server
+    sockets = []
+    for user_id in member_ids:
+        eio_sid = f"bench{user_id}"
+        sockets.append(CountingSocket())
+        server.eio.sockets[eio_sid] = sockets[-1]
+        sid = server.manager.connect(eio_sid, "/")
+        presence.add(str(user_id), sid)
+        server.manager.enter_room(sid, "/", codec.room_for(str(user_id), sid))
+    return sockets
+
+
+def route_packets(stand_in, test_client):
+    """Send packets for stand-in sessions through the server, the rest to the test client."""
+    return lambda eio_sid, pkt: (stand_in if eio_sid.startswith("bench") else test_client)(eio_sid, pkt)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--members", type=int, default=500)
+    parser.add_argument("--messages", type=int, default=50)
+    args = parser.parse_args()
+
+    app = create_app()
+    client = app.test_client()
+    owner_id, headers, token = bench.register(client, 0)
+    with db_connection() as conn:
+        conn.executemany("INSERT INTO users (name, email, password) VALUES (?, ?, 'x')",
+                         [(f"member{i}", f"member{i}@example.com") for i in range(args.members)])
+        member_ids = [row[0] for row in conn.execute("SELECT id FROM users WHERE email LIKE 'member%' ORDER BY id")]
+    conversation_id = client.post("/api/chat/conversations", json={"name": "bench", "member_ids": member_ids},
+                                  headers=headers).json["conversation"]["id"]
+
+    sockets = connect_members(member_ids)
+    with app.app_context():
+        join_sessions(conversation_id, member_ids)
+    server = socketio.server
+    send_packet, send_eio_packet = server._send_packet, server._send_eio_packet
+    sender = socketio.test_client(app, query_string=f"token={token}")  # patches both for its sessions
+    server._send_packet = route_packets(send_packet, server._send_packet)
+    server._send_eio_packet = route_packets(send_eio_packet, server._send_eio_packet)
+
+    def group_room_emit():
+        for i in range(args.messages):
+            sender.emit("group_message", {"conversationId": conversation_id, "text": f"hello {i}"}, callback=True)
+
+    def per_member_loop():
+        for i in range(args.messages):
+            timestamp = int(time.time() * 1000)
+            for user_id in member_ids:
+                key = uuid.uuid4().hex
+                message_writer.submit({"key": key, "from": str(owner_id), "to": str(user_id), "text": f"hello {i}",
+                                       "timestamp": timestamp, "delivered": True})
+                codec.emit_to_user("private_message", {"key": key, "from": str(owner_id), "text": f"hello {i}",
+                                                       "timestamp": timestamp}, str(user_id))
+
+    def private_messages():
+        for i in range(args.messages):
+            for user_id in member_ids:
+                sender.emit("private_message", {"to": user_id, "text": f"hello {i}"}, callback=True)
+
+    print(f"{'':<18} {'cpu ms/msg':>10} {'packets':>8}")
+    for name, send in [("group room emit", group_room_emit), ("per-member loop", per_member_loop),
+                       ("private_message", private_messages)]:
+        for socket in sockets:
+            socket.sent = 0
+        started = time.process_time()
+        send()
+        message_writer.flush()
+        cpu = (time.process_time() - started) / args.messages
+        sender.get_received()
+        print(f"{name:<18} {cpu * 1000:>10.2f} {sum(socket.sent for socket in sockets):>8}")
+
+
+if __name__ == "__main__":
+    main()
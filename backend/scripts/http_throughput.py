@@ -0,0 +1,129 @@
+"""
+Measure requests per second for the friends list and chat history
+endpoints against a real eventlet server.
+
+Starts one server on a fresh database, registers a user with a number of
+friends and a conversation with one of them, then has several client
+processes issue the same authenticated GET for a fixed time and reports
+requests per second for each endpoint.
+
+    python scripts/http_throughput.py --friends 38 --messages 50 --seconds 10
+
+Run from backend/. --tree points the server at another checkout's
+backend/ directory, which is how the numbers before a change are taken:
+
+    git worktree add /tmp/eirem-before <commit>^
+    python scripts/http_throughput.py --tree /tmp/eirem-before/backend
+
+Seed rows are written with sqlite3 directly so the same script works on
+trees that predate the current schema. Keep --messages at or below the
+history page size (50) so both trees return the same rows.
+"""
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER = '''
+import sys
+import eventlet
+eventlet.monkey_patch()
+from app import create_app, socketio
+from app.database import init_db
+app = create_app()
+init_db()
+socketio.run(app, host="127.0.0.1", port=int(sys.argv[1]), log_output=False)
+'''
+
+
+def start_server(tree, port, directory, env):
+    # Older trees open eirem.db relative to the working directory
+    server = subprocess.Popen([sys.executable, "-c", SERVER, str(port)], cwd=directory,
+                              env=dict(env, PYTHONPATH=tree),
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            requests.get(f"http://127.0.0.1:{port}/api/auth/friends", timeout=1)
+            return server
+        except requests.ConnectionError:
+            if server.poll() is not None or time.monotonic() > deadline:
+                server.kill()
+                raise RuntimeError(f"Server on port {port} did not start")
+            time.sleep(0.2)
+
+
+def seed(url, database, friends, messages):
+    """Register the user under test and its friends; returns (token, id of the friend with history)."""
+    ids = []
+    token = None
+    for i in range(friends + 1):
+        user = {"name": f"bench{i}", "email": f"bench{i}@example.com", "password": "bench-test"}
+        requests.post(f"{url}/api/auth/register", json=user).raise_for_status()
+        if i == 0:
+            response = requests.post(f"{url}/api/auth/login", json=user)
+            response.raise_for_status()
+            token = response.json()["token"]
+            ids.append(response.json()["user"]["id"])
+    with sqlite3.connect(database) as conn:
+        ids += [row[0] for row in conn.execute("SELECT id FROM users WHERE email != ? ORDER BY id",
+                                               ("bench0@example.com",))]
+        conn.executemany("INSERT INTO friend_requests (from_user_id, to_user_id, status) VALUES (?, ?, 'accepted')",
+                         [(ids[0], friend) for friend in ids[1:]])
+        conn.executemany("INSERT INTO messages (from_user_id, to_user_id, text, timestamp) VALUES (?, ?, ?, ?)",
+                         [(ids[i % 2], ids[1 - i % 2], f"message {i}", 1700000000000 + i) for i in range(messages)])
+    return token, ids[1]
+
+
+def run_client(url, token, seconds):
+    """Run in a client process: GET `url` back to back for `seconds`; returns (requests, errors)."""
+    session = requests.Session()
+    session.headers["Authorization"] = f"Bearer {token}"
+    done = errors = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        if session.get(url).status_code != 200:
+            errors += 1
+        done += 1
+    return done, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--tree", default=BACKEND, help="backend/ directory to serve from")
+    parser.add_argument("--friends", type=int, default=38)
+    parser.add_argument("--messages", type=int, default=50, help="messages in the measured conversation")
+    parser.add_argument("--clients", type=int, default=4, help="client processes")
+    parser.add_argument("--seconds", type=float, default=10, help="measuring time per endpoint")
+    parser.add_argument("--port", type=int, default=5700)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="eirem-http-")
+    database = os.path.join(directory, "eirem.db")
+    env = dict(os.environ, EIREM_DB=database, EIREM_SOCKETIO_RATE_LIMITS="0",
+               EIREM_PASSWORD_HASH="pbkdf2:sha256:1000", EIREM_LOG_LEVEL="WARNING")
+    url = f"http://127.0.0.1:{args.port}"
+    server = start_server(os.path.abspath(args.tree), args.port, directory, env)
+    try:
+        token, peer = seed(url, database, args.friends, args.messages)
+        print(f"{'endpoint':<28} {'requests':>9} {'errors':>7} {'req/s':>8}")
+        for path in ["/api/auth/friends", f"/api/auth/messages/{peer}"]:
+            with multiprocessing.Pool(args.clients) as pool:
+                results = pool.starmap(run_client, [(url + path, token, args.seconds)] * args.clients)
+            done = sum(count for count, _ in results)
+            errors = sum(failed for _, failed in results)
+            print(f"{path:<28} {done:>9} {errors:>7} {done / args.seconds:>8.0f}")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
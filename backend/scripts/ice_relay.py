@@ -0,0 +1,53 @@
+"""
+Measure how fast the server relays trickled ICE candidates and how many
+events the peer receives for them.
+
+Connects two users through the Socket.IO test client and sends a fixed
+number of single ice-candidate events from one to the other. Each
+--max-batch value is one run: 1 flushes every candidate on its own, as
+relaying did before candidates were coalesced; 100 is the default.
+
+    python scripts/ice_relay.py --candidates 20000 --max-batch 1 100
+
+Run from backend/.
+"""
+import argparse
+import time
+
+import eventlet
+
+import bench
+from app import create_app, socketio
+from app.video.signaling import candidate_batcher
+
+CANDIDATE = {"candidate": "candidate:1 1 udp 2122260223 192.168.1.2 54400 typ host", "sdpMid": "0",
+             "sdpMLineIndex": 0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--candidates", type=int, default=20000)
+    parser.add_argument("--max-batch", type=int, nargs="+", default=[1, 100])
+    args = parser.parse_args()
+
+    app = create_app()
+    client = app.test_client()
+    (_, _, sender_token), (recipient_id, _, recipient_token) = bench.register(client, 0), bench.register(client, 1)
+    sender = socketio.test_client(app, query_string=f"token={sender_token}")
+    recipient = socketio.test_client(app, query_string=f"token={recipient_token}")
+
+    print(f"{'max batch':>9} {'candidates/s':>13} {'events':>7}")
+    for max_batch in args.max_batch:
+        candidate_batcher.max_batch = max_batch
+        recipient.get_received()
+        started = time.perf_counter()
+        for _ in range(args.candidates):
+            sender.emit("ice-candidate", {"candidate": CANDIDATE, "targetUserId": recipient_id})
+        eventlet.sleep(candidate_batcher.window * 2)  # let the last window close
+        elapsed = time.perf_counter() - started
+        events = len(recipient.get_received())
+        print(f"{max_batch:>9} {args.candidates / elapsed:>13.0f} {events:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Measure private_message throughput while the server logs to a file or
+to a slow reader on stdout.
+
+Each run starts a child process that connects two users through the
+Socket.IO test client and sends acked private messages, best of three
+rounds. The child's stdout, where log records go, is either a file or a
+pipe that the parent drains slowly (4 KiB every 10 ms), so a logger that
+writes on the hub stalls every handler behind it.
+
+    python scripts/log_throughput.py --messages 3000 --levels INFO DEBUG
+
+Run from backend/. DEBUG runs also set EIREM_LOG_SAMPLE_RATE=1 so every
+per-message record is written.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+SCRIPT = os.path.abspath(__file__)
+
+
+def send_messages(count):
+    """Run in the child: returns the best messages/s over three rounds."""
+    import eventlet
+
+    import bench
+    from app import create_app, socketio
+
+    app = create_app()
+    client = app.test_client()
+    (_, _, sender_token), (recipient_id, _, recipient_token) = bench.register(client, 0), bench.register(client, 1)
+    sender = socketio.test_client(app, query_string=f"token={sender_token}")
+    recipient = socketio.test_client(app, query_string=f"token={recipient_token}")
+    best = 0
+    for _ in range(3):
+        started = time.perf_counter()
+        for i in range(count):
+            sender.emit("private_message", {"to": recipient_id, "text": "hello there " * 4, "clientId": str(i)},
+                        callback=True)
+        best = max(best, count / (time.perf_counter() - started))
+        eventlet.sleep(0.1)
+        sender.get_received()
+        recipient.get_received()
+    return best
+
+
+def drain_slowly(stream):
+    while stream.read1(4096):
+        time.sleep(0.01)
+
+
+def measure(level, sink, count):
+    env = dict(os.environ, EIREM_LOG_LEVEL=level)
+    if level == "DEBUG":
+        env["EIREM_LOG_SAMPLE_RATE"] = "1"
+    command = [sys.executable, SCRIPT, "--child", str(count)]
+    if sink == "file":
+        with tempfile.TemporaryFile() as log:
+            result = subprocess.run(command, env=env, stdout=log, stderr=subprocess.PIPE, text=True, check=True)
+        return float(result.stderr.split()[-1])
+    child = subprocess.Popen(command, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    reader = threading.Thread(target=drain_slowly, args=(child.stdout,), daemon=True)
+    reader.start()
+    stderr = child.stderr.read().decode()
+    child.wait()
+    if child.returncode:
+        raise RuntimeError(stderr)
+    return float(stderr.split()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--messages", type=int, default=3000, help="messages per round")
+    parser.add_argument("--levels", nargs="+", default=["INFO", "DEBUG"])
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        best = send_messages(args.child)
+        sys.stderr.write(f"\n{best:.0f}\n")  # last on stderr, after any warnings
+        return
+
+    print(f"{'level':<6} {'stdout':<12} {'msg/s':>7}")
+    for level in args.levels:
+        for sink in ["file", "slow reader"]:
+            print(f"{level:<6} {sink:<12} {measure(level, sink, args.messages):>7.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Measure chat latency while a burst of logins hashes passwords.
+
+Registers --logins users with the configured hash method (scrypt by
+default, as in production), then logs them all in at once while a probe
+sends an acked private_message every 10 ms and records how late each one
+completes. "hub" runs the hashes inline on the hub, as login did before
+hashing moved to eventlet's thread pool; "threads" is the current path.
+
+    python scripts/login_storm.py --logins 32 --modes hub threads
+
+Run from backend/.
+"""
+import argparse
+import os
+import time
+import types
+
+import eventlet
+
+
+def measure(app, socketio, logins, probe_tokens):
+    sender_token, (recipient_id, recipient_token) = probe_tokens
+    sender = socketio.test_client(app, query_string=f"token={sender_token}")
+    recipient = socketio.test_client(app, query_string=f"token={recipient_token}")
+    latencies = []
+    done = False
+
+    def probe():
+        due = time.monotonic()
+        while not done:
+            due += 0.01
+            eventlet.sleep(max(due - time.monotonic(), 0))
+            sender.emit("private_message", {"to": recipient_id, "text": "ping"}, callback=True)
+            latencies.append(time.monotonic() - due)
+
+    def login(n):
+        user = {"email": f"bench{n}@example.com", "password": "bench-test"}
+        assert app.test_client().post("/api/auth/login", json=user).status_code == 200
+
+    prober = eventlet.spawn(probe)
+    eventlet.sleep(0.3)
+    latencies.clear()
+    started = time.perf_counter()
+    pool = eventlet.GreenPool(logins)
+    for n in range(logins):
+        pool.spawn(login, n)
+    pool.waitall()
+    elapsed = time.perf_counter() - started
+    done = True
+    prober.wait()
+    sender.disconnect()
+    recipient.disconnect()
+
+    latencies.sort()
+    percentiles = [latencies[min(int(len(latencies) * q), len(latencies) - 1)] * 1000 for q in (0.5, 0.99, 1)]
+    return elapsed, percentiles, len(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--logins", type=int, default=32)
+    parser.add_argument("--hash", default="scrypt", help="werkzeug hash method, as in EIREM_PASSWORD_HASH")
+    parser.add_argument("--modes", nargs="+", choices=["hub", "threads"], default=["hub", "threads"])
+    args = parser.parse_args()
+
+    os.environ["EIREM_PASSWORD_HASH"] = args.hash
+    import bench
+    from app import create_app, socketio
+    from app.auth import passwords
+
+    app = create_app()
+    client = app.test_client()
+    users = [bench.register(client, n) for n in range(args.logins)]
+    probe_tokens = (users[0][2], (users[1][0], users[1][2]))
+    tpool = passwords.tpool
+
+    print(f"{'mode':<8} {'storm s':>7} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'probes':>6}")
+    for mode in args.modes:
+        passwords.tpool = types.SimpleNamespace(execute=lambda func, *a: func(*a)) if mode == "hub" else tpool
+        elapsed, (p50, p99, worst), probes = measure(app, socketio, args.logins, probe_tokens)
+        print(f"{mode:<8} {elapsed:>7.2f} {p50:>8.1f} {p99:>8.1f} {worst:>8.1f} {probes:>6}")
+    passwords.tpool = tpool
+
+
+if __name__ == "__main__":
+    main()
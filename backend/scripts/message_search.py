@@ -0,0 +1,60 @@
+"""
+Measure GET /api/chat/messages/search on a large message table.
+
+Fills a fresh database with synthetic messages between 2000 users (eight
+words each, drawn from the NATO alphabet plus 5000 filler words), then
+times word, phrase and prefix queries through the Flask test client with
+the response cache off.
+
+    python scripts/message_search.py --messages 2000000 --repeat 50
+
+Run from backend/. Loading 2M rows and their index takes a few minutes.
+"""
+import argparse
+import random
+import time
+
+import bench
+from app import create_app
+from app.database import db_connection
+from app.http_cache import response_cache
+
+WORDS = ["alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel", "india", "juliet", "kilo",
+         "lima", "mike", "november", "oscar", "papa", "quebec", "romeo", "sierra", "tango"]
+WORDS += [f"w{i}" for i in range(5000)]
+LOAD_BATCH = 50000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--messages", type=int, default=2000000)
+    parser.add_argument("--repeat", type=int, default=50, help="requests per query")
+    parser.add_argument("--queries", nargs="+", default=["tango", "alpha bravo", "w12", "hello"])
+    args = parser.parse_args()
+
+    client = create_app().test_client()
+    response_cache.enabled = False
+    users = [bench.register(client, n) for n in range(3)]
+    _, headers, _ = users[0]
+
+    random.seed(2)
+    started = time.perf_counter()
+    with db_connection() as conn:
+        for offset in range(0, args.messages, LOAD_BATCH):
+            conn.executemany("INSERT INTO messages (from_user_id, to_user_id, text, timestamp) VALUES (?, ?, ?, ?)",
+                             [(random.randint(1, 2000), random.randint(1, 2000), " ".join(random.choices(WORDS, k=8)), i)
+                              for i in range(offset, min(offset + LOAD_BATCH, args.messages))])
+        conn.execute("INSERT INTO messages (from_user_id, to_user_id, text, timestamp) VALUES (?, ?, ?, ?)",
+                     (users[0][0], users[1][0], "hello there tango friend", args.messages))
+    print(f"loaded {args.messages} messages in {time.perf_counter() - started:.1f} s")
+
+    print(f"{'query':<16} {'results':>7} {'ms':>7}")
+    for query in args.queries:
+        def search():
+            return client.get(f"/api/chat/messages/search?q={query}", headers=headers)
+        results = len(search().json["results"])
+        print(f"{query:<16} {results:>7} {bench.per_call(search, args.repeat) * 1000:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
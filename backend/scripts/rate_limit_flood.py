@@ -0,0 +1,139 @@
+"""
+Measure how well-behaved users fare while another client floods the
+server with private messages, with socket rate limits off and on.
+
+For each setting, starts a server on a fresh database and has five users
+each make an acked private_message call every 200 ms, first with no
+other traffic and then while --flooders processes send private_message
+without waiting for acks (reconnecting whenever they are dropped). A call
+that fails or is not queued counts as 10 s.
+
+    python scripts/rate_limit_flood.py --limits 0 1 --flooders 1 --seconds 6
+
+Run from backend/.
+"""
+import argparse
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+import socketio
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER = '''
+import sys
+import eventlet
+eventlet.monkey_patch()
+from app import create_app, socketio
+socketio.run(create_app(), host="127.0.0.1", port=int(sys.argv[1]), log_output=False)
+'''
+GOOD_USERS = 5
+FAILED_CALL = 10
+
+
+def start_server(port, env):
+    server = subprocess.Popen([sys.executable, "-c", SERVER, str(port)], cwd=BACKEND, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            requests.get(f"http://127.0.0.1:{port}/metrics", timeout=1)
+            return server
+        except requests.ConnectionError:
+            if time.monotonic() > deadline:
+                server.kill()
+                raise RuntimeError(f"Server on port {port} did not start")
+            time.sleep(0.2)
+
+
+def create_users(url, count):
+    users = []
+    for i in range(count):
+        user = {"name": f"flood{i}", "email": f"flood{i}@example.com", "password": "flood-test"}
+        requests.post(f"{url}/api/auth/register", json=user).raise_for_status()
+        response = requests.post(f"{url}/api/auth/login", json=user)
+        response.raise_for_status()
+        users.append((response.json()["user"]["id"], response.json()["token"]))
+    return users
+
+
+def flood(url, token, target, stop_at):
+    """Run in a flooder process: returns (messages sent, times dropped)."""
+    sent = drops = 0
+    while time.time() < stop_at:
+        client = socketio.Client()
+        try:
+            client.connect(f"{url}?token={token}", transports=["websocket"])
+            while time.time() < stop_at:
+                client.emit("private_message", {"to": target, "text": "spam" * 20})
+                sent += 1
+        except Exception:
+            drops += 1
+        finally:
+            client.disconnect()
+    return sent, drops
+
+
+def behave(url, token, target, stop_at):
+    """Run in a well-behaved user's process: returns call latencies in seconds."""
+    client = socketio.Client()
+    client.connect(f"{url}?token={token}", transports=["websocket"])
+    latencies = []
+    while time.time() < stop_at:
+        started = time.perf_counter()
+        try:
+            reply = client.call("private_message", {"to": target, "text": "hi"}, timeout=FAILED_CALL)
+        except socketio.exceptions.TimeoutError:
+            reply = None
+        latencies.append(time.perf_counter() - started if reply and reply.get("queued") else FAILED_CALL)
+        time.sleep(0.2)
+    client.disconnect()
+    return latencies
+
+
+def run_phase(url, users, flooders, seconds):
+    stop_at = time.time() + seconds
+    good = users[1:GOOD_USERS + 1]
+    with multiprocessing.Pool(GOOD_USERS + flooders) as pool:
+        calls = [pool.apply_async(behave, (url, token, good[(i + 1) % GOOD_USERS][0], stop_at))
+                 for i, (_, token) in enumerate(good)]
+        floods = [pool.apply_async(flood, (url, users[0][1], good[0][0], stop_at)) for _ in range(flooders)]
+        latencies = sorted(sum((call.get() for call in calls), []))
+        flooded = sum(result.get()[0] for result in floods)
+    percentiles = [latencies[min(int(len(latencies) * q), len(latencies) - 1)] * 1000 for q in (0.5, 0.99, 1)]
+    return percentiles, len(latencies), flooded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--limits", nargs="+", choices=["0", "1"], default=["0", "1"],
+                        help="EIREM_SOCKETIO_RATE_LIMITS values to run")
+    parser.add_argument("--flooders", type=int, default=1, help="flooding processes")
+    parser.add_argument("--seconds", type=float, default=6, help="length of each phase")
+    parser.add_argument("--port", type=int, default=5800)
+    args = parser.parse_args()
+
+    print(f"{'limits':<7} {'phase':<6} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'calls':>6} {'flooded':>8}")
+    for limits in args.limits:
+        directory = tempfile.mkdtemp(prefix="eirem-flood-")
+        env = dict(os.environ, EIREM_DB=os.path.join(directory, "flood.db"), EIREM_SOCKETIO_RATE_LIMITS=limits,
+                   EIREM_PASSWORD_HASH="pbkdf2:sha256:1000", EIREM_LOG_LEVEL="WARNING")
+        server = start_server(args.port, env)
+        try:
+            url = f"http://127.0.0.1:{args.port}"
+            users = create_users(url, GOOD_USERS + 1)
+            for phase, flooders in [("idle", 0), ("flood", args.flooders)]:
+                (p50, p99, worst), calls, flooded = run_phase(url, users, flooders, args.seconds)
+                print(f"{'on' if limits == '1' else 'off':<7} {phase:<6} {p50:>8.1f} {p99:>8.1f} {worst:>8.0f} "
+                      f"{calls:>6} {flooded:>8}")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
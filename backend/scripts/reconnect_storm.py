@@ -0,0 +1,56 @@
+"""
+Measure Socket.IO handshakes per second when one client reconnects over
+and over with the same token.
+
+Connects and disconnects through the Socket.IO test client, best of two
+rounds. With "uncached" the verified-token cache is cleared before every
+connect, so each handshake decodes and checks the token as connect did
+before tokens were cached. Also reports the cost of decode_token against
+a cached verify_token.
+
+    python scripts/reconnect_storm.py --cycles 3000
+
+Run from backend/.
+"""
+import argparse
+import time
+
+import bench
+from app import create_app, socketio
+from app.auth import tokens
+
+
+def handshakes_per_second(app, token, cycles, cached):
+    best = 0
+    for _ in range(2):
+        started = time.perf_counter()
+        for _ in range(cycles):
+            if not cached:
+                tokens._verified.clear()
+            socketio.test_client(app, query_string=f"token={token}").disconnect()
+        best = max(best, cycles / (time.perf_counter() - started))
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--cycles", type=int, default=3000, help="connect/disconnect cycles per round")
+    parser.add_argument("--calls", type=int, default=20000, help="calls when timing token verification")
+    args = parser.parse_args()
+
+    app = create_app()
+    _, _, token = bench.register(app.test_client(), 0)
+
+    print(f"{'token cache':<12} {'handshakes/s':>12}")
+    for cached in (False, True):
+        print(f"{'on' if cached else 'off':<12} {handshakes_per_second(app, token, args.cycles, cached):>12.0f}")
+
+    with app.app_context():
+        decode = bench.per_call(lambda: tokens.decode_token(token), args.calls)
+        tokens.verify_token(token)
+        verify = bench.per_call(lambda: tokens.verify_token(token), args.calls)
+    print(f"decode_token {decode * 1e6:.0f} us, cached verify_token {verify * 1e6:.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Measure GET /api/auth/users on a large user directory: prefix searches
+and keyset pages deep into the list.
+
+Fills a fresh database with synthetic users (random two-word names,
+userN@example.com emails) and times each query through the Flask test
+client, with the response cache off so every request runs the query.
+
+    python scripts/user_directory.py --users 100000 --repeat 200
+
+Run from backend/.
+"""
+import argparse
+import random
+import string
+
+import bench
+from app import create_app
+from app.database import db_connection
+from app.http_cache import response_cache
+
+
+def random_word(length):
+    return "".join(random.choices(string.ascii_lowercase, k=length)).title()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=200, help="requests per query")
+    parser.add_argument("--queries", nargs="+", default=["ab", "user12", "qwe rt", "example"])
+    args = parser.parse_args()
+
+    client = create_app().test_client()
+    response_cache.enabled = False
+    _, headers, _ = bench.register(client, 0)
+    random.seed(1)
+    with db_connection() as conn:
+        conn.executemany("INSERT INTO users (name, email, password) VALUES (?, ?, 'x')",
+                         [(f"{random_word(6)} {random_word(7)}", f"user{i}@example.com") for i in range(args.users)])
+
+    def get(query):
+        return lambda: client.get(f"/api/auth/users?{query}&limit=50", headers=headers)
+
+    print(f"{'query':<24} {'rows':>5} {'ms':>7}")
+    deep_cursor = args.users * 9 // 10
+    for label, query in [(f"q={q}", f"q={q}") for q in args.queries] + [
+            ("first page", "q="), (f"cursor={deep_cursor}", f"cursor={deep_cursor}")]:
+        rows = len(get(query)().json["users"])
+        print(f"{label:<24} {rows:>5} {bench.per_call(get(query), args.repeat) * 1000:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Measure how private message throughput scales with the number of
+Socket.IO workers sharing a message queue.
+
+For each worker count, starts that many workers on consecutive ports
+against a fresh database and SQLite bus (as EIREM_MESSAGE_QUEUE would in
+production), connects sender/recipient pairs on *different* workers so
+every message crosses the bus, sends a fixed number of messages per
+sender and reports delivered messages per second.
+
+    python scripts/worker_throughput.py --workers 1 2 4 --pairs 40 --messages 200
+
+Run from backend/. Clients are spread over several processes so they are
+not the bottleneck; rate limits are turned off for the run.
+"""
+import argparse
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+import socketio
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKER = '''
+import sys
+import eventlet
+eventlet.monkey_patch()
+from app import create_app, socketio
+socketio.run(create_app(), host="127.0.0.1", port=int(sys.argv[1]), log_output=False)
+'''
+
+
+def start_workers(count, base_port, env):
+    workers = [subprocess.Popen([sys.executable, "-c", WORKER, str(base_port + i)], cwd=BACKEND, env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) for i in range(count)]
+    for i in range(count):
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                requests.get(f"http://127.0.0.1:{base_port + i}/metrics", timeout=1)
+                break
+            except requests.ConnectionError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"Worker on port {base_port + i} did not start")
+                time.sleep(0.2)
+    return workers
+
+
+def create_users(url, count):
+    tokens = []
+    for i in range(count):
+        user = {"name": f"load{i}", "email": f"load{i}@example.com", "password": "load-test"}
+        requests.post(f"{url}/api/auth/register", json=user).raise_for_status()
+        response = requests.post(f"{url}/api/auth/login", json=user)
+        response.raise_for_status()
+        tokens.append((response.json()["user"]["id"], response.json()["token"]))
+    return tokens
+
+
+def run_clients(pairs, messages):
+    """Run in a client process: `pairs` is [(sender url, token, recipient url, token, recipient id)]."""
+    received = 0
+    done = threading.Event()
+    lock = threading.Lock()
+    expected = len(pairs) * messages
+
+    def on_message(_):
+        nonlocal received
+        with lock:
+            received += 1
+            if received == expected:
+                done.set()
+
+    clients = []
+    for sender_url, sender_token, recipient_url, recipient_token, recipient_id in pairs:
+        recipient = socketio.Client()
+        recipient.on("private_message", on_message)
+        recipient.connect(f"{recipient_url}?token={recipient_token}", transports=["websocket"])
+        sender = socketio.Client()
+        sender.connect(f"{sender_url}?token={sender_token}", transports=["websocket"])
+        clients += [recipient, sender]
+    time.sleep(1)  # let presence reach every worker
+
+    started = time.perf_counter()
+    for i in range(messages):
+        for (_, _, _, _, recipient_id), sender in zip(pairs, clients[1::2]):
+            sender.emit("private_message", {"to": recipient_id, "text": f"load {i}"})
+    done.wait(timeout=60)
+    elapsed = time.perf_counter() - started
+    for client in clients:
+        client.disconnect()
+    return received, elapsed
+
+
+def measure(worker_count, pairs, messages, client_processes, base_port):
+    directory = tempfile.mkdtemp(prefix="eirem-load-")
+    env = dict(os.environ, EIREM_DB=os.path.join(directory, "load.db"),
+               EIREM_MESSAGE_QUEUE=f"sqlite:///{os.path.join(directory, 'bus.db')}",
+               EIREM_SOCKETIO_RATE_LIMITS="0", EIREM_PASSWORD_HASH="pbkdf2:sha256:1000",
+               EIREM_LOG_LEVEL="WARNING")
+    # Migrate once up front rather than racing in every worker
+    subprocess.run([sys.executable, "-c", "from app import create_app; create_app()"],
+                   cwd=BACKEND, env=env, check=True, stdout=subprocess.DEVNULL)
+    workers = start_workers(worker_count, base_port, env)
+    try:
+        urls = [f"http://127.0.0.1:{base_port + i}" for i in range(worker_count)]
+        users = create_users(urls[0], pairs * 2)
+        plan = [(urls[i % worker_count], users[2 * i][1],
+                 urls[(i + 1) % worker_count], users[2 * i + 1][1], users[2 * i + 1][0]) for i in range(pairs)]
+        with multiprocessing.Pool(client_processes) as pool:
+            results = pool.starmap(run_clients, [(plan[i::client_processes], messages)
+                                                 for i in range(client_processes)])
+    finally:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.wait()
+
+    received = sum(count for count, _ in results)
+    elapsed = max(seconds for _, seconds in results)
+    return received, pairs * messages, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--pairs", type=int, default=40, help="sender/recipient pairs")
+    parser.add_argument("--messages", type=int, default=200, help="messages per sender")
+    parser.add_argument("--clients", type=int, default=4, help="client processes")
+    parser.add_argument("--port", type=int, default=5600, help="first worker port")
+    args = parser.parse_args()
+
+    print(f"{'workers':>7} {'delivered':>10} {'seconds':>8} {'msg/s':>8}")
+    for worker_count in args.workers:
+        received, sent, elapsed = measure(worker_count, args.pairs, args.messages,
+                                          min(args.clients, args.pairs), args.port)
+        print(f"{worker_count:>7} {received:>5}/{sent:<4} {elapsed:>8.2f} {received / elapsed:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
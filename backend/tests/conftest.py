@@ -0,0 +1,34 @@
+import itertools
+import os
+import tempfile
+
+import pytest
+
+# Before anything imports app.database, which reads EIREM_DB once
+os.environ["EIREM_DB"] = os.path.join(tempfile.mkdtemp(prefix="eirem-tests-"), "test.db")
+os.environ.setdefault("EIREM_PASSWORD_HASH", "pbkdf2:sha256:1000")
+
+_user_numbers = itertools.count()
+
+
+@pytest.fixture(scope="session")
+def app():
+    from app import create_app
+    return create_app()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_user(client):
+    """Register a fresh user; returns (id, auth headers, token)."""
+    def make():
+        n = next(_user_numbers)
+        user = {"name": f"user{n}", "email": f"user{n}@example.com", "password": "password"}
+        client.post("/api/auth/register", json=user)
+        login = client.post("/api/auth/login", json=user).json
+        return login["user"]["id"], {"Authorization": f"Bearer {login['token']}"}, login["token"]
+    return make
@@ -0,0 +1,86 @@
+"""Live delivery over Socket.IO and the ids that let clients resume."""
+import pytest
+
+from app import socketio
+from app.chat.persistence import message_writer
+
+
+@pytest.fixture
+def connect(app):
+    clients = []
+
+    def connect(token):
+        client = socketio.test_client(app, query_string=f"token={token}")
+        clients.append(client)
+        return client
+    yield connect
+    for client in clients:
+        if client.is_connected():
+            client.disconnect()
+
+
+def received(client, event):
+    return [m["args"][0] for m in client.get_received() if m["name"] == event]
+
+
+def test_private_message_is_delivered_before_commit_then_gets_its_id(connect, make_user):
+    _, _, sender_token = make_user()
+    recipient, _, recipient_token = make_user()
+    sender, receiver = connect(sender_token), connect(recipient_token)
+    receiver.get_received()
+
+    sender.emit("private_message", {"to": recipient, "text": "hello"}, callback=True)
+    live = receiver.get_received()
+    assert [m["name"] for m in live] == ["private_message"]
+    message = live[0]["args"][0]
+    assert message["text"] == "hello" and "id" not in message
+
+    message_writer.flush()
+    ids = received(receiver, "message_ids")
+    assert list(ids[0]["ids"]) == [message["key"]]
+    seq = ids[0]["ids"][message["key"]]
+    assert [ack["id"] for ack in received(sender, "message_ack")] == [seq]
+
+    # Resuming from that id re-sends nothing
+    assert receiver.emit("resume", {"seq": seq}, callback=True)["seq"] == seq
+    assert received(receiver, "missed_messages") == [{"messages": [], "seq": seq, "more": False}]
+
+
+def test_group_messages_get_ids_and_resume(client, connect, make_user):
+    owner, owner_headers, owner_token = make_user()
+    member, _, member_token = make_user()
+    group = client.post("/api/chat/conversations", json={"name": "team", "member_ids": [member]},
+                        headers=owner_headers).json["conversation"]["id"]
+    sender, receiver = connect(owner_token), connect(member_token)
+    receiver.get_received()
+
+    sender.emit("group_message", {"conversationId": group, "text": "one"}, callback=True)
+    live = received(receiver, "group_message")
+    assert live[0]["text"] == "one" and live[0]["conversationId"] == group
+    message_writer.flush()
+    first_id = received(receiver, "message_ids")[0]["ids"][live[0]["key"]]
+
+    receiver.disconnect()
+    for text in ("two", "three"):
+        sender.emit("group_message", {"conversationId": group, "text": text}, callback=True)
+    message_writer.flush()
+
+    receiver = connect(member_token)
+    receiver.get_received()
+    reply = receiver.emit("resume", {"seq": 0, "conversations": {str(group): first_id}}, callback=True)
+    missed = [m for m in received(receiver, "missed_messages") if m.get("conversationId") == group]
+    assert [m["text"] for m in missed[0]["messages"]] == ["two", "three"]
+    assert reply["conversations"] == {str(group): missed[0]["messages"][-1]["id"]}
+
+
+def test_resume_skips_groups_the_user_is_not_in(client, connect, make_user):
+    _, owner_headers, _ = make_user()
+    _, _, outsider_token = make_user()
+    group = client.post("/api/chat/conversations", json={"name": "team", "member_ids": []},
+                        headers=owner_headers).json["conversation"]["id"]
+    outsider = connect(outsider_token)
+    outsider.get_received()
+
+    reply = outsider.emit("resume", {"seq": 0, "conversations": {str(group): 0}}, callback=True)
+    assert reply["conversations"] == {}
+    assert not [m for m in received(outsider, "missed_messages") if "conversationId" in m]
@@ -0,0 +1,57 @@
+"""Batched friend requests between users who may already have asked each other."""
+
+
+def pending(client, headers):
+    return client.get("/api/auth/friend-requests/pending", headers=headers).json["requests"]
+
+
+def friends(client, headers):
+    return {f["id"] for f in client.get("/api/auth/friends", headers=headers).json["friends"]}
+
+
+def send(client, headers, to_user_ids):
+    return client.post("/api/auth/friend-requests/batch", json={"to_user_ids": to_user_ids}, headers=headers).json
+
+
+def test_sending_back_accepts_the_incoming_request(client, make_user):
+    alice, alice_headers, _ = make_user()
+    bob, bob_headers, _ = make_user()
+    carol, _, _ = make_user()
+    assert send(client, alice_headers, [bob])["sent"] == 1
+    pending(client, bob_headers)  # cached before the accept
+
+    response = send(client, bob_headers, [alice, carol])
+    assert [r["status"] for r in response["results"]] == ["accepted", "sent"]
+    assert pending(client, bob_headers) == []
+    assert pending(client, alice_headers) == []
+    assert alice in friends(client, bob_headers) and bob in friends(client, alice_headers)
+    assert send(client, alice_headers, [bob])["results"][0]["status"] == "already_friends"
+
+
+def test_accepting_clears_the_mirror_request(client, make_user):
+    alice, alice_headers, _ = make_user()
+    bob, bob_headers, _ = make_user()
+    send(client, alice_headers, [bob])
+    # A mutual pair from before reverse requests were accepted on send
+    from app.database import db_connection
+    with db_connection() as conn:
+        conn.execute("INSERT INTO friend_requests (from_user_id, to_user_id) VALUES (?, ?)", (bob, alice))
+    assert len(pending(client, alice_headers)) == 1
+
+    request_id = pending(client, bob_headers)[0]["request_id"]
+    response = client.post("/api/auth/friend-requests/respond/batch",
+                           json={"request_ids": [request_id], "action": "accept"}, headers=bob_headers).json
+    assert response["accepted"] == 1
+    assert pending(client, alice_headers) == []
+    assert pending(client, bob_headers) == []
+
+
+def test_legacy_request_rejects_non_numeric_ids(client, make_user):
+    alice, _, _ = make_user()
+    bob, bob_headers, _ = make_user()
+    response = client.post("/api/auth/friend-request", json={"from_user_id": alice, "to_user_id": "bob"})
+    assert response.status_code == 400
+
+    response = client.post("/api/auth/friend-request", json={"from_user_id": str(alice), "to_user_id": str(bob)})
+    assert response.json["success"]
+    assert [r["from_user_id"] for r in pending(client, bob_headers)] == [alice]
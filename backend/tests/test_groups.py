@@ -0,0 +1,57 @@
+"""Group conversation membership over the HTTP API."""
+
+
+def create_group(client, headers, member_ids):
+    response = client.post("/api/chat/conversations", json={"name": "team", "member_ids": member_ids},
+                           headers=headers)
+    assert response.status_code == 201, response.json
+    return response.json["conversation"]["id"]
+
+
+def test_owner_leaving_hands_the_group_over(client, make_user):
+    owner, owner_headers, _ = make_user()
+    first, first_headers, _ = make_user()
+    second, second_headers, _ = make_user()
+    group = create_group(client, owner_headers, [first, second])
+
+    before = client.get("/api/chat/conversations", headers=first_headers)
+    assert [c["role"] for c in before.json["conversations"]] == ["member"]
+
+    assert client.delete(f"/api/chat/conversations/{group}/members/{owner}", headers=owner_headers).json["success"]
+
+    # The successor's cached list is invalidated along with the leaver's
+    revalidated = client.get("/api/chat/conversations", headers={**first_headers, "If-None-Match": before.headers["ETag"]})
+    assert revalidated.status_code == 200
+    assert [c["role"] for c in revalidated.json["conversations"]] == ["owner"]
+    assert client.get("/api/chat/conversations", headers=owner_headers).json["conversations"] == []
+
+    members = client.get(f"/api/chat/conversations/{group}/members", headers=second_headers).json["members"]
+    assert {m["id"]: m["role"] for m in members} == {first: "owner", second: "member"}
+    # The new owner can manage the group
+    response = client.delete(f"/api/chat/conversations/{group}/members/{second}", headers=first_headers)
+    assert response.status_code == 200
+
+
+def test_member_leaving_keeps_the_owner(client, make_user):
+    owner, owner_headers, _ = make_user()
+    member, member_headers, _ = make_user()
+    group = create_group(client, owner_headers, [member])
+
+    assert client.delete(f"/api/chat/conversations/{group}/members/{member}", headers=member_headers).json["success"]
+    members = client.get(f"/api/chat/conversations/{group}/members", headers=owner_headers).json["members"]
+    assert members == [{"id": owner, "name": members[0]["name"], "role": "owner"}]
+
+
+def test_group_size_limit_counts_the_owner(client, make_user, monkeypatch):
+    from app.chat import routes
+    monkeypatch.setattr(routes, "MAX_GROUP_MEMBERS", 3)
+    owner, owner_headers, _ = make_user()
+    others = [make_user()[0] for _ in range(3)]
+
+    response = client.post("/api/chat/conversations", json={"name": "team", "member_ids": others},
+                           headers=owner_headers)
+    assert response.status_code == 400
+    # The owner listing themselves doesn't count twice
+    group = create_group(client, owner_headers, [owner, *others[:2]])
+    members = client.get(f"/api/chat/conversations/{group}/members", headers=owner_headers).json["members"]
+    assert len(members) == 3
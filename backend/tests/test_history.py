@@ -0,0 +1,42 @@
+"""One-to-one history pages and the NDJSON export."""
+import json
+
+import pytest
+
+from app.auth import routes
+from app.database import db_connection
+
+
+@pytest.fixture
+def conversation(make_user):
+    me, headers, _ = make_user()
+    peer, _, _ = make_user()
+    with db_connection() as conn:
+        ids = [conn.execute(
+            "INSERT INTO messages (from_user_id, to_user_id, text, timestamp, delivered) VALUES (?, ?, ?, 0, 1)",
+            (me, peer, f"m{i}")
+        ).lastrowid for i in range(12)]
+    return peer, headers, ids
+
+
+def stream(client, peer, headers, query=""):
+    lines = [json.loads(line) for line in
+             client.get(f"/api/auth/messages/{peer}?format=ndjson{query}", headers=headers).data.splitlines()]
+    return [line["id"] for line in lines[:-1]], lines[-1]["next_cursor"]
+
+
+def test_json_pages_are_oldest_first(client, conversation):
+    peer, headers, ids = conversation
+    page = client.get(f"/api/auth/messages/{peer}?limit=5", headers=headers).json
+    assert [m["id"] for m in page["messages"]] == ids[-5:]
+    assert page["next_cursor"] == ids[-5]
+
+
+def test_ndjson_streams_in_cursor_order_across_pages(client, conversation, monkeypatch):
+    monkeypatch.setattr(routes, "NDJSON_PAGE_SIZE", 5)
+    peer, headers, ids = conversation
+
+    assert stream(client, peer, headers) == (ids[::-1], None)
+    assert stream(client, peer, headers, "&limit=7") == (ids[:-8:-1], ids[-7])
+    assert stream(client, peer, headers, f"&after={ids[2]}") == (ids[3:], None)
+    assert stream(client, peer, headers, f"&before={ids[4]}&limit=10") == (ids[3::-1], None)
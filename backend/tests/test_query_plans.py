@@ -0,0 +1,77 @@
+"""The hot queries must stay on their indexes as the schema evolves."""
+import pytest
+
+from app import database
+
+
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_NAME", str(tmp_path / "plans.db"))
+    database.init_db()
+    conn = database.get_db_connection()
+    yield conn
+    conn.close()
+
+
+def plan(conn, sql, params):
+    return [row["detail"] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def assert_searches(steps, table):
+    """Every step touching `table` is an index SEARCH, never a SCAN."""
+    touching = [step for step in steps if f" {table} " in f"{step} "]
+    assert touching, steps
+    for step in touching:
+        assert step.startswith("SEARCH") and ("USING INDEX" in step or "USING COVERING INDEX" in step
+                                              or "USING PRIMARY KEY" in step or "USING INTEGER PRIMARY KEY" in step), steps
+
+
+@pytest.mark.parametrize("condition, order", [("id < ?", "DESC"), ("id > ?", "ASC")])
+def test_history_page(conn, condition, order):
+    steps = plan(conn, f'''
+        SELECT id, from_user_id, to_user_id, text, timestamp FROM messages
+        WHERE conv_lo = ? AND conv_hi = ? AND {condition} ORDER BY id {order} LIMIT ?
+    ''', (1, 2, 100, 50))
+    assert_searches(steps, "messages")
+    assert "idx_messages_conversation" in steps[0]
+    assert not any("TEMP B-TREE" in step for step in steps), steps
+
+
+def test_pending_delivery(conn):
+    steps = plan(conn, '''
+        SELECT id, from_user_id, text, timestamp, attachment_id FROM messages
+        WHERE to_user_id = ? AND delivered = 0
+        ORDER BY id LIMIT ?
+    ''', (1, 500))
+    assert_searches(steps, "messages")
+    assert not any("TEMP B-TREE" in step for step in steps), steps
+
+
+def test_duplicate_friend_request(conn):
+    steps = plan(conn, '''
+        SELECT * FROM friend_requests
+        WHERE from_user_id = ? AND to_user_id = ? AND status = 'pending'
+    ''', (1, 2))
+    assert_searches(steps, "friend_requests")
+
+
+def test_pending_friend_requests(conn):
+    steps = plan(conn, '''
+        SELECT fr.id as request_id, u.id as from_user_id, u.name, u.email
+        FROM friend_requests fr
+        JOIN users u ON fr.from_user_id = u.id
+        WHERE fr.to_user_id = ? AND fr.status = 'pending'
+    ''', (1,))
+    assert_searches(steps, "fr")
+    assert_searches(steps, "u")
+
+
+def test_friends(conn):
+    steps = plan(conn, '''
+        SELECT u.id, u.name, u.email
+        FROM friendships f
+        JOIN users u ON u.id = f.friend_id
+        WHERE f.user_id = ?
+    ''', (1,))
+    assert_searches(steps, "f")
+    assert_searches(steps, "u")
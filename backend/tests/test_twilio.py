@@ -0,0 +1,154 @@
+"""VideoService against a local stand-in for the Twilio Video REST API."""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import eventlet
+import jwt
+import pytest
+from flask import Flask
+
+from app.video import twilio
+from app.video.twilio import VideoService
+
+SLOW_ROOM = "slow"
+
+
+class TwilioStandIn(ThreadingHTTPServer):
+    """Rooms and their participants, served the way /v1/Rooms answers."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.calls = []
+        self.rooms = {}
+        self.delay = 0.05
+        self.slow_delay = 1
+
+    def add_room(self, name):
+        room = {"sid": f"RM{len(self.rooms):032d}", "unique_name": name, "status": "in-progress",
+                "type": "peer-to-peer"}
+        self.rooms[name] = room
+        return room
+
+    def methods(self):
+        return [method for method, _ in self.calls]
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        form = parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode())
+        name = form["UniqueName"][0]
+        self.server.calls.append(("POST", name))
+        time.sleep(self.server.slow_delay if name == SLOW_ROOM else self.server.delay)
+        if name in self.server.rooms:
+            return self.reply(400, {"code": 53113, "message": "Room exists"})
+        self.reply(201, self.server.add_room(name))
+
+    def do_GET(self):
+        self.server.calls.append(("GET", self.path))
+        parts = self.path.split("?")[0].split("/")
+        room = next((r for r in self.server.rooms.values() if parts[3] in (r["sid"], r["unique_name"])), None)
+        if room is None:
+            return self.reply(404, {"code": 20404, "message": "Not found"})
+        if len(parts) > 4:
+            return self.reply(200, {"participants": [{"identity": "alice"}]})
+        self.reply(200, room)
+
+
+@pytest.fixture
+def standin():
+    server = TwilioStandIn()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def service(standin):
+    app = Flask(__name__)
+    app.config.update(
+        TWILIO_ACCOUNT_SID="AC123",
+        TWILIO_API_KEY_SID="SK123",
+        TWILIO_API_KEY_SECRET="secret",
+        TWILIO_VIDEO_API_URL=f"http://127.0.0.1:{standin.server_port}/",
+        TWILIO_ROOM_TYPE="peer-to-peer",
+        TWILIO_CONNECT_TIMEOUT=1,
+        TWILIO_READ_TIMEOUT=0.3,
+        TWILIO_POOL_SIZE=10,
+        TWILIO_TOKEN_TTL=3600,
+        TWILIO_ROOM_CACHE_TTL=5,
+    )
+    service = VideoService()
+    service.init_app(app)
+    yield service
+    service.session.close()
+
+
+def test_concurrent_creates_share_one_request(service, standin):
+    rooms = list(eventlet.GreenPool().imap(service.create_room, ["standup"] * 10))
+
+    assert standin.methods() == ["POST"]
+    assert len({room["sid"] for room in rooms}) == 1
+    assert rooms[0]["name"] == "standup" and rooms[0]["status"] == "in-progress"
+
+
+def test_created_room_is_cached(service, standin):
+    first = service.create_room("standup")
+    assert service.create_room("standup") == first
+    assert standin.methods() == ["POST"]
+
+
+def test_existing_room_falls_back_to_fetching_it(service, standin):
+    existing = standin.add_room("standup")
+
+    room = service.create_room("standup")
+
+    assert room["sid"] == existing["sid"]
+    assert room["participants"] == ["alice"]
+    assert standin.methods() == ["POST", "GET", "GET"]
+
+
+def test_timeout_returns_none(service, standin):
+    started = time.monotonic()
+    assert service.create_room(SLOW_ROOM) is None
+    assert time.monotonic() - started < standin.slow_delay
+    # A failed creation isn't left pending for later callers
+    assert SLOW_ROOM not in service._creating
+
+
+def test_unknown_room_status_is_none(service):
+    assert service.get_room_status("nowhere") is None
+
+
+def test_access_tokens_are_cached_per_identity_and_room(service, monkeypatch):
+    minted = []
+    encode = jwt.encode
+    monkeypatch.setattr(twilio.jwt, "encode", lambda *args, **kwargs: minted.append(args) or encode(*args, **kwargs))
+
+    token = service.create_token("alice", "standup")
+    assert service.create_token("alice", "standup") == token
+    service.create_token("bob", "standup")
+    service.create_token("alice", "retro")
+    assert len(minted) == 3
+
+    claims = jwt.decode(token, "secret", algorithms=["HS256"])
+    assert claims["iss"] == "SK123" and claims["sub"] == "AC123"
+    assert claims["grants"] == {"identity": "alice", "video": {"room": "standup"}}
+    assert claims["exp"] - claims["nbf"] == 3600
+    assert jwt.get_unverified_header(token)["cty"] == "twilio-fpa;v=1"
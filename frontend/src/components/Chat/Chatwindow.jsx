@@ -1,6 +1,6 @@
 import React, { useState, useEffect, useRef } from 'react';
 import { getSocket, getWebRTCService } from '../../services/socket.js';
-import API from '../../services/api';
+import { getChatHistory } from '../../services/api';
 
 const ChatWindow = ({ selectedUser }) => {
   const storedUser = JSON.parse(localStorage.getItem('user'));
@@ -8,6 +8,8 @@ const ChatWindow = ({ selectedUser }) => {
   const [newMessage, setNewMessage] = useState('');
   const [isScreenSharing, setIsScreenSharing] = useState(false);
   const [isStreamAccepted, setIsStreamAccepted] = useState(false);
+  const [olderCursor, setOlderCursor] = useState(null);
+  const loadingOlder = useRef(false);
   const screenVideoRef = useRef(null);
   useEffect(() => {
     const webRTCService = getWebRTCService();
@@ -50,10 +52,12 @@ const ChatWindow = ({ selectedUser }) => {
       return;
     }
 
+    const clientId = `${Date.now()}-${Math.random().toString(36).slice(2)}`;
     const messageObj = {
       from: String(storedUser.id), // Ensure IDs are strings
       to: String(selectedUser.id),
       text: newMessage,
+      clientId,
     };
   
     console.log("Sending message:", messageObj);
@@ -63,7 +67,7 @@ const ChatWindow = ({ selectedUser }) => {
         console.error("Error sending message:", response.error);
         return;
       }
-      setMessages((prev) => [...prev, { from: 'me', text: newMessage }]);
+      setMessages((prev) => [...prev, { clientId, from: 'me', text: newMessage }]);
       setNewMessage('');
     });
   };
@@ -116,16 +120,34 @@ const ChatWindow = ({ selectedUser }) => {
     }
   };
 
+  // History comes in pages, newest first; older ones load on scrolling up
+  const loadOlderMessages = async () => {
+    if (!selectedUser?.id || !olderCursor || loadingOlder.current) return;
+    loadingOlder.current = true;
+    try {
+      const page = await getChatHistory(selectedUser.id, olderCursor);
+      setMessages((prev) => [...page.messages, ...prev]);
+      setOlderCursor(page.nextCursor);
+    } catch (error) {
+      console.error("Error loading older messages:", error);
+    } finally {
+      loadingOlder.current = false;
+    }
+  };
+
+  const handleScroll = (e) => {
+    if (e.target.scrollTop < 50) loadOlderMessages();
+  };
+
   useEffect(() => {
-    // Load chat history when user is selected
+    // Load the newest page of chat history when a user is selected
     const loadChatHistory = async () => {
       if (!selectedUser?.id) return;
       
       try {
-        const response = await API.get(`/auth/messages/${selectedUser.id}`);
-        if (response.data.success) {
-          setMessages(response.data.messages);
-        }
+        const page = await getChatHistory(selectedUser.id);
+        setMessages(page.messages);
+        setOlderCursor(page.nextCursor);
       } catch (error) {
         console.error("Error loading chat history:", error);
       }
@@ -140,15 +162,40 @@ const ChatWindow = ({ selectedUser }) => {
       return;
     }
 
+    // Messages from the selected user, skipping any we already show
+    const appendFromPeer = (incoming) => {
+      const fromPeer = incoming.filter((msg) => String(msg.from) === String(selectedUser?.id));
+      if (!fromPeer.length) return;
+      setMessages((prev) => {
+        const seen = new Set(prev.map((m) => m.id).filter(Boolean));
+        const fresh = fromPeer.filter((msg) => !msg.id || !seen.has(msg.id));
+        return [...prev, ...fresh.map((msg) => ({ id: msg.id, key: msg.key, from: 'them', text: msg.text }))];
+      });
+    };
+
     const handleIncoming = (msg) => {
       console.log("Received message:", msg); // Add logging
-      // Convert IDs to strings for comparison
-      if (String(msg.from) === String(selectedUser?.id)) {
-        setMessages((prev) => [...prev, { from: 'them', text: msg.text }]);
-      }
+      appendFromPeer([msg]);
+    };
+
+    // Sent while we were offline or dropping; group batches carry a conversationId
+    const handleMissed = (batch) => {
+      if (!batch.conversationId) appendFromPeer(batch.messages);
+    };
+
+    // Live messages get their ids once stored
+    const handleIds = ({ ids }) => {
+      setMessages((prev) => prev.map((m) => (m.key && ids[m.key] ? { ...m, id: ids[m.key] } : m)));
+    };
+
+    const handleAck = (ack) => {
+      setMessages((prev) => prev.map((m) => (m.clientId && m.clientId === ack.clientId ? { ...m, id: ack.id } : m)));
     };
 
     sock.on('private_message', handleIncoming);
+    sock.on('missed_messages', handleMissed);
+    sock.on('message_ids', handleIds);
+    sock.on('message_ack', handleAck);
     sock.on('error', (error) => {
       console.error("Socket error:", error);
     });
@@ -195,14 +242,29 @@ const ChatWindow = ({ selectedUser }) => {
       }
   });
 
+    // The server coalesces trickled candidates into batches
+    sock.on('ice-candidates', async (data) => {
+      const { candidates, fromUserId } = data;
+
+      if (webRTCService && fromUserId) {
+          for (const candidate of candidates) {
+              await webRTCService.handleIceCandidate(candidate, fromUserId);
+          }
+      }
+  });
+
     return () => {
       sock.off('private_message', handleIncoming);
+      sock.off('missed_messages', handleMissed);
+      sock.off('message_ids', handleIds);
+      sock.off('message_ack', handleAck);
       sock.off('error');
       sock.off('screen-sharing-started');
       sock.off('screen-sharing-stopped');
       sock.off('screen-share-offer');
       sock.off('screen-share-answer');
       sock.off('ice-candidate');
+      sock.off('ice-candidates');
     };
   }, [selectedUser, storedUser]);
 
@@ -249,10 +311,18 @@ const ChatWindow = ({ selectedUser }) => {
         </div>
       )}
 
-      <div className="flex-1 overflow-y-auto space-y-2 mb-4">
+      <div className="flex-1 overflow-y-auto space-y-2 mb-4" onScroll={handleScroll}>
+        {olderCursor && (
+          <button
+            onClick={loadOlderMessages}
+            className="w-full text-sm text-blue-500 hover:underline"
+          >
+            Load older messages
+          </button>
+        )}
         {messages.map((msg, idx) => (
           <div
-            key={idx}
+            key={msg.id ?? msg.key ?? msg.clientId ?? idx}
             className={`p-2 rounded max-w-xs ${
               msg.from === 'me' ? 'bg-blue-200 self-end' : 'bg-gray-200 self-start'
             }`}
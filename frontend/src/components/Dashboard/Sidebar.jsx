@@ -3,16 +3,20 @@ import { getUsers, sendFriendRequest } from '../../services/api';
 import PendingRequests from '../PendingRequests';
 const Sidebar = ({ onUserSelect }) => {
     const [users, setUsers] = useState([]);
+    const [nextCursor, setNextCursor] = useState(null);
     const [message, setMessage] = useState("");
 
     const storedUser = JSON.parse(localStorage.getItem('user'));
 
 
+    // The directory comes in pages; "Load more" fetches the next one
+    const fetchUsers = async (cursor = null) => {
+        const page = await getUsers(cursor);
+        setUsers((prev) => (cursor ? [...prev, ...page.users] : page.users));
+        setNextCursor(page.nextCursor);
+    };
+
     useEffect(() => {
-        const fetchUsers = async () => {
-            const data = await getUsers();
-            setUsers(data);
-        };
         fetchUsers();
     }, []);
 
@@ -77,6 +81,15 @@ const Sidebar = ({ onUserSelect }) => {
                     </div>
                 );
             })}
+
+            {nextCursor && (
+                <button
+                    className="w-full text-sm text-blue-500 hover:underline py-2"
+                    onClick={() => fetchUsers(nextCursor)}
+                >
+                    Load more
+                </button>
+            )}
         </div>
     );
 };
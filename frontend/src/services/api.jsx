@@ -27,17 +27,23 @@ export const loginUser = async (formData) => {
     return { token, user };
 };
 
-// ✅ Get list of all users
-export const getUsers = async () => {
+// ✅ Get a page of users; pass the previous page's nextCursor for the next one
+export const getUsers = async (cursor = null) => {
     try {
-        const response = await API.get('/auth/users');
-        return response.data.users;
+        const response = await API.get('/auth/users', { params: cursor ? { cursor } : {} });
+        return { users: response.data.users, nextCursor: response.data.next_cursor };
     } catch (error) {
         console.error('Error fetching users:', error);
         throw error;
     }
 };
 
+// ✅ Get a page of chat history (oldest first); pass nextCursor as `before` for older messages
+export const getChatHistory = async (userId, before = null) => {
+    const response = await API.get(`/auth/messages/${userId}`, { params: before ? { before } : {} });
+    return { messages: response.data.messages, nextCursor: response.data.next_cursor };
+};
+
 // ✅ Send a friend request
 export const sendFriendRequest = async (from_user_id, to_user_id) => {
     const res = await API.post('/auth/friend-request', {
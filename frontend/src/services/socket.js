@@ -6,6 +6,14 @@ import { createWebRTCService } from './webrtc';
 let socket = null;
 let webRTCService = null;
 
+// Newest id of a message addressed to us, to resume from after a reconnect.
+// Live messages arrive with a `key`; message_ids later maps it to the id.
+let lastSeq = 0;
+const privateKeys = new Set();
+const advanceSeq = (id) => {
+  if (id > lastSeq) lastSeq = id;
+};
+
 export const initSocket = () => {
   const storedUser = JSON.parse(localStorage.getItem("user"));
   if (!storedUser?.token) {
@@ -45,6 +53,27 @@ export const initSocket = () => {
     console.log('User ID:', storedUser.id);
   });
 
+  socket.on('private_message', (msg) => {
+    if (msg.id) advanceSeq(msg.id);
+    else if (msg.key) privateKeys.add(msg.key);
+  });
+
+  socket.on('message_ids', ({ ids }) => {
+    for (const [key, id] of Object.entries(ids)) {
+      if (privateKeys.delete(key)) advanceSeq(id);
+    }
+  });
+
+  socket.on('missed_messages', (batch) => {
+    if (!batch.conversationId) advanceSeq(batch.seq);
+  });
+
+  // The server pushes undelivered messages on connect; resume also covers
+  // those that were sent to us while the connection was dropping
+  socket.io.on('reconnect', () => {
+    if (lastSeq) socket.emit('resume', { seq: lastSeq });
+  });
+
   socket.on('connect_error', (error) => {
     console.error('Socket connection error details:', error);
     // Try to reconnect if token expired